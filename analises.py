@@ -0,0 +1,350 @@
+import sys
+from datetime import date, timedelta
+from rich.table import Table
+from connect import conectar, tipo_identificador
+
+NOME_JOB = "circulacao"
+
+# Chave do advisory lock que impede duas atualizações simultâneas
+CHAVE_TRAVA_JOB = 27002
+
+# Dias antes da execução anterior recalculados a cada execução, para pegar
+# transações que confirmaram depois dela.
+JANELA_DIAS = 7
+
+
+def criar_estrutura(cur):
+    """
+    Cria a tabela de agregados diários de circulação.
+
+    Cada linha resume um dia de uma obra: empréstimos feitos, devoluções,
+    devoluções com atraso, soma dos dias que as obras devolvidas ficaram
+    emprestadas e empréstimos que passaram a estar atrasados. A categoria
+    da obra é copiada para que os relatórios não precisem de junções.
+
+    Args:
+        cur (cursor): Cursor de uma conexão aberta.
+    """
+    tipo = tipo_identificador(cur)
+    cur.execute(f"""
+        CREATE TABLE IF NOT EXISTS circulacao_diaria (
+            dia DATE NOT NULL,
+            obra {tipo} NOT NULL,
+            categoria TEXT,
+            emprestimos INTEGER NOT NULL DEFAULT 0,
+            devolucoes INTEGER NOT NULL DEFAULT 0,
+            devolucoes_atrasadas INTEGER NOT NULL DEFAULT 0,
+            dias_emprestado BIGINT NOT NULL DEFAULT 0,
+            atrasos INTEGER NOT NULL DEFAULT 0,
+            PRIMARY KEY (dia, obra)
+        );
+        CREATE INDEX IF NOT EXISTS idx_circulacao_categoria
+            ON circulacao_diaria (categoria, dia);
+
+        CREATE INDEX IF NOT EXISTS idx_emprestimos_atrasado_desde
+            ON emprestimos (atrasado_desde)
+            WHERE atrasado_desde IS NOT NULL;
+        CREATE INDEX IF NOT EXISTS idx_emprestimos_data_retirada
+            ON emprestimos (data_retirada);
+
+        ALTER TABLE controle_jobs DROP COLUMN IF EXISTS ultimo_id;
+        ALTER TABLE controle_jobs ADD COLUMN IF NOT EXISTS snapshot TEXT;
+    """)
+
+
+def atualizar_circulacao(hoje: date = None, janela_dias: int = JANELA_DIAS,
+                         completo: bool = False) -> int:
+    """
+    Atualiza os agregados diários até ontem.
+
+    Cada execução recalcula por inteiro os dias que podem ter mudado desde
+    a anterior, a partir de ``emprestimos_todos``:
+
+    - os dias desde a execução anterior e os ``janela_dias`` dias antes
+      dela, onde caem os empréstimos, devoluções e atrasos do dia a dia,
+      inclusive os de transações que só confirmaram depois da execução
+      anterior;
+    - os dias mais antigos citados (retirada, devolução ou atraso) por
+      linhas de ``emprestimos`` gravadas depois da execução anterior:
+      empréstimos e devoluções retroativos, reaplicados da fila offline ou
+      marcados como atrasados com data antiga. Essas linhas são as que têm
+      xmin invisível no snapshot que a execução anterior guardou em
+      ``controle_jobs``. Uma linha com xmin muito antigo pode ser tomada por
+      nova; no pior caso um dia é recalculado sem necessidade.
+
+    A transação é REPEATABLE READ, então o snapshot guardado é exatamente o
+    que foi usado nos cálculos. Só ``emprestimos`` é percorrida em busca de
+    linhas novas: a atualização deve rodar antes do arquivamento, que tira
+    de lá as devoluções antigas.
+
+    Args:
+        hoje (date): Data de referência (não incluída). Padrão: data atual.
+        janela_dias (int): Dias antes da execução anterior recalculados.
+        completo (bool): Reconstrói os agregados de todo o histórico, inclusive
+            dos empréstimos arquivados (feito também na primeira execução).
+
+    Returns:
+        int: Quantidade de dias recalculados.
+    """
+    hoje = hoje or date.today()
+    conn = conectar()
+    cur = conn.cursor()
+    try:
+        cur.execute("SET TRANSACTION ISOLATION LEVEL REPEATABLE READ;")
+        cur.execute("SELECT pg_try_advisory_xact_lock(%s);", (CHAVE_TRAVA_JOB,))
+        if not cur.fetchone()[0]:
+            print("Atualização da circulação já está em execução.")
+            conn.rollback()
+            return 0
+
+        cur.execute("SELECT marca_dagua, snapshot FROM controle_jobs WHERE nome = %s;", (NOME_JOB,))
+        linha = cur.fetchone()
+        if completo or linha is None or linha[1] is None:
+            # Na primeira execução os empréstimos já arquivados também entram
+            cur.execute("TRUNCATE circulacao_diaria;")
+            cur.execute("SELECT MIN(data_retirada) FROM emprestimos_todos;")
+            inicio, antigos = cur.fetchone()[0] or hoje, []
+        else:
+            marca_dagua, snapshot = linha
+            inicio = min(marca_dagua, hoje) - timedelta(days=janela_dias)
+            # O xid desta transação é a referência do age(xmin) abaixo
+            cur.execute("SELECT pg_current_xact_id()::text::bigint;")
+            atual = cur.fetchone()[0]
+            cur.execute("""
+                SELECT DISTINCT d.dia
+                FROM emprestimos e
+                CROSS JOIN LATERAL (VALUES (e.data_retirada), (e.data_devol), (e.atrasado_desde)) d (dia)
+                WHERE d.dia < %(inicio)s
+                  AND NOT pg_visible_in_snapshot((%(atual)s - age(e.xmin))::text::xid8,
+                                                 %(snapshot)s::pg_snapshot)
+                ORDER BY d.dia;
+            """, {"inicio": inicio, "atual": atual, "snapshot": snapshot})
+            antigos = [dia for dia, in cur.fetchall()]
+
+        parametros = {"inicio": inicio, "antigos": antigos, "hoje": hoje}
+        cur.execute("""
+            DELETE FROM circulacao_diaria
+            WHERE (dia >= %(inicio)s OR dia = ANY(%(antigos)s)) AND dia < %(hoje)s;
+        """, parametros)
+        cur.execute("""
+            WITH retirados AS (
+                SELECT data_retirada AS dia, obra, COUNT(*) AS emprestimos
+                FROM emprestimos_todos
+                WHERE (data_retirada >= %(inicio)s OR data_retirada = ANY(%(antigos)s))
+                  AND data_retirada < %(hoje)s
+                GROUP BY data_retirada, obra
+            ), devolvidos AS (
+                SELECT data_devol AS dia, obra,
+                       COUNT(*) AS devolucoes,
+                       COUNT(*) FILTER (WHERE data_devol > data_prev_devol) AS atrasadas,
+                       SUM(data_devol - data_retirada) AS dias
+                FROM emprestimos_todos
+                WHERE (data_devol >= %(inicio)s OR data_devol = ANY(%(antigos)s))
+                  AND data_devol < %(hoje)s
+                GROUP BY data_devol, obra
+            ), atrasados AS (
+                SELECT atrasado_desde AS dia, obra, COUNT(*) AS atrasos
+                FROM emprestimos_todos
+                WHERE (atrasado_desde >= %(inicio)s OR atrasado_desde = ANY(%(antigos)s))
+                  AND atrasado_desde < %(hoje)s
+                GROUP BY atrasado_desde, obra
+            ), celulas AS (
+                SELECT dia, obra FROM retirados
+                UNION SELECT dia, obra FROM devolvidos
+                UNION SELECT dia, obra FROM atrasados
+            )
+            INSERT INTO circulacao_diaria
+                (dia, obra, categoria, emprestimos, devolucoes, devolucoes_atrasadas,
+                 dias_emprestado, atrasos)
+            SELECT c.dia, c.obra, o.categoria, COALESCE(r.emprestimos, 0),
+                   COALESCE(d.devolucoes, 0), COALESCE(d.atrasadas, 0),
+                   COALESCE(d.dias, 0), COALESCE(a.atrasos, 0)
+            FROM celulas c
+            LEFT JOIN retirados r ON r.dia = c.dia AND r.obra = c.obra
+            LEFT JOIN devolvidos d ON d.dia = c.dia AND d.obra = c.obra
+            LEFT JOIN atrasados a ON a.dia = c.dia AND a.obra = c.obra
+            LEFT JOIN obras o ON o.identificador = c.obra;
+        """, parametros)
+
+        cur.execute("""
+            INSERT INTO controle_jobs (nome, marca_dagua, snapshot)
+            VALUES (%s, %s, pg_current_snapshot()::text)
+            ON CONFLICT (nome) DO UPDATE
+                SET marca_dagua = EXCLUDED.marca_dagua, snapshot = EXCLUDED.snapshot;
+        """, (NOME_JOB, hoje))
+
+        conn.commit()
+        return max(0, (hoje - inicio).days) + len(antigos)
+    except Exception:
+        conn.rollback()
+        raise
+    finally:
+        cur.close()
+        conn.close()
+
+
+def _consultar(sql, inicio, fim, **extras):
+    conn = conectar("leitura")
+    cur = conn.cursor()
+    try:
+        cur.execute(sql, {"inicio": inicio, "fim": fim, **extras})
+        return cur.fetchall()
+    finally:
+        cur.close()
+        conn.close()
+
+
+def mais_emprestados(inicio: date, fim: date, limite: int = 10):
+    """
+    Títulos mais emprestados no período.
+
+    Args:
+        inicio (date): Primeiro dia do período.
+        fim (date): Último dia do período.
+        limite (int): Quantidade de títulos.
+
+    Returns:
+        list[tuple]: Linhas (posição, título, empréstimos, % do total).
+    """
+    return _consultar("""
+        SELECT RANK() OVER (ORDER BY t.total DESC), o.titulo, t.total,
+               ROUND(100.0 * t.total / SUM(t.total) OVER (), 1)
+        FROM (
+            SELECT obra, SUM(emprestimos) AS total
+            FROM circulacao_diaria
+            WHERE dia BETWEEN %(inicio)s AND %(fim)s
+            GROUP BY obra
+            HAVING SUM(emprestimos) > 0
+        ) t
+        JOIN obras o ON o.identificador = t.obra
+        ORDER BY t.total DESC, o.titulo
+        LIMIT %(limite)s;
+    """, inicio, fim, limite=limite)
+
+
+def emprestimos_por_categoria(inicio: date, fim: date):
+    """
+    Empréstimos de cada categoria mês a mês, com a variação em relação ao
+    mês anterior e o acumulado no período.
+
+    Returns:
+        list[tuple]: Linhas (categoria, mês, empréstimos, variação, acumulado).
+    """
+    return _consultar("""
+        SELECT categoria, mes, total,
+               total - LAG(total) OVER (PARTITION BY categoria ORDER BY mes),
+               SUM(total) OVER (PARTITION BY categoria ORDER BY mes)
+        FROM (
+            SELECT COALESCE(categoria, '(sem categoria)') AS categoria,
+                   date_trunc('month', dia)::date AS mes,
+                   SUM(emprestimos) AS total
+            FROM circulacao_diaria
+            WHERE dia BETWEEN %(inicio)s AND %(fim)s
+            GROUP BY 1, 2
+        ) m
+        ORDER BY categoria, mes;
+    """, inicio, fim)
+
+
+def duracao_media(inicio: date, fim: date):
+    """
+    Duração média, em dias, dos empréstimos devolvidos no período, por
+    categoria e no geral.
+
+    Returns:
+        list[tuple]: Linhas (categoria, devoluções, média da categoria, média geral).
+    """
+    return _consultar("""
+        SELECT COALESCE(categoria, '(sem categoria)'), SUM(devolucoes),
+               ROUND(SUM(dias_emprestado)::numeric / NULLIF(SUM(devolucoes), 0), 1),
+               ROUND(SUM(SUM(dias_emprestado)) OVER ()::numeric
+                     / NULLIF(SUM(SUM(devolucoes)) OVER (), 0), 1)
+        FROM circulacao_diaria
+        WHERE dia BETWEEN %(inicio)s AND %(fim)s
+        GROUP BY 1
+        HAVING SUM(devolucoes) > 0
+        ORDER BY 3 DESC;
+    """, inicio, fim)
+
+
+def taxa_atraso(inicio: date, fim: date):
+    """
+    Percentual das devoluções feitas com atraso, mês a mês, com a média
+    móvel dos últimos três meses.
+
+    Returns:
+        list[tuple]: Linhas (mês, devoluções, atrasadas, taxa %, média móvel %).
+    """
+    return _consultar("""
+        SELECT mes, devolucoes, atrasadas, taxa,
+               ROUND(AVG(taxa) OVER (ORDER BY mes ROWS BETWEEN 2 PRECEDING AND CURRENT ROW), 1)
+        FROM (
+            SELECT date_trunc('month', dia)::date AS mes,
+                   SUM(devolucoes) AS devolucoes,
+                   SUM(devolucoes_atrasadas) AS atrasadas,
+                   ROUND(100.0 * SUM(devolucoes_atrasadas) / NULLIF(SUM(devolucoes), 0), 1) AS taxa
+            FROM circulacao_diaria
+            WHERE dia BETWEEN %(inicio)s AND %(fim)s
+            GROUP BY 1
+            HAVING SUM(devolucoes) > 0
+        ) m
+        ORDER BY mes;
+    """, inicio, fim)
+
+
+def relatorios_circulacao(inicio: date, fim: date):
+    """
+    Monta as tabelas de estatísticas de circulação do período.
+
+    Args:
+        inicio (date): Primeiro dia do período.
+        fim (date): Último dia do período.
+
+    Returns:
+        list[Table]: Tabelas de títulos mais emprestados, empréstimos por
+        categoria, duração média e taxa de atraso.
+    """
+    periodo = f"{inicio:%d/%m/%Y} a {fim:%d/%m/%Y}"
+
+    mais = Table(title=f"Títulos mais emprestados ({periodo})")
+    mais.add_column("#", justify="right", style="cyan")
+    mais.add_column("Título", style="magenta")
+    mais.add_column("Empréstimos", justify="right", style="yellow")
+    mais.add_column("% do total", justify="right")
+    for posicao, titulo, total, percentual in mais_emprestados(inicio, fim):
+        mais.add_row(str(posicao), titulo, str(total), f"{percentual}")
+
+    categorias = Table(title=f"Empréstimos por categoria ({periodo})")
+    categorias.add_column("Categoria", style="blue")
+    categorias.add_column("Mês", justify="center")
+    categorias.add_column("Empréstimos", justify="right", style="yellow")
+    categorias.add_column("Variação", justify="right")
+    categorias.add_column("Acumulado", justify="right", style="green")
+    for categoria, mes, total, variacao, acumulado in emprestimos_por_categoria(inicio, fim):
+        categorias.add_row(categoria, f"{mes:%m/%Y}", str(total),
+                           "" if variacao is None else f"{variacao:+d}", str(acumulado))
+
+    duracao = Table(title=f"Duração média dos empréstimos ({periodo})")
+    duracao.add_column("Categoria", style="blue")
+    duracao.add_column("Devoluções", justify="right")
+    duracao.add_column("Média (dias)", justify="right", style="yellow")
+    duracao.add_column("Média geral", justify="right", style="green")
+    for categoria, devolucoes, media, geral in duracao_media(inicio, fim):
+        duracao.add_row(categoria, str(devolucoes), str(media), str(geral))
+
+    atrasos = Table(title=f"Taxa de atraso nas devoluções ({periodo})")
+    atrasos.add_column("Mês", justify="center")
+    atrasos.add_column("Devoluções", justify="right")
+    atrasos.add_column("Atrasadas", justify="right", style="red")
+    atrasos.add_column("Taxa (%)", justify="right", style="yellow")
+    atrasos.add_column("Média 3 meses (%)", justify="right", style="green")
+    for mes, devolucoes, atrasadas, taxa, media in taxa_atraso(inicio, fim):
+        atrasos.add_row(f"{mes:%m/%Y}", str(devolucoes), str(atrasadas), str(taxa), str(media))
+
+    return [mais, categorias, duracao, atrasos]
+
+
+if __name__ == "__main__":
+    completo = "--completo" in sys.argv
+    dias = atualizar_circulacao(completo=completo)
+    print(f"Circulação atualizada: {dias} dia(s) recalculado(s).")
@@ -0,0 +1,569 @@
+import contextlib
+import io
+import os
+import re
+import sqlite3
+import sys
+import tempfile
+import time
+from datetime import date, datetime, timedelta
+from decimal import Decimal
+from uuid import UUID, uuid4
+import psycopg2
+from psycopg2.extras import execute_batch, execute_values
+from rastreamento import span, resumir_sql
+from cache import DOMINIOS, FATIAS
+
+# Erros de banco que podem surgir em qualquer backend
+ErroBanco = (psycopg2.Error, sqlite3.Error)
+# Falhas ao abrir a conexão: servidor fora do ar ou arquivo inacessível
+ErroConexao = (psycopg2.OperationalError, sqlite3.OperationalError)
+
+# O SQLite não tem tipo uuid: os identificadores são gravados como texto
+sqlite3.register_adapter(UUID, str)
+# Nem decimal: valores em reais vão como texto e a afinidade NUMERIC os converte
+sqlite3.register_adapter(Decimal, str)
+
+
+class BackendPostgres:
+    """Armazenamento padrão, em um servidor PostgreSQL (ver connect.py)."""
+
+    nome = "postgres"
+
+    def conectar(self, modo="escrita"):
+        """
+        Abre uma conexão com o PostgreSQL.
+
+        Args:
+            modo (str): "escrita" ou "leitura" (ver connect.conectar).
+
+        Returns:
+            connection: Conexão psycopg2.
+        """
+        from connect import conectar
+        return conectar(modo)
+
+    def inserir_lote(self, cur, sql, linhas):
+        """
+        Insere várias linhas com um único comando.
+
+        Args:
+            cur (cursor): Cursor da transação em andamento.
+            sql (str): INSERT com ``VALUES %s`` no lugar das linhas.
+            linhas (list[tuple]): Valores de cada linha.
+        """
+        execute_values(cur, sql, linhas)
+
+    def executar_lote(self, cur, sql, linhas):
+        """
+        Executa o mesmo comando para várias linhas, agrupando-os em poucas
+        idas ao servidor.
+
+        Args:
+            cur (cursor): Cursor da transação em andamento.
+            sql (str): Comando com os parâmetros de uma linha.
+            linhas (list[tuple]): Parâmetros de cada execução.
+        """
+        execute_batch(cur, sql, linhas)
+
+    def criar_estrutura(self):
+        """Cria as tabelas auxiliares no PostgreSQL (ver esquema.py)."""
+        from esquema import preparar_banco
+        preparar_banco()
+
+
+# Construções do PostgreSQL sem equivalente no SQLite. O SQLite não tem
+# travas por linha: no lugar do FOR UPDATE, o cursor abre a transação com
+# BEGIN IMMEDIATE, que reserva a escrita do banco até o commit
+_TRAVAS_PG = re.compile(r"\s+FOR UPDATE(\s+OF\s+\w+)?(\s+SKIP LOCKED)?", re.IGNORECASE)
+_CONVERSOES_PG = re.compile(r"::\w+")
+_PARAMETRO = re.compile(r"=\s*ANY\(%s\)|%\((\w+)\)s|%s|%%")
+
+
+def traduzir_sql(sql, parametros=()):
+    """
+    Converte um comando escrito para o psycopg2 no dialeto do sqlite3.
+
+    - ``%s`` vira ``?`` e ``%(nome)s`` vira ``:nome``
+    - ``= ANY(%s)`` com uma lista vira ``IN (?, ?, ...)``
+    - ``%%`` vira ``%``, exceto em comandos sem parâmetros (como no psycopg2)
+    - ``FOR UPDATE [OF x] [SKIP LOCKED]`` e conversões ``::tipo`` são removidos
+
+    Args:
+        sql (str): Comando no formato do psycopg2.
+        parametros (tuple | dict): Parâmetros do comando.
+
+    Returns:
+        tuple[str, tuple | dict]: Comando e parâmetros para o sqlite3.
+    """
+    sql = _CONVERSOES_PG.sub("", _TRAVAS_PG.sub("", sql))
+    if parametros is None:
+        return sql, ()
+    if isinstance(parametros, dict):
+        def nomear(m):
+            if m.group(0) == "%%":
+                return "%"
+            return f":{m.group(1)}" if m.group(1) else m.group(0)
+        return _PARAMETRO.sub(nomear, sql), parametros
+
+    valores = iter(parametros or ())
+    traduzidos = []
+
+    def substituir(m):
+        if m.group(0) == "%%":
+            return "%"
+        valor = next(valores)
+        if m.group(0) == "%s":
+            traduzidos.append(valor)
+            return "?"
+        valor = list(valor)
+        traduzidos.extend(valor)
+        return f"IN ({', '.join('?' * len(valor))})" if valor else "IN (NULL)"
+
+    return _PARAMETRO.sub(substituir, sql), tuple(traduzidos)
+
+
+class _CursorSQLite:
+    """Cursor do sqlite3 que aceita os comandos no formato do psycopg2."""
+
+    def __init__(self, cur):
+        self._cur = cur
+
+    def execute(self, sql, parametros=None):
+        with span("db.execute", sql=resumir_sql(sql)):
+            # Leitura que no PostgreSQL travaria as linhas (ou SAVEPOINT, que
+            # sempre antecede escritas): reserva a escrita antes de ler, para
+            # que nenhum outro balcão altere os dados lidos até o commit (sem
+            # isso, duas baixas de estoque simultâneas poderiam deixar a
+            # quantidade negativa)
+            trava = _TRAVAS_PG.search(sql) or sql.lstrip().upper().startswith("SAVEPOINT")
+            if trava and not self._cur.connection.in_transaction:
+                self._cur.execute("BEGIN IMMEDIATE;")
+            sql, parametros = traduzir_sql(sql, parametros)
+            self._cur.execute(sql, parametros)
+        return self
+
+    def executemany(self, sql, linhas):
+        linhas = list(linhas)
+        if not linhas:
+            return self
+        with span("db.executemany", sql=resumir_sql(sql), linhas=len(linhas)):
+            sql_traduzido, _ = traduzir_sql(sql, linhas[0])
+            self._cur.executemany(sql_traduzido, [traduzir_sql(sql, linha)[1] for linha in linhas])
+        return self
+
+    def __iter__(self):
+        return iter(self._cur)
+
+    def __getattr__(self, nome):
+        return getattr(self._cur, nome)
+
+
+class _ConexaoSQLite:
+    """Conexão do sqlite3 com a mesma interface usada das conexões psycopg2."""
+
+    def __init__(self, conn):
+        self._conn = conn
+
+    def cursor(self, name=None):
+        return _CursorSQLite(self._conn.cursor())
+
+    def __getattr__(self, nome):
+        return getattr(self._conn, nome)
+
+
+ESQUEMA_SQLITE = """
+    CREATE TABLE IF NOT EXISTS obras (
+        identificador TEXT PRIMARY KEY,
+        titulo TEXT NOT NULL,
+        autor TEXT,
+        ano INTEGER,
+        categoria TEXT,
+        quantidade INTEGER NOT NULL,
+        quantidade_disponivel INTEGER NOT NULL
+    );
+    CREATE INDEX IF NOT EXISTS idx_obras_titulo ON obras (lower(titulo));
+
+    CREATE TABLE IF NOT EXISTS usuarios (
+        identificador TEXT PRIMARY KEY,
+        nome TEXT NOT NULL,
+        email TEXT,
+        cartao INTEGER
+    );
+
+    CREATE TABLE IF NOT EXISTS emprestimos (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        identificador TEXT NOT NULL UNIQUE,
+        obra TEXT NOT NULL,
+        usuario TEXT NOT NULL,
+        data_retirada DATE NOT NULL,
+        data_prev_devol DATE NOT NULL,
+        data_devol DATE,
+        atrasado_desde DATE
+    );
+    CREATE INDEX IF NOT EXISTS idx_emprestimos_abertos_usuario
+        ON emprestimos (usuario) WHERE data_devol IS NULL;
+    CREATE INDEX IF NOT EXISTS idx_emprestimos_obra ON emprestimos (obra);
+    CREATE INDEX IF NOT EXISTS idx_emprestimos_abertos_prev_devol
+        ON emprestimos (data_prev_devol) WHERE data_devol IS NULL;
+    CREATE INDEX IF NOT EXISTS idx_emprestimos_a_marcar
+        ON emprestimos (data_prev_devol) WHERE data_devol IS NULL AND atrasado_desde IS NULL;
+
+    CREATE TABLE IF NOT EXISTS emprestimos_arquivo (
+        id INTEGER PRIMARY KEY,
+        identificador TEXT NOT NULL,
+        obra TEXT NOT NULL,
+        usuario TEXT NOT NULL,
+        data_retirada DATE NOT NULL,
+        data_prev_devol DATE NOT NULL,
+        data_devol DATE,
+        atrasado_desde DATE
+    );
+    CREATE INDEX IF NOT EXISTS idx_arquivo_usuario ON emprestimos_arquivo (usuario);
+    CREATE INDEX IF NOT EXISTS idx_arquivo_obra ON emprestimos_arquivo (obra);
+
+    CREATE VIEW IF NOT EXISTS emprestimos_todos AS
+        SELECT id, identificador, obra, usuario, data_retirada,
+               data_prev_devol, data_devol, atrasado_desde
+        FROM emprestimos
+        UNION ALL
+        SELECT id, identificador, obra, usuario, data_retirada,
+               data_prev_devol, data_devol, atrasado_desde
+        FROM emprestimos_arquivo;
+
+    CREATE TABLE IF NOT EXISTS atrasos (
+        emprestimo TEXT PRIMARY KEY,
+        obra TEXT NOT NULL,
+        usuario TEXT NOT NULL,
+        data_prev_devol DATE NOT NULL,
+        atrasado_desde DATE NOT NULL,
+        dias_cobrados INTEGER NOT NULL DEFAULT 0
+    );
+    CREATE INDEX IF NOT EXISTS idx_atrasos_usuario ON atrasos (usuario);
+
+    CREATE TABLE IF NOT EXISTS lembretes_outbox (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        usuario TEXT NOT NULL,
+        emprestimo TEXT NOT NULL,
+        tipo TEXT NOT NULL DEFAULT 'atraso',
+        criado_em TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP,
+        enviado_em TIMESTAMP
+    );
+
+    CREATE TABLE IF NOT EXISTS saldos_usuarios (
+        usuario TEXT PRIMARY KEY,
+        saldo NUMERIC NOT NULL DEFAULT 0,
+        atualizado_em TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP
+    );
+
+    CREATE TABLE IF NOT EXISTS movimentos_saldo (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        usuario TEXT NOT NULL,
+        tipo TEXT NOT NULL,
+        valor NUMERIC NOT NULL,
+        criado_em TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP
+    );
+    CREATE INDEX IF NOT EXISTS idx_movimentos_saldo_usuario ON movimentos_saldo (usuario);
+
+    CREATE TABLE IF NOT EXISTS reservas (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        obra TEXT NOT NULL,
+        usuario TEXT NOT NULL,
+        status TEXT NOT NULL DEFAULT 'aguardando',
+        criada_em TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP,
+        alocada_em TIMESTAMP,
+        expira_em TIMESTAMP
+    );
+    CREATE INDEX IF NOT EXISTS idx_reservas_fila
+        ON reservas (obra, criada_em, id) WHERE status = 'aguardando';
+    CREATE INDEX IF NOT EXISTS idx_reservas_alocadas
+        ON reservas (expira_em) WHERE status = 'alocada';
+    CREATE UNIQUE INDEX IF NOT EXISTS idx_reservas_usuario_obra
+        ON reservas (usuario, obra) WHERE status IN ('aguardando', 'alocada');
+
+    CREATE TABLE IF NOT EXISTS versoes_dados (
+        dominio TEXT NOT NULL,
+        fatia INTEGER NOT NULL DEFAULT 0,
+        versao INTEGER NOT NULL DEFAULT 0,
+        PRIMARY KEY (dominio, fatia)
+    );
+
+    CREATE TABLE IF NOT EXISTS operacoes_aplicadas (
+        id TEXT PRIMARY KEY,
+        tipo TEXT NOT NULL,
+        aplicada_em TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP
+    );
+"""
+
+# Índices de usuarios.cartao, criados depois de a coluna existir. Sem
+# sequências no SQLite, o cartão de um novo usuário é o maior já emitido
+# mais um (uma leitura do índice único).
+ESQUEMA_SQLITE_CARTAO = """
+    CREATE UNIQUE INDEX IF NOT EXISTS idx_usuarios_cartao ON usuarios (cartao);
+    CREATE INDEX IF NOT EXISTS idx_usuarios_nome_normalizado ON usuarios (lower(trim(nome)));
+    DROP INDEX IF EXISTS idx_usuarios_nome;
+    CREATE TRIGGER IF NOT EXISTS trg_usuarios_cartao
+    AFTER INSERT ON usuarios WHEN NEW.cartao IS NULL
+    BEGIN
+        UPDATE usuarios SET cartao = (SELECT COALESCE(MAX(cartao), 0) + 1 FROM usuarios)
+        WHERE rowid = NEW.rowid;
+    END;
+"""
+
+
+class BackendSQLite:
+    """
+    Armazenamento embutido em um arquivo SQLite, para balcões isolados e
+    testes que não querem depender de um servidor PostgreSQL.
+
+    O banco roda em modo WAL (leitores não bloqueiam o escritor) com
+    ``synchronous=NORMAL``. As escritas em lote usam ``executemany`` dentro
+    de uma única transação.
+    """
+
+    nome = "sqlite"
+
+    def __init__(self, caminho):
+        """
+        Args:
+            caminho (str): Arquivo do banco SQLite.
+        """
+        self.caminho = caminho
+
+    def conectar(self, modo="escrita"):
+        """
+        Abre uma conexão com o arquivo SQLite. O modo é ignorado: leitura e
+        escrita usam o mesmo arquivo.
+
+        Returns:
+            _ConexaoSQLite: Conexão compatível com o uso feito pelo Acervo.
+        """
+        with span("db.conectar", modo=modo):
+            conn = sqlite3.connect(
+                self.caminho,
+                timeout=30,
+                detect_types=sqlite3.PARSE_DECLTYPES,
+            )
+        conn.execute("PRAGMA journal_mode = WAL;")
+        conn.execute("PRAGMA synchronous = NORMAL;")
+        # LOWER do SQLite só trata ASCII; títulos e nomes têm acentos
+        conn.create_function("lower", 1, lambda s: s.lower() if s is not None else None,
+                             deterministic=True)
+        conn.create_function("now", 0, lambda: datetime.now().isoformat(" "))
+        return _ConexaoSQLite(conn)
+
+    def inserir_lote(self, cur, sql, linhas):
+        """Insere várias linhas com executemany (ver BackendPostgres.inserir_lote)."""
+        if not linhas:
+            return
+        marcadores = "(" + ", ".join(["%s"] * len(linhas[0])) + ")"
+        cur.executemany(sql.replace("VALUES %s", f"VALUES {marcadores}"), linhas)
+
+    def executar_lote(self, cur, sql, linhas):
+        """Executa o comando para cada linha com executemany."""
+        cur.executemany(sql, linhas)
+
+    def criar_estrutura(self):
+        """Cria as tabelas e índices usados pelo Acervo no arquivo SQLite."""
+        conn = self.conectar()
+        try:
+            conn.executescript(ESQUEMA_SQLITE)
+            # Colunas acrescentadas depois da criação das tabelas
+            try:
+                conn.execute("ALTER TABLE atrasos ADD COLUMN dias_cobrados INTEGER NOT NULL DEFAULT 0;")
+            except sqlite3.OperationalError:
+                pass
+            try:
+                conn.execute("ALTER TABLE usuarios ADD COLUMN cartao INTEGER;")
+                conn.execute("UPDATE usuarios SET cartao = rowid;")
+            except sqlite3.OperationalError:
+                pass
+            conn.executescript(ESQUEMA_SQLITE_CARTAO)
+            colunas = [linha[1] for linha in conn.execute("PRAGMA table_info(versoes_dados);").fetchall()]
+            if "fatia" not in colunas:
+                # Versões de um contador por domínio passam para a fatia 0
+                conn.executescript("""
+                    ALTER TABLE versoes_dados RENAME TO versoes_dados_antigas;
+                    CREATE TABLE versoes_dados (
+                        dominio TEXT NOT NULL,
+                        fatia INTEGER NOT NULL DEFAULT 0,
+                        versao INTEGER NOT NULL DEFAULT 0,
+                        PRIMARY KEY (dominio, fatia)
+                    );
+                    INSERT INTO versoes_dados (dominio, fatia, versao)
+                        SELECT dominio, 0, versao FROM versoes_dados_antigas;
+                    DROP TABLE versoes_dados_antigas;
+                """)
+            conn.executemany("INSERT OR IGNORE INTO versoes_dados (dominio, fatia) VALUES (?, ?);",
+                             [(dominio, fatia) for dominio in DOMINIOS for fatia in range(FATIAS)])
+            conn.commit()
+        finally:
+            conn.close()
+
+
+def backend_configurado():
+    """
+    Cria o backend escolhido pela variável ACERVO_BACKEND ("postgres",
+    padrão, ou "sqlite"; o arquivo do SQLite vem de ACERVO_SQLITE_PATH).
+
+    Returns:
+        BackendPostgres | BackendSQLite: Backend de armazenamento.
+    """
+    if os.getenv("ACERVO_BACKEND", "postgres").lower() == "sqlite":
+        return BackendSQLite(os.getenv("ACERVO_SQLITE_PATH", "acervo.db"))
+    return BackendPostgres()
+
+
+backend_padrao = backend_configurado()
+
+
+def conectar(modo="escrita"):
+    """
+    Abre uma conexão com o backend configurado.
+
+    Args:
+        modo (str): "escrita" (padrão) ou "leitura".
+
+    Returns:
+        connection: Conexão do backend configurado.
+    """
+    return backend_padrao.conectar(modo)
+
+
+def lista_valores(quantidade):
+    """
+    Monta uma tabela de uma coluna (``column1``) com ``quantidade``
+    parâmetros, aceita pelo PostgreSQL e pelo SQLite, para juntar os textos
+    digitados às tabelas com o lower() do próprio banco nos dois lados: o
+    lower() do Python e o de um PostgreSQL com outra collation discordam em
+    letras acentuadas, e a comparação no banco continua usando os índices
+    ``lower(titulo)`` e ``lower(trim(nome))``.
+
+    Args:
+        quantidade (int): Quantidade de parâmetros (pelo menos um).
+
+    Returns:
+        str: Trecho ``(VALUES (%s), (%s), ...)`` para a cláusula FROM.
+    """
+    return f"(VALUES {', '.join(['(%s)'] * quantidade)})"
+
+
+def medir(backend, obras: int = 200, usuarios: int = 200, operacoes: int = 500) -> dict:
+    """
+    Mede o caminho de circulação do balcão em um backend: busca de usuário,
+    empréstimo, carrinho de 5 títulos, devolução em lote de todos os
+    empréstimos de um usuário e relatório de inventário.
+
+    Os dados da medição são criados com um prefixo próprio e removidos ao
+    final; ainda assim, no PostgreSQL, aponte DB_DSN_ESCRITA para um banco
+    de testes.
+
+    Args:
+        backend (BackendPostgres | BackendSQLite): Backend medido, já com a
+            estrutura criada.
+        obras (int): Obras criadas para a medição.
+        usuarios (int): Usuários criados para a medição.
+        operacoes (int): Repetições de cada operação.
+
+    Returns:
+        dict: Microssegundos por operação, pelo nome da operação.
+    """
+    from core import Acervo, SQL_INVENTARIO
+    from models import Obra, Usuario, Emprestimo
+    from usuarios import resolver_usuario
+
+    prefixo = f"medicao-{uuid4().hex[:8]}"
+    lista_obras = [(uuid4(), f"{prefixo} obra {n}") for n in range(obras)]
+    lista_usuarios = [(uuid4(), f"{prefixo} usuário {n}") for n in range(usuarios)]
+    ids_usuarios = [ident for ident, _ in lista_usuarios]
+    hoje = date.today()
+    acervo = Acervo(backend)
+
+    conn = backend.conectar()
+    cur = conn.cursor()
+    backend.inserir_lote(cur, "INSERT INTO usuarios (identificador, nome) VALUES %s;", lista_usuarios)
+    backend.inserir_lote(cur, """
+        INSERT INTO obras (identificador, titulo, quantidade, quantidade_disponivel) VALUES %s;
+    """, [(ident, titulo, operacoes * 6, operacoes * 6) for ident, titulo in lista_obras])
+    conn.commit()
+
+    def usuario(n):
+        ident, nome = lista_usuarios[n % usuarios]
+        modelo = Usuario(nome, None)
+        modelo.ident = ident
+        return modelo
+
+    def obra(n):
+        ident, titulo = lista_obras[n % obras]
+        modelo = Obra(titulo, None, None, None, 0, 0)
+        modelo.ident = ident
+        return modelo
+
+    def resolver(n):
+        resolver_usuario(cur, lista_usuarios[n % usuarios][1])
+
+    def emprestar(n):
+        acervo.emprestar(Emprestimo(obra(n), usuario(n), hoje, hoje + timedelta(days=7)))
+
+    def carrinho(n):
+        titulos = [lista_obras[(n + k) % obras][1] for k in range(5)]
+        acervo.emprestar_carrinho(usuario(n), titulos, 7)
+
+    def devolver(n):
+        conexao = backend.conectar()
+        cursor = conexao.cursor()
+        cursor.execute("SELECT identificador FROM emprestimos WHERE usuario = %s AND data_devol IS NULL;",
+                       (lista_usuarios[n % usuarios][0],))
+        acervo._registrar_devolucoes(cursor, [linha[0] for linha in cursor.fetchall()], hoje)
+        conexao.commit()
+        cursor.close()
+        conexao.close()
+
+    def inventario(n):
+        cur.execute(SQL_INVENTARIO)
+        cur.fetchall()
+
+    medicoes = {"busca de usuário": resolver, "empréstimo": emprestar,
+                "carrinho (5 títulos)": carrinho, "devolução em lote": devolver,
+                "inventário": inventario}
+    resultados = {}
+    try:
+        # Empréstimo e devolução imprimem mensagens para o balcão
+        with contextlib.redirect_stdout(io.StringIO()):
+            for nome, operacao in medicoes.items():
+                repeticoes = min(operacoes, usuarios) if operacao is devolver else operacoes
+                inicio = time.perf_counter()
+                for n in range(repeticoes):
+                    operacao(n)
+                resultados[nome] = (time.perf_counter() - inicio) / repeticoes * 1e6
+    finally:
+        conn.rollback()
+        for sql in ("DELETE FROM atrasos WHERE usuario = ANY(%s);",
+                    "DELETE FROM emprestimos WHERE usuario = ANY(%s);",
+                    "DELETE FROM saldos_usuarios WHERE usuario = ANY(%s);",
+                    "DELETE FROM movimentos_saldo WHERE usuario = ANY(%s);",
+                    "DELETE FROM usuarios WHERE identificador = ANY(%s);"):
+            cur.execute(sql, (ids_usuarios,))
+        cur.execute("DELETE FROM obras WHERE identificador = ANY(%s);",
+                    ([ident for ident, _ in lista_obras],))
+        conn.commit()
+        cur.close()
+        conn.close()
+    return resultados
+
+
+if __name__ == "__main__":
+    if len(sys.argv) > 1 and sys.argv[1] == "medir":
+        escolhidos = sys.argv[2:] or ["sqlite", "postgres"]
+        with tempfile.TemporaryDirectory() as pasta:
+            for nome in escolhidos:
+                if nome == "sqlite":
+                    backend = BackendSQLite(os.path.join(pasta, "medicao.db"))
+                else:
+                    backend = BackendPostgres()
+                backend.criar_estrutura()
+                for operacao, tempo in medir(backend).items():
+                    print(f"{nome:<10} {operacao:<22} {tempo:>10.1f} µs/op")
+    else:
+        print("Uso: python armazenamento.py medir [sqlite] [postgres]")
+        sys.exit(1)
@@ -0,0 +1,280 @@
+import sys
+import time
+from datetime import date, timedelta
+from uuid import uuid4
+from connect import conectar, tipo_identificador
+
+# Colunas copiadas de emprestimos para o arquivo, na mesma ordem nas duas tabelas
+COLUNAS_EMPRESTIMO = (
+    "id, identificador, obra, usuario, data_retirada, "
+    "data_prev_devol, data_devol, atrasado_desde"
+)
+
+
+def criar_estrutura(cur):
+    """
+    Cria o arquivo de empréstimos devolvidos, particionado por ano da
+    devolução, e a visão ``emprestimos_todos`` que une os empréstimos
+    ativos (tabela ``emprestimos``) com os arquivados.
+
+    Colunas acrescentadas a ``emprestimos`` depois da criação do arquivo
+    (``CREATE TABLE ... (LIKE emprestimos)`` só copia as colunas existentes
+    naquele momento) são acrescentadas também ao arquivo, com o mesmo tipo.
+
+    Também cria os índices parciais que mantêm as consultas de empréstimos
+    em aberto independentes do tamanho do histórico.
+
+    Args:
+        cur (cursor): Cursor de uma conexão aberta.
+    """
+    cur.execute("""
+        CREATE TABLE IF NOT EXISTS emprestimos_arquivo (LIKE emprestimos)
+            PARTITION BY RANGE (data_devol);
+    """)
+    cur.execute("""
+        SELECT a.attname, format_type(a.atttypid, a.atttypmod)
+        FROM pg_attribute a
+        WHERE a.attrelid = 'emprestimos'::regclass
+          AND a.attnum > 0 AND NOT a.attisdropped
+          AND NOT EXISTS (
+              SELECT 1 FROM pg_attribute b
+              WHERE b.attrelid = 'emprestimos_arquivo'::regclass
+                AND b.attname = a.attname AND NOT b.attisdropped
+          )
+        ORDER BY a.attnum;
+    """)
+    for coluna, tipo in cur.fetchall():
+        cur.execute(f"ALTER TABLE emprestimos_arquivo ADD COLUMN {coluna} {tipo};")
+
+    cur.execute(f"""
+        CREATE INDEX IF NOT EXISTS idx_arquivo_usuario ON emprestimos_arquivo (usuario);
+        CREATE INDEX IF NOT EXISTS idx_arquivo_obra ON emprestimos_arquivo (obra);
+        -- Recontagem de dias antigos da circulação (ver analises.py)
+        CREATE INDEX IF NOT EXISTS idx_arquivo_data_retirada ON emprestimos_arquivo (data_retirada);
+        CREATE INDEX IF NOT EXISTS idx_arquivo_atrasado_desde
+            ON emprestimos_arquivo (atrasado_desde)
+            WHERE atrasado_desde IS NOT NULL;
+
+        CREATE INDEX IF NOT EXISTS idx_emprestimos_abertos_usuario
+            ON emprestimos (usuario)
+            WHERE data_devol IS NULL;
+        CREATE INDEX IF NOT EXISTS idx_emprestimos_devolvidos
+            ON emprestimos (data_devol)
+            WHERE data_devol IS NOT NULL;
+
+        CREATE OR REPLACE VIEW emprestimos_todos AS
+            SELECT {COLUNAS_EMPRESTIMO} FROM emprestimos
+            UNION ALL
+            SELECT {COLUNAS_EMPRESTIMO} FROM emprestimos_arquivo;
+    """)
+
+
+def _garantir_particao(cur, ano):
+    """
+    Cria a partição anual do arquivo, se ainda não existir.
+
+    Args:
+        cur (cursor): Cursor de uma conexão aberta.
+        ano (int): Ano das devoluções guardadas na partição.
+    """
+    ano = int(ano)
+    cur.execute(f"""
+        CREATE TABLE IF NOT EXISTS emprestimos_arquivo_{ano}
+            PARTITION OF emprestimos_arquivo
+            FOR VALUES FROM ('{ano}-01-01') TO ('{ano + 1}-01-01');
+    """)
+
+
+def arquivar_devolvidos(dias_retencao: int = 30, tamanho_lote: int = 5000,
+                        pausa: float = 0.05, usuarios=None) -> int:
+    """
+    Move os empréstimos devolvidos há mais de ``dias_retencao`` dias da
+    tabela ``emprestimos`` para ``emprestimos_arquivo``.
+
+    A movimentação é feita em lotes, cada um em sua própria transação
+    curta (DELETE ... RETURNING seguido de INSERT no mesmo comando). As
+    linhas travadas por outras transações são puladas e ficam para o
+    próximo lote, de forma que empréstimos e devoluções em andamento não
+    esperam pelo arquivamento.
+
+    Args:
+        dias_retencao (int): Dias que um empréstimo devolvido fica na tabela ativa.
+        tamanho_lote (int): Máximo de linhas movidas por transação.
+        pausa (float): Segundos de espera entre os lotes.
+        usuarios (list | None): Se informado, só arquiva os empréstimos
+            desses usuários (usado por ``medir``).
+
+    Returns:
+        int: Total de empréstimos arquivados.
+    """
+    limite = date.today() - timedelta(days=dias_retencao)
+    filtro, filtrados = ("AND usuario = ANY(%s)", (list(usuarios),)) if usuarios else ("", ())
+    conn = conectar()
+    cur = conn.cursor()
+    total = 0
+    try:
+        cur.execute(f"""
+            SELECT EXTRACT(YEAR FROM MIN(data_devol)), EXTRACT(YEAR FROM MAX(data_devol))
+            FROM emprestimos
+            WHERE data_devol IS NOT NULL AND data_devol < %s {filtro};
+        """, (limite, *filtrados))
+        primeiro_ano, ultimo_ano = cur.fetchone()
+        if primeiro_ano is None:
+            return 0
+        for ano in range(int(primeiro_ano), int(ultimo_ano) + 1):
+            _garantir_particao(cur, ano)
+        conn.commit()
+
+        while True:
+            cur.execute("SET LOCAL lock_timeout = '2s';")
+            cur.execute(f"""
+                WITH lote AS (
+                    SELECT id FROM emprestimos
+                    WHERE data_devol IS NOT NULL AND data_devol < %s {filtro}
+                    ORDER BY data_devol
+                    LIMIT %s
+                    FOR UPDATE SKIP LOCKED
+                ), movidos AS (
+                    DELETE FROM emprestimos e
+                    USING lote
+                    WHERE e.id = lote.id
+                    RETURNING e.*
+                )
+                INSERT INTO emprestimos_arquivo ({COLUNAS_EMPRESTIMO})
+                SELECT {COLUNAS_EMPRESTIMO} FROM movidos;
+            """, (limite, *filtrados, tamanho_lote))
+            movidos = cur.rowcount
+            conn.commit()
+
+            total += movidos
+            if movidos < tamanho_lote:
+                break
+            time.sleep(pausa)
+
+        return total
+    except Exception:
+        conn.rollback()
+        raise
+    finally:
+        cur.close()
+        conn.close()
+
+
+# Consultas do dia a dia medidas por ``medir``: as que devem ficar rápidas
+# independentemente do histórico e a de histórico, que passa pela visão
+CONSULTAS_MEDIDAS = {
+    "Empréstimos em aberto do usuário": """
+        SELECT COUNT(*) FROM emprestimos
+        WHERE usuario = %(usuario)s AND data_devol IS NULL;
+    """,
+    "Empréstimos vencidos em aberto": """
+        SELECT COUNT(*) FROM emprestimos
+        WHERE data_devol IS NULL AND data_prev_devol < CURRENT_DATE;
+    """,
+    "Histórico do usuário": """
+        SELECT COUNT(*) FROM emprestimos_todos
+        WHERE usuario = %(usuario)s;
+    """,
+}
+
+
+def _melhor_tempo(cur, sql, parametros, repeticoes):
+    melhor = None
+    for _ in range(repeticoes):
+        inicio = time.perf_counter()
+        cur.execute(sql, parametros)
+        cur.fetchone()
+        decorrido = time.perf_counter() - inicio
+        melhor = decorrido if melhor is None else min(melhor, decorrido)
+    return melhor
+
+
+def medir(historico: int = 200_000, repeticoes: int = 20) -> dict:
+    """
+    Mede o tempo das consultas de ``CONSULTAS_MEDIDAS`` em três momentos:
+    antes de gerar histórico, depois de gravar ``historico`` empréstimos
+    devolvidos na tabela ativa e depois de arquivá-los. As consultas de
+    empréstimos em aberto devem levar praticamente o mesmo tempo nos três.
+
+    Os dados da medição (uma obra, um usuário com três empréstimos em
+    aberto e o histórico) são criados com um prefixo próprio e removidos ao
+    final; ainda assim, aponte DB_DSN_ESCRITA para um banco de testes.
+
+    Args:
+        historico (int): Empréstimos devolvidos gerados para o usuário.
+        repeticoes (int): Execuções de cada consulta; vale o melhor tempo.
+
+    Returns:
+        dict[str, tuple[float, float, float]]: Para cada consulta, o tempo
+        em segundos antes do histórico, com ele na tabela ativa e depois de
+        arquivado.
+    """
+    prefixo = f"arquivamento-{uuid4().hex[:8]}"
+    id_obra, id_usuario = uuid4(), uuid4()
+    hoje = date.today()
+    parametros = {"usuario": id_usuario}
+
+    conn = conectar()
+    cur = conn.cursor()
+    tempos = {nome: [] for nome in CONSULTAS_MEDIDAS}
+
+    def cronometrar():
+        cur.execute("ANALYZE emprestimos; ANALYZE emprestimos_arquivo;")
+        conn.commit()
+        for nome, sql in CONSULTAS_MEDIDAS.items():
+            tempos[nome].append(_melhor_tempo(cur, sql, parametros, repeticoes))
+        conn.rollback()
+
+    try:
+        tipo = tipo_identificador(cur)
+        cur.execute("INSERT INTO usuarios (identificador, nome) VALUES (%s, %s);",
+                    (id_usuario, f"{prefixo} usuário"))
+        cur.execute("""
+            INSERT INTO obras (identificador, titulo, quantidade, quantidade_disponivel)
+            VALUES (%s, %s, 10, 7);
+        """, (id_obra, f"{prefixo} obra"))
+        cur.execute("""
+            INSERT INTO emprestimos (identificador, obra, usuario, data_retirada, data_prev_devol)
+            VALUES (%s, %s, %s, %s, %s), (%s, %s, %s, %s, %s), (%s, %s, %s, %s, %s);
+        """, (uuid4(), id_obra, id_usuario, hoje - timedelta(days=20), hoje - timedelta(days=6),
+              uuid4(), id_obra, id_usuario, hoje - timedelta(days=3), hoje + timedelta(days=11),
+              uuid4(), id_obra, id_usuario, hoje, hoje + timedelta(days=14)))
+        conn.commit()
+        cronometrar()
+
+        # Devoluções espalhadas pelos dois anos anteriores ao prazo de retenção
+        cur.execute(f"""
+            INSERT INTO emprestimos (identificador, obra, usuario, data_retirada, data_prev_devol, data_devol)
+            SELECT gen_random_uuid()::{tipo}, %(obra)s, %(usuario)s, d - 14, d - 7, d
+            FROM (SELECT CURRENT_DATE - 60 - n %% 730 AS d
+                  FROM generate_series(1, %(historico)s) AS n) AS datas;
+        """, {"obra": id_obra, "usuario": id_usuario, "historico": historico})
+        conn.commit()
+        cronometrar()
+
+        arquivar_devolvidos(usuarios=[id_usuario], pausa=0)
+        cronometrar()
+    finally:
+        conn.rollback()
+        for sql in ("DELETE FROM emprestimos WHERE usuario = %s;",
+                    "DELETE FROM emprestimos_arquivo WHERE usuario = %s;",
+                    "DELETE FROM usuarios WHERE identificador = %s;"):
+            cur.execute(sql, (id_usuario,))
+        cur.execute("DELETE FROM obras WHERE identificador = %s;", (id_obra,))
+        conn.commit()
+        cur.close()
+        conn.close()
+    return {nome: tuple(valores) for nome, valores in tempos.items()}
+
+
+if __name__ == "__main__":
+    if len(sys.argv) > 1 and sys.argv[1] == "medir":
+        historico = int(sys.argv[2]) if len(sys.argv) > 2 else 200_000
+        print(f"{'':<36} {'sem histórico':>14} {f'{historico} no ativo':>16} {'arquivados':>12}")
+        for nome, (antes, com_historico, depois) in medir(historico).items():
+            print(f"{nome:<36} {antes * 1000:>11.2f} ms {com_historico * 1000:>13.2f} ms "
+                  f"{depois * 1000:>9.2f} ms")
+    else:
+        dias = int(sys.argv[1]) if len(sys.argv) > 1 else 30
+        arquivados = arquivar_devolvidos(dias_retencao=dias)
+        print(f"{arquivados} empréstimo(s) devolvido(s) movidos para o arquivo.")
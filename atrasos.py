@@ -0,0 +1,154 @@
+import sys
+import time
+from datetime import date, datetime, timedelta
+from connect import conectar, tipo_identificador
+from cache import cache_relatorios
+import debitos
+
+NOME_JOB = "atrasos"
+
+# Chave do advisory lock que impede duas execuções simultâneas do job
+CHAVE_TRAVA_JOB = 27001
+
+
+def criar_estrutura(cur):
+    """
+    Cria as tabelas e índices usados pela detecção de atrasos.
+
+    - emprestimos.atrasado_desde: data em que o empréstimo passou a estar atrasado
+    - idx_emprestimos_a_marcar: índice parcial dos empréstimos em aberto
+      ainda não marcados, o único conjunto que o job percorre
+    - atrasos: resumo dos empréstimos em aberto que estão atrasados
+    - lembretes_outbox: fila local de lembretes a enviar aos usuários
+    - controle_jobs: data da última execução de cada job incremental
+
+    Args:
+        cur (cursor): Cursor de uma conexão aberta.
+    """
+    tipo = tipo_identificador(cur)
+    cur.execute(f"""
+        ALTER TABLE emprestimos ADD COLUMN IF NOT EXISTS atrasado_desde DATE;
+
+        CREATE INDEX IF NOT EXISTS idx_emprestimos_abertos_prev_devol
+            ON emprestimos (data_prev_devol)
+            WHERE data_devol IS NULL;
+        CREATE INDEX IF NOT EXISTS idx_emprestimos_a_marcar
+            ON emprestimos (data_prev_devol)
+            WHERE data_devol IS NULL AND atrasado_desde IS NULL;
+
+        CREATE TABLE IF NOT EXISTS atrasos (
+            emprestimo {tipo} PRIMARY KEY,
+            obra {tipo} NOT NULL,
+            usuario {tipo} NOT NULL,
+            data_prev_devol DATE NOT NULL,
+            atrasado_desde DATE NOT NULL
+        );
+        CREATE INDEX IF NOT EXISTS idx_atrasos_usuario ON atrasos (usuario);
+
+        CREATE TABLE IF NOT EXISTS lembretes_outbox (
+            id SERIAL PRIMARY KEY,
+            usuario {tipo} NOT NULL,
+            emprestimo {tipo} NOT NULL,
+            tipo TEXT NOT NULL DEFAULT 'atraso',
+            criado_em TIMESTAMP NOT NULL DEFAULT now(),
+            enviado_em TIMESTAMP
+        );
+        CREATE INDEX IF NOT EXISTS idx_lembretes_pendentes
+            ON lembretes_outbox (criado_em)
+            WHERE enviado_em IS NULL;
+
+        CREATE TABLE IF NOT EXISTS controle_jobs (
+            nome TEXT PRIMARY KEY,
+            marca_dagua DATE NOT NULL
+        );
+    """)
+
+
+def executar_job_atrasos(hoje: date = None) -> int:
+    """
+    Marca como atrasados os empréstimos em aberto cuja data prevista de
+    devolução já passou e que ainda não foram marcados.
+
+    Os candidatos são lidos pelo índice parcial ``idx_emprestimos_a_marcar``,
+    que só contém empréstimos em aberto ainda não marcados: o custo não
+    cresce com o histórico, e empréstimos que entram com a data prevista já
+    vencida (retroativos, reaplicados da fila offline ou renovados para uma
+    data passada) são marcados na próxima execução. Um único comando
+    marca os empréstimos, alimenta a tabela de resumo ``atrasos`` e
+    enfileira um lembrete por empréstimo em ``lembretes_outbox``. Em
+    seguida os dias de atraso acumulados pelos empréstimos em aberto são
+    lançados nos saldos dos usuários (ver debitos.py). A data da execução
+    é registrada em ``controle_jobs`` na mesma transação.
+
+    Args:
+        hoje (date): Data de referência. Padrão: data atual.
+
+    Returns:
+        int: Quantidade de empréstimos marcados como atrasados.
+    """
+    hoje = hoje or date.today()
+    conn = conectar()
+    cur = conn.cursor()
+    try:
+        cur.execute("SELECT pg_try_advisory_xact_lock(%s);", (CHAVE_TRAVA_JOB,))
+        if not cur.fetchone()[0]:
+            print("Job de atrasos já está em execução.")
+            conn.rollback()
+            return 0
+
+        cur.execute("""
+            WITH marcados AS (
+                UPDATE emprestimos e
+                   SET atrasado_desde = e.data_prev_devol + 1
+                 WHERE e.data_devol IS NULL
+                   AND e.atrasado_desde IS NULL
+                   AND e.data_prev_devol < %(hoje)s
+                RETURNING e.identificador, e.obra, e.usuario, e.data_prev_devol, e.atrasado_desde
+            ), resumo AS (
+                INSERT INTO atrasos (emprestimo, obra, usuario, data_prev_devol, atrasado_desde)
+                SELECT identificador, obra, usuario, data_prev_devol, atrasado_desde
+                  FROM marcados
+                ON CONFLICT (emprestimo) DO NOTHING
+            )
+            INSERT INTO lembretes_outbox (usuario, emprestimo)
+            SELECT usuario, identificador FROM marcados;
+        """, {"hoje": hoje})
+        marcados = cur.rowcount
+
+        debitos.acumular_atrasos(cur, hoje)
+
+        cur.execute("""
+            INSERT INTO controle_jobs (nome, marca_dagua)
+            VALUES (%s, %s)
+            ON CONFLICT (nome) DO UPDATE SET marca_dagua = EXCLUDED.marca_dagua;
+        """, (NOME_JOB, hoje))
+        cache_relatorios.invalidar(cur, "saldos")
+
+        conn.commit()
+        return marcados
+    except Exception:
+        conn.rollback()
+        raise
+    finally:
+        cur.close()
+        conn.close()
+
+
+def executar_diariamente():
+    """
+    Executa o job imediatamente e depois uma vez por dia, logo após a
+    meia-noite. Alternativa ao agendamento pelo cron.
+    """
+    while True:
+        marcados = executar_job_atrasos()
+        print(f"{datetime.now():%d/%m/%Y %H:%M} - {marcados} empréstimo(s) marcados como atrasados.")
+        amanha = datetime.combine(date.today() + timedelta(days=1), datetime.min.time())
+        time.sleep((amanha - datetime.now()).total_seconds() + 60)
+
+
+if __name__ == "__main__":
+    if "--diario" in sys.argv:
+        executar_diariamente()
+    else:
+        marcados = executar_job_atrasos()
+        print(f"{marcados} empréstimo(s) marcados como atrasados.")
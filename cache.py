@@ -0,0 +1,236 @@
+import json
+import os
+import random
+import threading
+from datetime import date, datetime
+from decimal import Decimal
+from uuid import UUID
+
+# Domínios de dados cujas versões invalidam os relatórios em cache
+DOMINIOS = ("obras", "usuarios", "emprestimos", "saldos")
+
+# Contadores de cada domínio. Cada escrita incrementa um deles, sorteado,
+# e a versão do domínio é a soma de todos: escritas simultâneas raramente
+# disputam a trava da mesma linha até o commit.
+FATIAS = 16
+
+
+def criar_estrutura(cur):
+    """
+    Cria a tabela com as versões de cada domínio de dados, em ``FATIAS``
+    contadores por domínio. As versões ficam no banco para que as escritas
+    de qualquer processo (outros balcões, os jobs do cron, a sincronização
+    da fila offline) invalidem o cache de todos os outros. Em bancos com a
+    tabela antiga, de um contador por domínio, o valor atual passa para a
+    fatia 0, e as versões continuam crescendo a partir dele.
+
+    Args:
+        cur (cursor): Cursor de uma conexão aberta.
+    """
+    cur.execute("""
+        CREATE TABLE IF NOT EXISTS versoes_dados (
+            dominio TEXT NOT NULL,
+            fatia INTEGER NOT NULL DEFAULT 0,
+            versao BIGINT NOT NULL DEFAULT 0,
+            PRIMARY KEY (dominio, fatia)
+        );
+    """)
+    cur.execute("""
+        SELECT 1 FROM information_schema.columns
+        WHERE table_schema = current_schema()
+          AND table_name = 'versoes_dados' AND column_name = 'fatia';
+    """)
+    if cur.fetchone() is None:
+        cur.execute("""
+            ALTER TABLE versoes_dados
+                ADD COLUMN fatia INTEGER NOT NULL DEFAULT 0,
+                DROP CONSTRAINT versoes_dados_pkey,
+                ADD PRIMARY KEY (dominio, fatia);
+        """)
+    cur.execute("""
+        INSERT INTO versoes_dados (dominio, fatia)
+        SELECT d, f FROM unnest(%s) AS d, generate_series(0, %s - 1) AS f
+        ON CONFLICT (dominio, fatia) DO NOTHING;
+    """, (list(DOMINIOS), FATIAS))
+
+
+class CacheRelatorios:
+    """
+    Cache dos resultados dos relatórios, indexado pelas versões dos dados
+    ("obras", "usuarios", "emprestimos", "saldos") gravadas na tabela
+    ``versoes_dados``.
+
+    Toda escrita incrementa, na sua própria transação, um dos contadores
+    dos domínios que altera (``invalidar``); a versão de um domínio é a
+    soma dos seus contadores. Ao pedir um relatório, as versões
+    e os dados são lidos pela mesma conexão: um resultado guardado só é
+    reaproveitado enquanto as versões dos domínios de que ele depende
+    continuarem as mesmas, e um resultado novo nunca é guardado com versões
+    mais recentes do que os dados lidos (o que poderia acontecer com uma
+    réplica atrasada).
+
+    Se um diretório for informado, os resultados também são gravados em
+    disco, em JSON, permitindo que outros processos na mesma máquina os
+    reaproveitem. Um arquivo ilegível ou adulterado só é descartado: ler o
+    cache nunca executa código.
+    """
+
+    def __init__(self, diretorio=None):
+        """
+        Args:
+            diretorio (str | None): Pasta para persistir o cache em disco.
+                Se None, o cache fica apenas em memória.
+        """
+        self.diretorio = diretorio
+        self._entradas = {}
+        self._trava = threading.Lock()
+        if diretorio:
+            os.makedirs(diretorio, exist_ok=True)
+
+    @staticmethod
+    def versoes(cur, dominios):
+        """
+        Lê a versão atual dos domínios informados.
+
+        Args:
+            cur (cursor): Cursor de uma conexão aberta.
+            dominios (tuple[str]): Domínios de dados.
+
+        Returns:
+            tuple[int]: Versões, na ordem dos domínios.
+        """
+        cur.execute("""
+            SELECT dominio, SUM(versao) FROM versoes_dados
+            WHERE dominio = ANY(%s)
+            GROUP BY dominio;
+        """, (list(dominios),))
+        atuais = dict(cur.fetchall())
+        return tuple(int(atuais.get(d, 0)) for d in dominios)
+
+    @staticmethod
+    def invalidar(cur, *dominios):
+        """
+        Incrementa a versão dos domínios informados na transação do cursor,
+        invalidando os relatórios que dependem deles quando ela for
+        confirmada. Só um dos ``FATIAS`` contadores de cada domínio, sorteado,
+        fica travado até o commit. Deve ser o último comando da transação,
+        para manter essa trava pelo menor tempo possível.
+
+        Args:
+            cur (cursor): Cursor da transação de escrita.
+            *dominios (str): Domínios alterados pela operação de escrita.
+        """
+        desconhecidos = set(dominios) - set(DOMINIOS)
+        if desconhecidos:
+            raise ValueError(f"Domínios desconhecidos: {', '.join(sorted(desconhecidos))}")
+        cur.execute("""
+            UPDATE versoes_dados SET versao = versao + 1
+            WHERE dominio = ANY(%s) AND fatia = %s;
+        """, (sorted(set(dominios)), random.randrange(FATIAS)))
+
+    def obter(self, nome, dominios, carregar, conectar):
+        """
+        Retorna o resultado guardado do relatório ou o recalcula se algum
+        dos domínios de que ele depende tiver mudado.
+
+        Args:
+            nome (str): Nome do relatório.
+            dominios (tuple[str]): Domínios dos quais o relatório depende.
+            carregar (callable): Função que recebe um cursor e executa a consulta.
+            conectar (callable): Função sem argumentos que abre a conexão
+                usada para ler as versões e, se preciso, os dados.
+
+        Returns:
+            object: Resultado do relatório (lista de linhas).
+        """
+        conn = conectar()
+        cur = conn.cursor()
+        try:
+            chave = self.versoes(cur, dominios)
+            with self._trava:
+                entrada = self._entradas.get(nome) or self._ler_disco(nome)
+                if entrada and entrada[0] == chave:
+                    self._entradas[nome] = entrada
+                    return entrada[1]
+
+            # A consulta roda fora da trava para não bloquear outras threads
+            dados = carregar(cur)
+        finally:
+            cur.close()
+            conn.close()
+
+        with self._trava:
+            self._entradas[nome] = (chave, dados)
+            self._gravar_disco(nome, (chave, dados))
+        return dados
+
+    def limpar(self):
+        """Descarta todos os resultados guardados em memória."""
+        with self._trava:
+            self._entradas.clear()
+
+    def _caminho(self, arquivo):
+        return os.path.join(self.diretorio, arquivo)
+
+    def _ler_disco(self, nome):
+        if not self.diretorio:
+            return None
+        try:
+            with open(self._caminho(f"{nome}.json"), "rb") as f:
+                conteudo = json.load(f, object_hook=_decodificar)
+            chave = tuple(conteudo["versoes"])
+            dados = [tuple(linha) for linha in conteudo["linhas"]]
+        except (OSError, ValueError, TypeError, KeyError):
+            return None
+        return chave, dados
+
+    def _gravar_disco(self, nome, entrada):
+        if not self.diretorio:
+            return
+        chave, dados = entrada
+        try:
+            conteudo = json.dumps({"versoes": chave, "linhas": dados}, default=_codificar)
+        except TypeError:
+            # Resultado com um tipo que o JSON não representa: fica só em memória
+            return
+        self._gravar_atomico(f"{nome}.json", conteudo.encode())
+
+    def _gravar_atomico(self, arquivo, conteudo):
+        """Grava em um arquivo temporário e renomeia, evitando leituras parciais."""
+        destino = self._caminho(arquivo)
+        temporario = f"{destino}.{os.getpid()}.tmp"
+        with open(temporario, "wb") as f:
+            f.write(conteudo)
+        os.replace(temporario, destino)
+
+
+# Tipos das colunas dos relatórios que o JSON não representa diretamente,
+# gravados como {"tipo": texto}
+_TIPOS = {"decimal": Decimal, "data_hora": datetime.fromisoformat,
+          "data": date.fromisoformat, "uuid": UUID}
+
+
+def _codificar(valor):
+    if isinstance(valor, Decimal):
+        return {"decimal": str(valor)}
+    if isinstance(valor, datetime):
+        return {"data_hora": valor.isoformat()}
+    if isinstance(valor, date):
+        return {"data": valor.isoformat()}
+    if isinstance(valor, UUID):
+        return {"uuid": str(valor)}
+    raise TypeError(f"Tipo não suportado no cache: {type(valor).__name__}")
+
+
+def _decodificar(objeto):
+    if len(objeto) == 1:
+        tipo, texto = next(iter(objeto.items()))
+        if tipo in _TIPOS:
+            return _TIPOS[tipo](texto)
+    return objeto
+
+
+# Instância compartilhada por todos os Acervo do processo: o menu do usuário
+# e o do administrador criam instâncias diferentes, mas reaproveitam os
+# mesmos resultados.
+cache_relatorios = CacheRelatorios(os.getenv("ACERVO_CACHE_DIR"))
@@ -1,33 +1,231 @@
 import psycopg2 as pg
 import os
+import time
+from uuid import UUID
+from psycopg2.extensions import (cursor as CursorPadrao, register_adapter, QuotedString,
+                                  TRANSACTION_STATUS_INTRANS)
+from psycopg2.extras import register_uuid
 from dotenv import load_dotenv
+import rastreamento
+from rastreamento import span, resumir_sql
 import os
 
 load_dotenv()
 
-def conectar():
+# Tolerância, em segundos, de atraso da réplica de leitura. Também é o tempo
+# em que, após uma escrita, as leituras continuam indo para o primário para
+# que o balcão enxergue o que acabou de gravar.
+ATRASO_MAXIMO_LEITURA = float(os.getenv("DB_ATRASO_MAXIMO", "5"))
+
+# Tempo máximo, em segundos, para abrir uma conexão: sem ele, um servidor
+# que não responde prende o balcão até o timeout de TCP do sistema
+TEMPO_LIMITE_CONEXAO = int(os.getenv("DB_CONNECT_TIMEOUT", "10"))
+
+_ultima_escrita = 0.0
+
+# Tipo das colunas de identificadores ("uuid" ou "text"), lido na primeira
+# conexão do processo (ver definir_identificadores)
+_identificadores = None
+
+
+class CursorRastreado(CursorPadrao):
+    """Cursor que registra um span para cada comando executado."""
+
+    def execute(self, sql, parametros=None):
+        with span("db.execute", sql=resumir_sql(sql)):
+            return super().execute(sql, parametros)
+
+    def executemany(self, sql, parametros):
+        with span("db.executemany", sql=resumir_sql(sql)):
+            return super().executemany(sql, parametros)
+
+
+# Com o rastreamento desligado as conexões usam o cursor padrão do psycopg2
+_fabrica_cursor = CursorRastreado if rastreamento.ativo else CursorPadrao
+
+
+class ConexaoPrimario(pg.extensions.connection):
+    """
+    Conexão com o primário que registra a hora de cada transação
+    confirmada, para que as leituras dos segundos seguintes não vão para
+    uma réplica que ainda não recebeu o que foi gravado. Abrir a conexão,
+    desfazer a transação ou confirmar sem ter executado nada não conta como
+    escrita.
+    """
+
+    def commit(self):
+        global _ultima_escrita
+        em_transacao = self.info.transaction_status == TRANSACTION_STATUS_INTRANS
+        super().commit()
+        if em_transacao:
+            _ultima_escrita = time.monotonic()
+
+
+def tipo_identificador(cur):
+    """
+    Tipo das colunas de identificadores do banco conectado: "uuid" depois
+    da migração de migrar_uuid.py (ou em bancos já criados assim) e "text"
+    enquanto ela não chegou à etapa ``trocar``, que converte todas as
+    colunas de uma vez. As tabelas auxiliares são criadas com esse tipo
+    para que junções e INSERT ... SELECT com as tabelas principais
+    funcionem antes e depois da troca.
+
+    Args:
+        cur (cursor): Cursor de uma conexão aberta.
+
+    Returns:
+        str: "uuid" ou "text".
+    """
+    cur.execute("""
+        SELECT data_type FROM information_schema.columns
+        WHERE table_schema = current_schema()
+          AND table_name = 'obras' AND column_name = 'identificador';
+    """)
+    linha = cur.fetchone()
+    return "text" if linha and linha[0] in ("text", "character varying") else "uuid"
+
+
+def definir_identificadores(tipo):
+    """
+    Define como os uuid.UUID trafegam neste processo. Com "uuid" eles vão e
+    voltam como uuid nativo (16 bytes no banco); com "text" são enviados
+    como literais sem tipo, que o PostgreSQL compara com colunas de texto.
+    Balcões abertos antes da etapa ``trocar`` da migração precisam ser
+    reiniciados para passar a usar o uuid nativo.
+
+    Args:
+        tipo (str): "uuid" ou "text" (ver tipo_identificador).
+    """
+    global _identificadores
+    if tipo == "uuid":
+        register_uuid()
+    else:
+        register_adapter(UUID, lambda valor: QuotedString(str(valor)))
+    _identificadores = tipo
+
+
+def _preparar(conn):
+    """Na primeira conexão do processo, ajusta os identificadores ao banco."""
+    if _identificadores is None:
+        cur = conn.cursor()
+        try:
+            definir_identificadores(tipo_identificador(cur))
+        finally:
+            cur.close()
+            conn.rollback()
+    return conn
+
+
+def _dsn(modo):
+    """
+    Retorna a DSN configurada para o modo de acesso, ou None para usar
+    as variáveis DB_HOST, DB_DATABASE, DB_USER e DB_PASSWORD.
+    """
+    if modo == "leitura":
+        return os.getenv("DB_DSN_LEITURA")
+    return os.getenv("DB_DSN_ESCRITA")
+
+
+def _abrir(dsn):
+    if dsn:
+        return _preparar(pg.connect(dsn, connect_timeout=TEMPO_LIMITE_CONEXAO,
+                                    connection_factory=ConexaoPrimario,
+                                    cursor_factory=_fabrica_cursor))
+    return _preparar(pg.connect(
+        host=os.getenv("DB_HOST", "localhost"),
+        database=os.getenv("DB_DATABASE"),
+        user=os.getenv("DB_USER"),
+        password=os.getenv("DB_PASSWORD"),
+        connect_timeout=TEMPO_LIMITE_CONEXAO,
+        connection_factory=ConexaoPrimario,
+        cursor_factory=_fabrica_cursor,
+    ))
+
+
+def _atraso_replica(conn):
+    """
+    Mede, em segundos, o atraso de replicação do servidor conectado.
+    Um servidor que não é réplica (ou que já aplicou tudo o que recebeu)
+    tem atraso zero.
+    """
+    cur = conn.cursor()
+    cur.execute("""
+        SELECT CASE
+            WHEN NOT pg_is_in_recovery()
+              OR pg_last_wal_receive_lsn() = pg_last_wal_replay_lsn() THEN 0
+            ELSE COALESCE(EXTRACT(EPOCH FROM now() - pg_last_xact_replay_timestamp()), 0)
+        END;
+    """)
+    atraso = float(cur.fetchone()[0])
+    cur.close()
+    conn.rollback()
+    return atraso
+
+
+def _conectar_leitura():
+    """
+    Tenta abrir uma conexão com a réplica de leitura. Retorna None se não
+    houver réplica configurada, se ela estiver fora do ar, atrasada além da
+    tolerância (ou se não foi possível medir o atraso), ou se houve
+    escrita recente neste processo.
+    """
+    dsn = _dsn("leitura")
+    if not dsn or time.monotonic() - _ultima_escrita < ATRASO_MAXIMO_LEITURA:
+        return None
+    try:
+        with span("db.conectar", modo="leitura"):
+            conn = _preparar(pg.connect(dsn, connect_timeout=TEMPO_LIMITE_CONEXAO,
+                                        cursor_factory=_fabrica_cursor))
+    except pg.OperationalError as e:
+        print(f"Réplica de leitura indisponível, usando o primário: {e}")
+        return None
+    try:
+        atraso = _atraso_replica(conn)
+    except pg.Error as e:
+        print(f"Não foi possível medir o atraso da réplica, usando o primário: {e}")
+        atraso = None
+    if atraso is None or atraso > ATRASO_MAXIMO_LEITURA:
+        conn.close()
+        return None
+    return conn
+
+
+def conectar(modo="escrita"):
     """
     Estabelece e retorna uma conexão com o banco de dados PostgreSQL.
 
+    No modo "leitura", a conexão vai para a réplica configurada em
+    DB_DSN_LEITURA quando ela está dentro da tolerância de atraso
+    (DB_ATRASO_MAXIMO) e nenhuma transação foi confirmada no primário por
+    este processo nesse intervalo; caso contrário, vai para o primário.
+    Conexões no modo "escrita" sempre vão para o primário.
+
+    Args:
+        modo (str): "escrita" (padrão) ou "leitura".
+
     Returns:
         connection: Objeto de conexão com o banco.
-    
+
     Raises:
         psycopg2.DatabaseError: Se ocorrer erro na conexão.
     """
+    if modo == "leitura":
+        conn = _conectar_leitura()
+        if conn:
+            return conn
+
     try:
-        conn = pg.connect(
-            host=os.getenv("DB_HOST", "localhost"),
-            database=os.getenv("DB_DATABASE"),
-            user=os.getenv("DB_USER"),
-            password=os.getenv("DB_PASSWORD"),
-        )
+        with span("db.conectar", modo="escrita"):
+            conn = _abrir(_dsn("escrita"))
         return conn
     except pg.DatabaseError as e:
         print(f"Erro ao conectar ao banco de dados: {e}")
         raise
-conn = conectar()
-if conn:
-    print("Conexão com o servidor estabelecida com sucesso!")
-else:
-    print("Falha ao conectar com o servidor.")
\ No newline at end of file
+if os.getenv("ACERVO_BACKEND", "postgres").lower() == "postgres":
+    # Sem servidor o sistema ainda abre: os balcões gravam na fila offline
+    try:
+        conn = conectar()
+        print("Conexão com o servidor estabelecida com sucesso!")
+    except pg.DatabaseError:
+        conn = None
+        print("Falha ao conectar com o servidor.")
@@ -1,9 +1,32 @@
-from datetime import date, datetime
+from datetime import date, datetime, timedelta
+from decimal import Decimal, InvalidOperation
 from rich.table import Table
 from models import Obra, Emprestimo
-from connect import conectar
+from armazenamento import backend_padrao, lista_valores
 from uuid import uuid4
-from rich.console import Console
+from cache import cache_relatorios
+from rastreamento import rastreado
+import reservas
+import debitos
+from usuarios import resolver_usuario, UsuarioAmbiguo
+from expurgo import Expurgo
+from visualizador import VisualizadorPaginado
+
+# Consulta do relatório de inventário, compartilhada com a federação de filiais
+SQL_INVENTARIO = """
+    SELECT titulo, autor, ano, categoria, quantidade, quantidade_disponivel
+    FROM obras
+    ORDER BY titulo;
+"""
+
+# Consulta do histórico de empréstimos de um usuário (ativos e arquivados)
+SQL_HISTORICO = """
+    SELECT e.identificador, o.titulo, e.data_retirada, e.data_prev_devol, e.data_devol
+    FROM emprestimos_todos e
+    JOIN obras o ON o.identificador = e.obra
+    WHERE e.usuario = %s
+    ORDER BY e.data_retirada DESC
+"""
 
 class Acervo:
     """
@@ -11,19 +34,83 @@ class Acervo:
     cadastrados e os históricos de empréstimos.
     """
 
-    def __init__(self):
+    def __init__(self, backend=None):
         """
         Inicializa as estruturas de dados internas do acervo:
         - obras: dicionário {titulo: Obra}
         - usuarios: conjunto de usuários cadastrados
         - estoque: dicionário {id_obra: quantidade disponível}
         - historico_emprestimos: lista de todos os empréstimos realizados
+
+        Args:
+            backend: Backend de armazenamento (ver armazenamento.py).
+                Padrão: o escolhido por ACERVO_BACKEND.
         """
+        self.backend = backend or backend_padrao
+        self.catalogo = None
         self.obras = {}
         self.usuarios = set()
         self.estoque = {}
         self.historico_emprestimos = []
 
+    @classmethod
+    def somente_leitura(cls, caminho_snapshot):
+        """
+        Cria um Acervo para quiosques de consulta, que responde às buscas de
+        obras a partir de um snapshot do catálogo (ver snapshot.py), sem
+        conexão com o banco de dados.
+
+        Args:
+            caminho_snapshot (str): Arquivo gerado por snapshot.gerar_snapshot.
+
+        Returns:
+            Acervo: Instância em modo somente leitura.
+        """
+        from snapshot import SnapshotCatalogo, _SemBanco
+        acervo = cls(backend=_SemBanco())
+        acervo.catalogo = SnapshotCatalogo(caminho_snapshot)
+        return acervo
+
+    @rastreado("acervo.buscar_obra")
+    def buscar_obra(self, titulo):
+        """
+        Busca uma obra pelo título, sem diferenciar maiúsculas/minúsculas,
+        pelo índice ``idx_obras_titulo``. No modo somente leitura a busca é
+        feita no snapshot.
+
+        Args:
+            titulo (str): Título da obra.
+
+        Returns:
+            Obra | None: A obra encontrada ou None.
+        """
+        if self.catalogo is not None:
+            encontrados = self.catalogo.buscar(titulo)
+            if not encontrados:
+                return None
+            r = encontrados[0]
+            linha = (r.identificador, r.titulo, r.autor, r.ano, r.categoria,
+                     r.quantidade, r.quantidade_disponivel)
+        else:
+            # Primário: a obra encontrada no balcão alimenta o empréstimo
+            conn = self.backend.conectar()
+            cur = conn.cursor()
+            cur.execute("""
+                SELECT identificador, titulo, autor, ano, categoria, quantidade, quantidade_disponivel
+                FROM obras
+                WHERE LOWER(titulo) = LOWER(%s);
+            """, (titulo.strip(),))
+            linha = cur.fetchone()
+            cur.close()
+            conn.close()
+            if not linha:
+                return None
+
+        ident, titulo_db, autor, ano, categoria, quantidade, quantidade_disponivel = linha
+        obra = Obra(titulo_db, autor, ano, categoria, quantidade, quantidade_disponivel)
+        obra.ident = ident
+        return obra
+
     def __iadd__(self, obra: Obra):
         """
         Sobrecarga do operador '+=' para adicionar uma obra ao acervo
@@ -63,6 +150,7 @@ class Acervo:
                 del self.obras[obra.titulo]
         return self
 
+    @rastreado("acervo.adicionar")
     def adicionar(self, obra: Obra):
         """
         Salva uma instância de obra no banco de dados.
@@ -70,13 +158,13 @@ class Acervo:
         Args:
             obra (Obra): Objeto obra contendo os dados a serem salvos.
         """
-        conn = conectar()
+        conn = self.backend.conectar()
         cur = conn.cursor()
         cur.execute("""
             INSERT INTO obras (identificador, titulo, autor, ano, categoria, quantidade, quantidade_disponivel)
             VALUES (%s, %s, %s, %s, %s, %s, %s);
         """, (
-            str(obra.ident), 
+            obra.ident, 
             obra.titulo,
             obra.autor,
             obra.ano,
@@ -84,60 +172,81 @@ class Acervo:
             obra.quantidade,
             obra.quantidade_disponivel
         ))
+        cache_relatorios.invalidar(cur, "obras")
         conn.commit()
         cur.close()
         conn.close()
         print("Obra salva com sucesso!")
 
-    def remover(self, id_obra):
+    @rastreado("acervo.remover")
+    def remover(self, id_obra, forcar: bool = False):
         """
-        Remove uma obra do banco de dados pelo seu identificador.
+        Remove uma obra do banco de dados pelo seu identificador, junto com
+        suas reservas e empréstimos, em lotes (ver expurgo.py).
 
         Args:
-            id_obra (str): Identificador único da obra a ser removida.
+            id_obra (UUID): Identificador único da obra a ser removida.
+            forcar (bool): Remove mesmo se houver empréstimos em aberto.
+
+        Raises:
+            ExpurgoRecusado: Se a obra tiver empréstimos em aberto e forcar for False.
         """
-        conn = conectar()
-        cur = conn.cursor()
-        cur.execute("""
-            DELETE FROM obras WHERE identificador = %s;
-        """, (str(id_obra),))
-        conn.commit()
-        cur.close()
-        conn.close()
+        Expurgo(self.backend).obra(id_obra, forcar)
         print("Obra excluída com sucesso.")
 
+    @rastreado("acervo.emprestar")
     def emprestar(self, emprestimo: Emprestimo):
         """
         Salva uma instância de empréstimo no banco de dados usando o objeto completo.
 
+        Na mesma transação do empréstimo, o exemplar sai do acervo: consome a
+        reserva alocada para o usuário ou, sem ela, baixa o estoque da obra
+        (ver reservas.retirar_exemplar).
+
         Args:
-            emprestimo (Emprestimo): Objeto empréstimo contendo os dados a serem salvos.
+            emprestimo (Emprestimo): Objeto empréstimo contendo os dados a serem
+                salvos; a obra deve ter o identificador lido do banco.
+
+        Returns:
+            bool: True se o empréstimo foi salvo.
         """
         
-        conn = conectar()
+        conn = self.backend.conectar()
         cur = conn.cursor()
-        id_emprestimo = str(uuid4())  # Gerar um novo ID único para o empréstimo
+        id_emprestimo = uuid4()  # Gerar um novo ID único para o empréstimo
+        # A obra já vem do banco (buscar_obra); uma obra removida nesse meio
+        # tempo não tem exemplar a retirar
+        id_obra = emprestimo.obra.ident
 
-        # Buscar o ID da obra pelo título
-        cur.execute("SELECT identificador FROM obras WHERE titulo = %s", (emprestimo.obra.titulo,))
-        obra_row = cur.fetchone()
-        if not obra_row:
-            print(f"Obra '{emprestimo.obra.titulo}' não encontrada.")
+        # Buscar o ID do usuário pelo cartão ou, sem ele, pelo nome
+        try:
+            user_row = resolver_usuario(cur, emprestimo.usuario.cartao or emprestimo.usuario.nome)
+        except UsuarioAmbiguo as e:
+            print(f"Usuário ambíguo: {e}.")
             cur.close()
             conn.close()
-            return
-        id_obra = obra_row[0]
-
-        # Buscar o ID do usuário pelo nome
-        cur.execute("SELECT identificador FROM usuarios WHERE nome = %s", (emprestimo.usuario.nome,))
-        user_row = cur.fetchone()
+            return False
         if not user_row:
             print(f"Usuário '{emprestimo.usuario.nome}' não encontrado.")
             cur.close()
             conn.close()
-            return
+            return False
         id_usuario = user_row[0]
 
+        # Consulta o saldo devedor do usuário antes de emprestar
+        if not debitos.verificar_debito(cur, id_usuario):
+            cur.close()
+            conn.close()
+            return False
+
+        # Retira o exemplar separado pela reserva ou baixa um do estoque
+        if not reservas.retirar_exemplar(cur, id_obra, id_usuario):
+            print("Obra indisponível no momento.")
+            conn.rollback()
+            cur.close()
+            conn.close()
+            return False
+
         # Inserir empréstimo no banco
         cur.execute("""
             INSERT INTO emprestimos (identificador, obra, usuario, data_retirada, data_prev_devol)
@@ -149,72 +258,170 @@ class Acervo:
             emprestimo.data_retirada,
             emprestimo.data_prev_devol
         ))
+        cache_relatorios.invalidar(cur, "emprestimos", "obras")
 
         conn.commit()
         cur.close()
         conn.close()
         print("Empréstimo salvo com sucesso!")
+        return True
 
-    def registrar_devolucao_interativa(self):
-        nome = input("Nome do usuário: ").strip()
+    @rastreado("acervo.emprestar_carrinho")
+    def emprestar_carrinho(self, usuario, titulos, dias: int, tudo_ou_nada: bool = True):
+        """
+        Empresta várias obras a um mesmo usuário em uma única transação.
 
+        Todas as obras são buscadas e travadas de uma vez, as baixas de
+        estoque são enviadas em lote e os empréstimos são inseridos com um
+        único INSERT, de modo que o número de idas ao banco não cresce com
+        a quantidade de títulos. Exemplares separados por reserva para o
+        usuário são retirados sem mexer no estoque. Usuários com saldo
+        devedor acima do limite (ver debitos.py) não podem pegar obras.
+
+        Args:
+            usuario (Usuario): Usuário que está pegando as obras.
+            titulos (list[str]): Títulos desejados (um item por exemplar).
+            dias (int): Dias de empréstimo.
+            tudo_ou_nada (bool): Se True, nenhum empréstimo é feito caso algum
+                título falhe; se False, empresta os que forem possíveis.
+
+        Returns:
+            list[tuple[str, str]]: Pares (título, situação) de cada item do carrinho.
+        """
+        hoje = date.today()
+        data_prev_devol = hoje + timedelta(days=dias)
+        id_usuario = usuario.ident
+
+        conn = self.backend.conectar()
+        cur = conn.cursor()
         try:
-            conn = conectar()
-            cur = conn.cursor()
+            if not debitos.verificar_debito(cur, id_usuario):
+                conn.rollback()
+                return [(titulo, "Bloqueado por débito") for titulo in titulos]
+
+            # Busca e trava todas as obras do carrinho de uma só vez, sempre na
+            # mesma ordem para evitar deadlocks entre balcões. Os títulos são
+            # comparados pelo lower() do próprio banco, como no índice
+            # idx_obras_titulo; grafias diferentes do mesmo título dividem o
+            # mesmo estoque
+            distintos = list({titulo.strip() for titulo in titulos})
+            obras, por_ident = {}, {}
+            if distintos:
+                cur.execute(f"""
+                    SELECT t.column1, o.identificador, o.titulo, o.quantidade_disponivel,
+                           EXISTS (
+                               SELECT 1 FROM reservas r
+                               WHERE r.obra = o.identificador AND r.usuario = %s
+                                 AND r.status = 'alocada'
+                           )
+                    FROM {lista_valores(len(distintos))} AS t
+                    JOIN obras o ON LOWER(o.titulo) = LOWER(t.column1)
+                    ORDER BY o.identificador
+                    FOR UPDATE OF o;
+                """, (id_usuario, *distintos))
+                for texto, ident, titulo, disponivel, reservada in cur.fetchall():
+                    obras[texto] = por_ident.setdefault(ident, [ident, titulo, disponivel, reservada])
+
+            resultados = []
+            baixas = {}
+            reservas_atendidas = []
+            novos = []
+            for titulo in titulos:
+                obra = obras.get(titulo.strip())
+                if obra is None:
+                    resultados.append((titulo, "Obra não encontrada"))
+                    continue
+                ident, titulo_db, disponivel, reservada = obra
+                if reservada:
+                    obra[3] = False
+                    reservas_atendidas.append(ident)
+                elif disponivel > 0:
+                    obra[2] -= 1
+                    baixas[ident] = baixas.get(ident, 0) + 1
+                else:
+                    resultados.append((titulo_db, "Indisponível"))
+                    continue
+                novos.append((uuid4(), ident, id_usuario, hoje, data_prev_devol))
+                resultados.append((titulo_db, "Emprestado"))
+
+            if not novos or (tudo_ou_nada and len(novos) < len(titulos)):
+                conn.rollback()
+                return [(titulo, situacao if situacao != "Emprestado" else "Cancelado")
+                        for titulo, situacao in resultados]
+
+            if baixas:
+                self.backend.executar_lote(cur, """
+                    UPDATE obras
+                    SET quantidade_disponivel = quantidade_disponivel - %s
+                    WHERE identificador = %s;
+                """, [(qtd, ident) for ident, qtd in baixas.items()])
+            if reservas_atendidas:
+                cur.execute("""
+                    UPDATE reservas SET status = 'atendida'
+                    WHERE usuario = %s AND status = 'alocada' AND obra = ANY(%s);
+                """, (id_usuario, reservas_atendidas))
+            self.backend.inserir_lote(cur, """
+                INSERT INTO emprestimos (identificador, obra, usuario, data_retirada, data_prev_devol)
+                VALUES %s;
+            """, novos)
+            cache_relatorios.invalidar(cur, "emprestimos", "obras")
+
+            conn.commit()
+            return resultados
+        except Exception:
+            conn.rollback()
+            raise
+        finally:
+            cur.close()
+            conn.close()
+
+    def registrar_devolucao_interativa(self):
+        nome = input("Nome ou cartão do usuário: ").strip()
 
-            # Busca o usuário pelo nome (case-insensitive)
-            cur.execute("SELECT identificador FROM usuarios WHERE LOWER(nome) = LOWER(%s);", (nome,))
-            resultado = cur.fetchone()
+        conn = self.backend.conectar()
+        cur = conn.cursor()
+        try:
+            # Busca o usuário pelo cartão ou pelo nome (case-insensitive)
+            try:
+                resultado = resolver_usuario(cur, nome)
+            except UsuarioAmbiguo as e:
+                print(f"Usuário ambíguo: {e}.")
+                return
             if not resultado:
                 print("Usuário não encontrado.")
                 return
             id_usuario = resultado[0]
 
-            # Busca os empréstimos pendentes com quantidade para atualizar estoque depois
-            cur.execute("""
+            # Busca os empréstimos pendentes sob demanda, com quantidade para atualizar estoque depois
+            cur_lista = conn.cursor(name="emprestimos_pendentes")
+            cur_lista.execute("""
                 SELECT e.identificador, o.titulo, e.data_retirada, e.data_prev_devol, o.quantidade, e.obra
                 FROM emprestimos e
                 JOIN obras o ON e.obra = o.identificador
-                WHERE e.usuario = %s AND e.data_devol IS NULL;
+                WHERE e.usuario = %s AND e.data_devol IS NULL
+                ORDER BY e.data_prev_devol, e.identificador;
             """, (id_usuario,))
-            emprestimos = cur.fetchall()
-
-            if not emprestimos:
+            emprestimos = VisualizadorPaginado(
+                "Empréstimos Pendentes",
+                [("Obra", {"justify": "left", "style": "magenta"}),
+                 ("Quantidade", {"justify": "center", "style": "green"}),
+                 ("Retirada", {"justify": "center", "style": "yellow"}),
+                 ("Prev. Devolução", {"justify": "center", "style": "yellow"})],
+                cur_lista,
+                formatar=lambda emp: (emp[1], str(emp[4]), emp[2].strftime('%d/%m/%Y'),
+                                      emp[3].strftime('%d/%m/%Y')),
+            )
+
+            if emprestimos.vazio():
                 print("Nenhum empréstimo em aberto para este usuário.")
                 return
 
-            # Exibe os empréstimos pendentes
-            table = Table(title="Empréstimos Pendentes")
-            table.add_column("Índice", justify="center", style="cyan")
-            table.add_column("Obra", justify="left", style="magenta")
-            table.add_column("Quantidade", justify="center", style="green")
-            table.add_column("Retirada", justify="center", style="yellow")
-            table.add_column("Prev. Devolução", justify="center", style="yellow")
-
-            for i, emp in enumerate(emprestimos):
-                emp_id, titulo, retirada, prev_devol, quantidade, obra_id = emp
-                table.add_row(
-                str(i),
-                titulo,
-                str(quantidade),
-                retirada.strftime('%d/%m/%Y'),
-                prev_devol.strftime('%d/%m/%Y')
-                )
-            console = Console()
-            console.print(table)
-
-            # Escolhe o empréstimo a ser devolvido
-            try:
-                i = int(input("Escolha o índice do empréstimo a devolver: "))
-                if i < 0 or i >= len(emprestimos):
-                    print("Índice inválido.")
-                    return
-            except ValueError:
-                print("Digite um índice válido.")
+            # Exibe os empréstimos pendentes e escolhe o empréstimo a ser devolvido
+            i = emprestimos.navegar(escolher=True)
+            if i is None:
                 return
-
-            id_emprestimo = emprestimos[i][0]  # ID do empréstimo
-            obra_id = emprestimos[i][5]
+            id_emprestimo = emprestimos.linha(i)[0]
+            cur_lista.close()
 
             # Solicita a data de devolução
             data_devol = input("Data da devolução (DD/MM/AAAA): ")
@@ -224,84 +431,168 @@ class Acervo:
                 print("Formato de data inválido.")
                 return
 
-            # Atualiza a data de devolução no empréstimo
-            cur.execute("""
-                UPDATE emprestimos
-                SET data_devol = %s
-                WHERE identificador = %s;
-            """, (data_devol, id_emprestimo))
+            _, contemplados = self._registrar_devolucoes(cur, [id_emprestimo], data_devol)
+            conn.commit()
+            if contemplados:
+                print("Devolução registrada! Exemplar separado para a próxima reserva da fila.")
+            else:
+                print("Devolução registrada e estoque atualizado com sucesso!")
+
+        except Exception as e:
+            print(f"Erro: {e}")
+            conn.rollback()
+        finally:
+            cur.close()
+            conn.close()
+
+    def registrar_devolucao_lote(self):
+        """
+        Pergunta o usuário e a data e devolve de uma vez todos os seus
+        empréstimos em aberto (ver ``devolver_todos``).
+        """
+        chave = input("Nome ou cartão do usuário: ").strip()
+        data_devol = input("Data da devolução (DD/MM/AAAA): ")
+        try:
+            data_devol = datetime.strptime(data_devol, "%d/%m/%Y").date()
+        except ValueError:
+            print("Formato de data inválido.")
+            return
+        self.devolver_todos(chave, data_devol)
+
+    @rastreado("acervo.devolver_todos")
+    def devolver_todos(self, chave, data_devol):
+        """
+        Devolve de uma vez todos os empréstimos em aberto de um usuário, em
+        uma única transação: os exemplares são separados para as reservas
+        das obras ou voltam ao estoque junto com as devoluções.
+
+        Args:
+            chave (str | int): Nome ou número do cartão do usuário.
+            data_devol (date): Data da devolução.
+
+        Returns:
+            int: Quantidade de empréstimos devolvidos.
+        """
+        conn = self.backend.conectar()
+        cur = conn.cursor()
+        try:
+            try:
+                resultado = resolver_usuario(cur, chave)
+            except UsuarioAmbiguo as e:
+                print(f"Usuário ambíguo: {e}.")
+                return 0
+            if not resultado:
+                print("Usuário não encontrado.")
+                return 0
 
-            # Atualiza a quantidade disponível da obra, somando a quantidade devolvida
             cur.execute("""
-                UPDATE obras
-                SET quantidade_disponivel = quantidade_disponivel + 1
-                WHERE identificador = %s;
-            """, (obra_id,))
+                SELECT identificador FROM emprestimos
+                WHERE usuario = %s AND data_devol IS NULL;
+            """, (resultado[0],))
+            ids = [linha[0] for linha in cur.fetchall()]
+            if not ids:
+                print("Nenhum empréstimo em aberto para este usuário.")
+                return 0
 
+            devolvidos, contemplados = self._registrar_devolucoes(cur, ids, data_devol)
             conn.commit()
-            print("Devolução registrada e estoque atualizado com sucesso!")
-
+            print(f"{devolvidos} devolução(ões) registrada(s); "
+                  f"{contemplados} exemplar(es) separado(s) para reservas.")
+            return devolvidos
         except Exception as e:
             print(f"Erro: {e}")
             conn.rollback()
+            return 0
         finally:
             cur.close()
             conn.close()
+
+    @staticmethod
+    @rastreado("acervo.registrar_devolucoes")
+    def _registrar_devolucoes(cur, ids_emprestimos, data_devol):
+        """
+        Registra, na transação do cursor, a devolução dos empréstimos
+        informados que ainda estão em aberto: grava a data, lança no saldo
+        os dias de atraso ainda não cobrados, separa cada exemplar para a
+        próxima reserva da obra (ou o devolve ao estoque) e tira os
+        empréstimos do resumo de atrasos.
+
+        Args:
+            cur (cursor): Cursor da transação da devolução.
+            ids_emprestimos (list[UUID]): Empréstimos devolvidos.
+            data_devol (date): Data da devolução.
+
+        Returns:
+            tuple[int, int]: (empréstimos devolvidos, exemplares separados
+            para reservas).
+        """
+        cur.execute("""
+            UPDATE emprestimos
+            SET data_devol = %s
+            WHERE identificador = ANY(%s) AND data_devol IS NULL
+            RETURNING identificador, obra;
+        """, (data_devol, list(ids_emprestimos)))
+        devolvidos = cur.fetchall()
+
+        contemplados = 0
+        # Percorre as obras sempre na mesma ordem para que devoluções em
+        # lote simultâneas travem as filas de reserva sem impasse
+        for id_emprestimo, id_obra in sorted(devolvidos, key=lambda linha: str(linha[1])):
+            debitos.registrar_devolucao(cur, id_emprestimo, data_devol)
+            if reservas.liberar_exemplar(cur, id_obra):
+                contemplados += 1
+
+        cur.execute("DELETE FROM atrasos WHERE emprestimo = ANY(%s);",
+                    ([linha[0] for linha in devolvidos],))
+        cache_relatorios.invalidar(cur, "emprestimos", "obras", "saldos")
+        return len(devolvidos), contemplados
+
     def renovar(self):
-        nome_user = input("Digite seu nome de usuário: ")
+        nome_user = input("Digite seu nome ou número de cartão: ")
 
+        conn = self.backend.conectar()
+        cur = conn.cursor()
         try:
-            conn = conectar()
-            cur = conn.cursor()
-
-            # Busca o usuário pelo nome (case-insensitive)
-            cur.execute("SELECT identificador FROM usuarios WHERE LOWER(nome) = LOWER(%s);", (nome_user,))
-            resultado = cur.fetchone()
+            # Busca o usuário pelo cartão ou pelo nome (case-insensitive)
+            try:
+                resultado = resolver_usuario(cur, nome_user)
+            except UsuarioAmbiguo as e:
+                print(f"Usuário ambíguo: {e}.")
+                return
             if not resultado:
                 print("Usuário não encontrado.")
                 return
             id_usuario = resultado[0]
 
             # Busca os empréstimos pendentes com o ID sequencial do empréstimo
-            cur.execute("""
+            cur_lista = conn.cursor(name="emprestimos_renovaveis")
+            cur_lista.execute("""
                 SELECT e.id, o.titulo, e.data_retirada, e.data_prev_devol
                 FROM emprestimos e
                 JOIN obras o ON e.obra = o.identificador
-                WHERE e.usuario = %s AND e.data_devol IS NULL;
+                WHERE e.usuario = %s AND e.data_devol IS NULL
+                ORDER BY e.data_prev_devol, e.id;
             """, (id_usuario,))
-            emprestimos = cur.fetchall()
-
-            if not emprestimos:
+            emprestimos = VisualizadorPaginado(
+                "Empréstimos Pendentes",
+                [("Obra", {"justify": "left", "style": "magenta"}),
+                 ("Retirada", {"justify": "center", "style": "yellow"}),
+                 ("Prev. Devolução", {"justify": "center", "style": "yellow"})],
+                cur_lista,
+                formatar=lambda emp: (emp[1], emp[2].strftime('%d/%m/%Y'),
+                                      emp[3].strftime('%d/%m/%Y')),
+            )
+
+            if emprestimos.vazio():
                 print("Nenhum empréstimo em aberto para este usuário.")
                 return
 
-            # Exibe os empréstimos pendentes em uma tabela colorida (igual ao registrar_devolucao_interativa)
-            table = Table(title="Empréstimos Pendentes")
-            table.add_column("Índice", justify="center", style="cyan")
-            table.add_column("Obra", justify="left", style="magenta")
-            table.add_column("Retirada", justify="center", style="yellow")
-            table.add_column("Prev. Devolução", justify="center", style="yellow")
-
-            for i, emp in enumerate(emprestimos):
-                emp_id, titulo, retirada, prev_devol = emp
-                table.add_row(
-                    str(i),
-                    titulo,
-                    retirada.strftime('%d/%m/%Y'),
-                    prev_devol.strftime('%d/%m/%Y')
-                )
-            console = Console()
-            console.print(table)
-            try:
-                i = int(input("Escolha o índice do empréstimo a revonar: "))
-                if i < 0 or i >= len(emprestimos):
-                    print("Índice inválido.")
-                    return
-            except ValueError:
-                print("Digite um índice válido.")
+            # Exibe os empréstimos pendentes (igual ao registrar_devolucao_interativa)
+            i = emprestimos.navegar(escolher=True)
+            if i is None:
                 return
-
-            id_emprestimo = emprestimos[i][0]  # Pega o ID sequencial do empréstimo
+            id_emprestimo = emprestimos.linha(i)[0]  # Pega o ID sequencial do empréstimo
+            cur_lista.close()
 
             data_devol = input("Data da renovação de emprestimo (DD/MM/AAAA): ")
             try:
@@ -310,12 +601,7 @@ class Acervo:
                 print("Formato de data inválido.")
                 return
 
-            # Atualiza o empréstimo no banco com a data de devolução
-            cur.execute("""
-                UPDATE emprestimos
-                SET data_prev_devol = %s
-                WHERE id = %s;
-            """, (data_devol, id_emprestimo))
+            self._renovar_emprestimo(cur, id_emprestimo, data_devol)
             conn.commit()
             print("Renovação de empréstimo registrada com sucesso!")
         
@@ -325,6 +611,94 @@ class Acervo:
             cur.close()
             conn.close()
 
+    @staticmethod
+    @rastreado("acervo.renovar_emprestimo")
+    def _renovar_emprestimo(cur, id_emprestimo, nova_data):
+        """
+        Atualiza o empréstimo com a nova data prevista, retirando-o do
+        resumo de atrasos caso estivesse atrasado, na transação do cursor.
+
+        Args:
+            cur (cursor): Cursor da transação da renovação.
+            id_emprestimo (int): ID sequencial do empréstimo.
+            nova_data (date): Nova data prevista de devolução.
+        """
+        cur.execute("""
+            UPDATE emprestimos
+            SET data_prev_devol = %s, atrasado_desde = NULL
+            WHERE id = %s
+            RETURNING identificador;
+        """, (nova_data, id_emprestimo))
+        identificador = cur.fetchone()[0]
+        debitos.estornar_atraso(cur, identificador)
+        cur.execute("DELETE FROM atrasos WHERE emprestimo = %s;", (identificador,))
+        cache_relatorios.invalidar(cur, "emprestimos", "saldos")
+
+    @rastreado("acervo.sugestoes")
+    def sugestoes(self, idents=(), titulos=(), k: int = 5):
+        """
+        Títulos que costumam ser emprestados junto com as obras informadas,
+        lidos do índice de recomendações (ver recomendacoes.py).
+
+        Args:
+            idents (list): Identificadores das obras de referência.
+            titulos (list[str]): Títulos das obras de referência.
+            k (int): Quantidade de sugestões.
+
+        Returns:
+            list[str]: Títulos sugeridos (vazia se o índice não foi construído
+            ou se NumPy/SciPy não estiverem instalados).
+        """
+        # NumPy e SciPy só são necessários para as sugestões
+        try:
+            import recomendacoes
+        except ImportError:
+            return []
+        indice = recomendacoes.indice_atual()
+        if indice is None:
+            return []
+        obras = list(idents) + indice.identificar(titulos)
+        return [titulo for _, titulo, _ in indice.sugerir(obras, k)]
+
+    @rastreado("acervo.reservar")
+    def reservar(self, usuario, obra):
+        """
+        Coloca o usuário na fila de reservas de uma obra indisponível.
+
+        Args:
+            usuario (Usuario): Usuário que deseja a obra.
+            obra (Obra): Obra a ser reservada.
+        """
+        conn = self.backend.conectar()
+        cur = conn.cursor()
+        posicao = reservas.reservar(cur, obra.ident, usuario.ident)
+        conn.commit()
+        cur.close()
+        conn.close()
+        if posicao is None:
+            print("Você já possui uma reserva ativa para esta obra.")
+        else:
+            print(f"Reserva registrada! Posição na fila: {posicao}.")
+
+    @rastreado("acervo.reserva_alocada")
+    def reserva_alocada(self, usuario, obra) -> bool:
+        """
+        Verifica se há um exemplar da obra separado para o usuário.
+
+        Args:
+            usuario (Usuario): Usuário a verificar.
+            obra (Obra): Obra reservada.
+
+        Returns:
+            bool: True se houver um exemplar aguardando a retirada.
+        """
+        conn = self.backend.conectar()
+        cur = conn.cursor()
+        alocada = reservas.possui_reserva_alocada(cur, obra.ident, usuario.ident)
+        cur.close()
+        conn.close()
+        return alocada
+
     def valor_multa(self, emprestimo: Emprestimo, data_ref: date) -> float:
         """
         Calcula o valor da multa com base nos dias de atraso.
@@ -339,11 +713,15 @@ class Acervo:
         atraso = emprestimo.dias_atraso(data_ref)
         return float(atraso)
 
+    @rastreado("acervo.relatorio_inventario")
     def relatorio_inventario(self) -> Table:
         """
         Gera uma tabela formatada com todas as obras cadastradas no banco de dados
         e suas quantidades disponíveis em estoque.
 
+        O resultado da consulta fica em cache até que alguma escrita altere
+        as obras.
+
         Returns:
             Table: Tabela formatada com dados das obras.
         """
@@ -356,65 +734,185 @@ class Acervo:
         tabela.add_column("Disponível", justify="right", style="yellow")
 
         try:
-            conn = conectar()
-            cur = conn.cursor()
-
-            cur.execute("""
-                SELECT titulo, autor, ano, categoria, quantidade, quantidade_disponivel
-                FROM obras
-                ORDER BY titulo;
-            """)
-
-            resultados = cur.fetchall()
+            resultados = cache_relatorios.obter(
+                "inventario", ("obras",), self._consultar_inventario, self._conectar_leitura
+            )
             for titulo, autor, ano, categoria, quantidade, quantidade_disponivel in resultados:
                 tabela.add_row(titulo, autor, str(ano), categoria, str(quantidade), str(quantidade_disponivel))
 
         except Exception as e:
             print(f"Erro ao gerar relatório: {e}")
 
-        finally:
-            cur.close()
-            conn.close()
-
         return tabela
 
+    def _conectar_leitura(self):
+        """Conexão usada pelos relatórios em cache (versões e dados)."""
+        return self.backend.conectar("leitura")
+
+    @rastreado("acervo.consultar_inventario")
+    def _consultar_inventario(self, cur):
+        """
+        Consulta as obras para o relatório de inventário.
+
+        Args:
+            cur (cursor): Cursor da conexão em que as versões foram lidas.
+
+        Returns:
+            list[tuple]: Linhas (titulo, autor, ano, categoria, quantidade, quantidade_disponivel).
+        """
+        cur.execute(SQL_INVENTARIO)
+        return cur.fetchall()
+
+    @rastreado("acervo.relatorio_debitos")
     def relatorio_debitos(self) -> Table:
         """
-        Gera uma tabela com os usuários que devolveram obras com atraso,
-        mostrando a multa (R$5 por dia de atraso).
+        Gera uma tabela com os usuários que têm saldo devedor de multas
+        (R$5 por dia de atraso), lido da tabela de saldos mantida por
+        debitos.py.
+
+        O resultado da consulta fica em cache até que algum saldo ou
+        usuário seja alterado.
         """
         tabela = Table(title="Usuários com Débitos (Multa por Atraso)")
         tabela.add_column("Usuário", style="yellow")
         tabela.add_column("Multa (R$)", justify="right", style="red")
 
         try:
-            conn = conectar()
-            cur = conn.cursor()
+            resultados = cache_relatorios.obter(
+                "debitos", ("saldos", "usuarios"), self._consultar_debitos, self._conectar_leitura
+            )
 
-            # Busca todos os empréstimos que já foram devolvidos e que tiveram atraso
-            cur.execute("""
-                SELECT u.nome, e.data_prev_devol, e.data_devol
-                FROM emprestimos e
-                JOIN usuarios u ON e.usuario = u.identificador
-                WHERE e.data_devol IS NOT NULL AND e.data_devol > e.data_prev_devol;
-            """)
-
-            resultados = cur.fetchall()
-
-            for nome, data_prev_devol, data_devol in resultados:
-                dias_atraso = (data_devol - data_prev_devol).days
-                multa = dias_atraso * 5.0
-                tabela.add_row(nome, f"{multa:.2f}")
+            for nome, saldo in resultados:
+                tabela.add_row(nome, f"{saldo:.2f}")
 
         except Exception as e:
             print(f"Erro ao gerar relatório de débitos: {e}")
 
+        return tabela
+
+    @rastreado("acervo.consultar_debitos")
+    def _consultar_debitos(self, cur):
+        """
+        Consulta os usuários com saldo devedor para o relatório de débitos.
+
+        Args:
+            cur (cursor): Cursor da conexão em que as versões foram lidas.
+
+        Returns:
+            list[tuple]: Linhas (nome, saldo), do maior para o menor saldo.
+        """
+        cur.execute("""
+            SELECT u.nome, s.saldo
+            FROM saldos_usuarios s
+            JOIN usuarios u ON s.usuario = u.identificador
+            WHERE s.saldo > 0
+            ORDER BY s.saldo DESC, u.nome;
+        """)
+        return cur.fetchall()
+
+
+    def registrar_pagamento(self):
+        """
+        Pergunta o usuário e o valor pago e abate o pagamento do seu saldo
+        devedor (ver ``receber_pagamento``).
+        """
+        chave = input("Nome ou cartão do usuário: ").strip()
+        texto = input("Valor pago (R$): ").strip().replace(",", ".")
+        try:
+            valor = Decimal(texto)
+        except InvalidOperation:
+            print("Valor inválido.")
+            return
+        self.receber_pagamento(chave, valor)
+
+    @rastreado("acervo.receber_pagamento")
+    def receber_pagamento(self, chave, valor):
+        """
+        Registra o pagamento de multas de um usuário, abatendo-o do saldo
+        devedor na mesma transação em que o pagamento é gravado (ver
+        debitos.registrar_pagamento).
+
+        Args:
+            chave (str | int): Nome ou número do cartão do usuário.
+            valor (Decimal): Valor pago, em reais.
+
+        Returns:
+            Decimal | None: Saldo restante, ou None se o pagamento foi recusado.
+        """
+        conn = self.backend.conectar()
+        cur = conn.cursor()
+        try:
+            try:
+                resultado = resolver_usuario(cur, chave)
+            except UsuarioAmbiguo as e:
+                print(f"Usuário ambíguo: {e}.")
+                return None
+            if not resultado:
+                print("Usuário não encontrado.")
+                return None
+
+            try:
+                restante = debitos.registrar_pagamento(cur, resultado[0], valor)
+            except ValueError as e:
+                print(f"Pagamento recusado: {e}.")
+                conn.rollback()
+                return None
+            cache_relatorios.invalidar(cur, "saldos")
+            conn.commit()
+            print(f"Pagamento registrado. Saldo restante: R$ {restante:.2f}.")
+            return restante
+        except Exception as e:
+            print(f"Erro: {e}")
+            conn.rollback()
+            return None
         finally:
-            if cur: cur.close()
-            if conn: conn.close()
+            cur.close()
+            conn.close()
 
-        return tabela
+    @rastreado("acervo.relatorio_atrasos")
+    def relatorio_atrasos(self, data_ref: date = None) -> Table:
+        """
+        Gera uma tabela com os empréstimos em aberto que estão atrasados,
+        lida do resumo mantido pelo job diário de atrasos (atrasos.py).
 
+        Args:
+            data_ref (date): Data usada para calcular os dias de atraso. Padrão: hoje.
+
+        Returns:
+            Table: Tabela com usuário, obra, data prevista e dias de atraso.
+        """
+        data_ref = data_ref or date.today()
+        tabela = Table(title="Empréstimos em Atraso")
+        tabela.add_column("Usuário", style="yellow")
+        tabela.add_column("Obra", style="cyan")
+        tabela.add_column("Prev. Devolução", justify="center")
+        tabela.add_column("Dias de atraso", justify="right", style="red")
+
+        try:
+            conn = self.backend.conectar("leitura")
+            cur = conn.cursor()
+            try:
+                cur.execute("""
+                    SELECT u.nome, o.titulo, a.data_prev_devol
+                    FROM atrasos a
+                    JOIN usuarios u ON u.identificador = a.usuario
+                    JOIN obras o ON o.identificador = a.obra
+                    ORDER BY a.data_prev_devol;
+                """)
+                for nome, titulo, prev_devol in cur.fetchall():
+                    tabela.add_row(
+                        nome,
+                        titulo,
+                        prev_devol.strftime("%d/%m/%Y"),
+                        str((data_ref - prev_devol).days)
+                    )
+            finally:
+                cur.close()
+                conn.close()
+        except Exception as e:
+            print(f"Erro ao gerar relatório de atrasos: {e}")
+
+        return tabela
 
     def _valida_obra(self, obra):
         """
@@ -429,6 +927,7 @@ class Acervo:
         if not isinstance(obra, Obra):
             raise TypeError(f"Esperado Obra, mas veio {type(obra).__name__}")
 
+    @rastreado("acervo.historico_usuario")
     def historico_usuario(self, usuario):
 
         tabela = Table(title=f"Histórico de Empréstimos - {usuario.nome}")
@@ -440,28 +939,13 @@ class Acervo:
         tabela.add_column("Situação", justify="center", style="magenta")
 
         try:
-            conn = conectar()
+            conn = self.backend.conectar("leitura")
             cur = conn.cursor()
 
-            cur.execute("""
-                SELECT e.identificador, o.titulo, e.data_retirada, e.data_prev_devol, e.data_devol
-                FROM emprestimos e
-                JOIN obras o ON o.identificador = e.obra
-                WHERE e.usuario = %s
-                ORDER BY e.data_retirada DESC
-            """, (str(usuario.ident),))  # <- aqui usamos o UUID, não o objeto
+            cur.execute(SQL_HISTORICO, (usuario.ident,))  # <- aqui usamos o UUID, não o objeto
 
             for row in cur.fetchall():
-                emp_id, titulo, retirada, prev_devol, devolucao = row
-                status = "Devolvido" if devolucao else "Pendente"
-                tabela.add_row(
-                    str(emp_id),
-                    titulo,
-                    retirada.strftime("%d/%m/%Y"),
-                    prev_devol.strftime("%d/%m/%Y"),
-                    devolucao.strftime("%d/%m/%Y") if devolucao else "-",
-                    status
-                )
+                tabela.add_row(*self._formatar_historico(row))
 
         except Exception as e:
             print(f"Erro ao gerar histórico: {e}")
@@ -470,59 +954,141 @@ class Acervo:
             conn.close()
 
         return tabela
-    
+
+    def _formatar_historico(self, row):
+        """Converte uma linha do histórico nos textos exibidos na tabela."""
+        emp_id, titulo, retirada, prev_devol, devolucao = row
+        status = "Devolvido" if devolucao else "Pendente"
+        return (
+            str(emp_id),
+            titulo,
+            retirada.strftime("%d/%m/%Y"),
+            prev_devol.strftime("%d/%m/%Y"),
+            devolucao.strftime("%d/%m/%Y") if devolucao else "-",
+            status
+        )
+
+    def navegar_historico(self, usuario):
+        """
+        Exibe o histórico de empréstimos do usuário página por página,
+        buscando as linhas do banco sob demanda.
+
+        Args:
+            usuario (Usuario): Usuário cujo histórico será exibido.
+        """
+        conn = self.backend.conectar("leitura")
+        cur = conn.cursor(name="historico_usuario")
+        try:
+            cur.execute(SQL_HISTORICO, (usuario.ident,))
+            VisualizadorPaginado(
+                f"Histórico de Empréstimos - {usuario.nome}",
+                [("ID", {"justify": "center"}),
+                 ("Título", {"style": "cyan"}),
+                 ("Data Retirada", {"justify": "center"}),
+                 ("Data Prev. Devolução", {"justify": "center"}),
+                 ("Data Devolução", {"justify": "center"}),
+                 ("Situação", {"justify": "center", "style": "magenta"})],
+                cur,
+                formatar=self._formatar_historico,
+            ).navegar()
+        except Exception as e:
+            print(f"Erro ao gerar histórico: {e}")
+        finally:
+            cur.close()
+            conn.close()
+
+    def navegar_inventario(self):
+        """Exibe o relatório de inventário página por página."""
+        try:
+            linhas = cache_relatorios.obter("inventario", ("obras",), self._consultar_inventario,
+                                            self._conectar_leitura)
+        except Exception as e:
+            print(f"Erro ao gerar relatório: {e}")
+            return
+        VisualizadorPaginado(
+            "Inventário do Acervo",
+            [("Título", {"justify": "left", "style": "cyan", "no_wrap": True}),
+             ("Autor", {"style": "magenta"}),
+             ("Ano", {"justify": "center", "style": "green"}),
+             ("Categoria", {"justify": "left", "style": "blue"}),
+             ("Quantidade", {"justify": "right", "style": "yellow"}),
+             ("Disponível", {"justify": "right", "style": "yellow"})],
+            linhas,
+        ).navegar()
+
+    def navegar_debitos(self):
+        """Exibe o relatório de débitos página por página."""
+        try:
+            linhas = cache_relatorios.obter("debitos", ("saldos", "usuarios"), self._consultar_debitos,
+                                            self._conectar_leitura)
+        except Exception as e:
+            print(f"Erro ao gerar relatório de débitos: {e}")
+            return
+        VisualizadorPaginado(
+            "Usuários com Débitos (Multa por Atraso)",
+            [("Usuário", {"style": "yellow"}),
+             ("Multa (R$)", {"justify": "right", "style": "red"})],
+            linhas,
+            formatar=lambda linha: (linha[0], f"{linha[1]:.2f}"),
+        ).navegar()
+
+    @rastreado("acervo.salvar_usuario")
     def salvar_usuario(self, usuario):
         """
-        Salva uma instância de usuário no banco de dados.
+        Salva uma instância de usuário no banco de dados e preenche o
+        número do cartão gerado para ele.
 
         Args:
             usuario (Usuario): Objeto usuário contendo os dados a serem salvos.
         """
-        conn = conectar()
+        conn = self.backend.conectar()
         cur = conn.cursor()
         cur.execute("""
             INSERT INTO usuarios (identificador, nome, email)
             VALUES (%s, %s, %s);
         """, (
-            str(usuario.ident),
+            usuario.ident,
             usuario.nome,
             usuario.email
         ))
+        # O número do cartão é gerado pelo banco
+        cur.execute("SELECT cartao FROM usuarios WHERE identificador = %s;", (usuario.ident,))
+        usuario.cartao = cur.fetchone()[0]
+        cache_relatorios.invalidar(cur, "usuarios")
         conn.commit()
         cur.close()
         conn.close()
         print("Usuário salvo com sucesso!")
 
-    def deletar_user(self,id_user):
+    @rastreado("acervo.deletar_user")
+    def deletar_user(self, id_user, forcar: bool = False):
         """
-        Remove um usuário do banco de dados pelo seu identificador.
+        Remove um usuário do banco de dados pelo seu identificador, junto com
+        suas reservas, saldo e empréstimos, em lotes (ver expurgo.py).
 
         Args:
-            id_user (str): Identificador único do usuário a ser removido.
+            id_user (UUID): Identificador único do usuário a ser removido.
+            forcar (bool): Remove mesmo com empréstimos em aberto ou saldo devedor.
+
+        Raises:
+            ExpurgoRecusado: Se o usuário tiver empréstimos em aberto ou saldo
+                devedor e forcar for False.
         """
-        conn = conectar()
-        cur = conn.cursor()
-        cur.execute("""
-            DELETE FROM usuarios WHERE identificador = %s;
-        """, (str(id_user),))
-        conn.commit()
-        cur.close()
-        conn.close()
+        Expurgo(self.backend).usuario(id_user, forcar)
         print("Usuário excluído com sucesso.")
 
-    def deletar_emprestimos(self, id_obra):
+    @rastreado("acervo.deletar_emprestimos")
+    def deletar_emprestimos(self, id_obra, forcar: bool = False):
         """
-        Remove todos os empréstimos relacionados a uma obra específica.
+        Remove todos os empréstimos relacionados a uma obra específica, em
+        lotes (ver expurgo.py).
 
         Args:
-            id_obra (str): Identificador único da obra cujos empréstimos serão removidos.
+            id_obra (UUID): Identificador único da obra cujos empréstimos serão removidos.
+            forcar (bool): Remove também os empréstimos em aberto.
+
+        Raises:
+            ExpurgoRecusado: Se houver empréstimos em aberto e forcar for False.
         """
-        conn = conectar()
-        cur = conn.cursor()
-        cur.execute("""
-            DELETE FROM emprestimos WHERE obra = %s;
-        """, (str(id_obra),))
-        conn.commit()
-        cur.close()
-        conn.close()
-        print("Empréstimos da obra excluídos com sucesso.")
\ No newline at end of file
+        Expurgo(self.backend).emprestimos_obra(id_obra, forcar)
+        print("Empréstimos da obra excluídos com sucesso.")
@@ -0,0 +1,384 @@
+import os
+import sys
+from datetime import date
+from decimal import Decimal
+from connect import conectar, tipo_identificador
+from cache import cache_relatorios
+
+# Multa cobrada por dia de atraso, em reais
+MULTA_DIARIA = 5
+
+# Saldo devedor a partir do qual novos empréstimos são recusados. Abaixo
+# dele, um saldo positivo só gera um aviso no balcão.
+LIMITE_DEBITO = Decimal(os.getenv("ACERVO_LIMITE_DEBITO", "50"))
+
+# Linha de controle_jobs com a data da última execução do job de atrasos
+# (atrasos.NOME_JOB; não importado porque atrasos.py importa este módulo)
+NOME_JOB_ATRASOS = "atrasos"
+
+# Lançamentos que o saldo de cada usuário deve somar, calculados só a partir
+# do histórico (ver reconciliar); também semeiam saldos_usuarios em bancos
+# que já tinham empréstimos quando a tabela foi criada
+LANCAMENTOS = """
+    job AS (
+        SELECT marca_dagua FROM controle_jobs WHERE nome = %(job)s
+    ), lancamentos AS (
+        SELECT usuario,
+               GREATEST(data_devol - data_prev_devol, 0) * %(multa)s AS valor
+        FROM emprestimos_todos
+        WHERE data_devol IS NOT NULL
+        UNION ALL
+        SELECT e.usuario,
+               GREATEST(job.marca_dagua - e.data_prev_devol, 0) * %(multa)s
+        FROM emprestimos e, job
+        WHERE e.data_devol IS NULL AND e.atrasado_desde IS NOT NULL
+        UNION ALL
+        SELECT usuario, valor FROM movimentos_saldo
+    )
+"""
+
+
+def criar_estrutura(cur):
+    """
+    Cria a tabela de saldos devedores por usuário, a coluna que registra
+    quantos dias de atraso de cada empréstimo em aberto já foram cobrados e
+    a tabela ``movimentos_saldo``, com os lançamentos que não vêm do
+    histórico de empréstimos (pagamentos e multas de empréstimos apagados
+    pelo expurgo).
+
+    O saldo é mantido incrementalmente: o job diário de atrasos acrescenta
+    os dias de atraso acumulados desde a última execução e a devolução
+    acrescenta o restante, de forma que consultar o saldo de um usuário é
+    uma busca pela chave primária.
+
+    Quando a tabela de saldos é criada em um banco que já tem histórico, os
+    saldos são semeados uma única vez a partir dele (ver ``_semear_saldos``).
+    Depende das estruturas de atrasos.py e arquivamento.py.
+
+    Args:
+        cur (cursor): Cursor de uma conexão aberta.
+    """
+    tipo = tipo_identificador(cur)
+    cur.execute("SELECT to_regclass('saldos_usuarios') IS NULL;")
+    nova = cur.fetchone()[0]
+    cur.execute(f"""
+        CREATE TABLE IF NOT EXISTS saldos_usuarios (
+            usuario {tipo} PRIMARY KEY,
+            saldo NUMERIC(10, 2) NOT NULL DEFAULT 0,
+            atualizado_em TIMESTAMP NOT NULL DEFAULT now()
+        );
+        ALTER TABLE atrasos ADD COLUMN IF NOT EXISTS dias_cobrados INTEGER NOT NULL DEFAULT 0;
+
+        CREATE TABLE IF NOT EXISTS movimentos_saldo (
+            id SERIAL PRIMARY KEY,
+            usuario {tipo} NOT NULL,
+            tipo TEXT NOT NULL,
+            valor NUMERIC(10, 2) NOT NULL,
+            criado_em TIMESTAMP NOT NULL DEFAULT now()
+        );
+        CREATE INDEX IF NOT EXISTS idx_movimentos_saldo_usuario ON movimentos_saldo (usuario);
+    """)
+    if nova:
+        _semear_saldos(cur)
+
+
+def _semear_saldos(cur):
+    """
+    Preenche a tabela de saldos recém-criada com os saldos calculados a
+    partir do histórico, como ``reconciliar`` faria, e alinha
+    ``atrasos.dias_cobrados`` à última execução do job de atrasos, para que
+    ele não volte a cobrar os dias já incluídos.
+
+    Args:
+        cur (cursor): Cursor da transação que criou a tabela.
+    """
+    parametros = {"job": NOME_JOB_ATRASOS, "multa": MULTA_DIARIA}
+    cur.execute(f"""
+        WITH {LANCAMENTOS}
+        INSERT INTO saldos_usuarios (usuario, saldo)
+        SELECT usuario, SUM(valor) FROM lancamentos
+        GROUP BY usuario
+        HAVING SUM(valor) <> 0;
+    """, parametros)
+    cur.execute("""
+        UPDATE atrasos a
+           SET dias_cobrados = GREATEST(j.marca_dagua - e.data_prev_devol, 0)
+          FROM emprestimos e, controle_jobs j
+         WHERE e.identificador = a.emprestimo
+           AND j.nome = %(job)s;
+    """, parametros)
+
+
+def lancar(cur, id_usuario, dias):
+    """
+    Soma ao saldo do usuário a multa de ``dias`` dias de atraso.
+
+    Args:
+        cur (cursor): Cursor da transação em andamento.
+        id_usuario (UUID): Identificador do usuário.
+        dias (int): Dias cobrados; um valor negativo estorna a multa.
+    """
+    cur.execute("""
+        INSERT INTO saldos_usuarios (usuario, saldo)
+        VALUES (%s, %s)
+        ON CONFLICT (usuario) DO UPDATE
+            SET saldo = saldos_usuarios.saldo + EXCLUDED.saldo,
+                atualizado_em = now();
+    """, (id_usuario, dias * MULTA_DIARIA))
+
+
+def acumular_atrasos(cur, hoje: date) -> int:
+    """
+    Cobra, para cada empréstimo em aberto no resumo de atrasos, os dias de
+    atraso decorridos desde a última cobrança, em um único comando que só
+    percorre a tabela ``atrasos``.
+
+    Args:
+        cur (cursor): Cursor da transação do job de atrasos.
+        hoje (date): Data de referência.
+
+    Returns:
+        int: Quantidade de usuários cujo saldo aumentou.
+    """
+    cur.execute("""
+        WITH cobrados AS (
+            UPDATE atrasos a
+               SET dias_cobrados = n.dias
+              FROM (SELECT emprestimo, dias_cobrados AS antes,
+                           %(hoje)s::date - data_prev_devol AS dias
+                      FROM atrasos) n
+             WHERE a.emprestimo = n.emprestimo AND n.dias > n.antes
+            RETURNING a.usuario, n.dias - n.antes AS novos
+        )
+        INSERT INTO saldos_usuarios (usuario, saldo)
+        SELECT usuario, SUM(novos) * %(multa)s FROM cobrados GROUP BY usuario
+        ON CONFLICT (usuario) DO UPDATE
+            SET saldo = saldos_usuarios.saldo + EXCLUDED.saldo,
+                atualizado_em = now();
+    """, {"hoje": hoje, "multa": MULTA_DIARIA})
+    return cur.rowcount
+
+
+def registrar_devolucao(cur, id_emprestimo, data_devol: date):
+    """
+    Lança no saldo do usuário os dias de atraso da devolução que ainda não
+    foram cobrados pelo job diário. Deve ser chamada na transação da
+    devolução, antes de o empréstimo sair do resumo de atrasos.
+
+    Args:
+        cur (cursor): Cursor da transação da devolução.
+        id_emprestimo (UUID): Identificador do empréstimo devolvido.
+        data_devol (date): Data da devolução.
+    """
+    cur.execute("""
+        SELECT e.usuario, e.data_prev_devol, COALESCE(a.dias_cobrados, 0)
+        FROM emprestimos e
+        LEFT JOIN atrasos a ON a.emprestimo = e.identificador
+        WHERE e.identificador = %s;
+    """, (id_emprestimo,))
+    linha = cur.fetchone()
+    if linha is None:
+        return
+    id_usuario, data_prev_devol, cobrados = linha
+    dias = max(0, (data_devol - data_prev_devol).days) - cobrados
+    if dias:
+        lancar(cur, id_usuario, dias)
+
+
+def estornar_atraso(cur, id_emprestimo):
+    """
+    Estorna os dias já cobrados de um empréstimo em aberto que foi renovado:
+    a multa passa a ser calculada a partir da nova data prevista.
+
+    Args:
+        cur (cursor): Cursor da transação da renovação.
+        id_emprestimo (UUID): Identificador do empréstimo renovado.
+    """
+    cur.execute("SELECT usuario, dias_cobrados FROM atrasos WHERE emprestimo = %s;",
+                (id_emprestimo,))
+    linha = cur.fetchone()
+    if linha and linha[1]:
+        lancar(cur, linha[0], -linha[1])
+
+
+def registrar_movimento(cur, id_usuario, tipo, valor):
+    """
+    Grava em ``movimentos_saldo`` um lançamento que não vem do histórico de
+    empréstimos, sem alterar o saldo (quem chama decide se o altera).
+
+    Args:
+        cur (cursor): Cursor da transação em andamento.
+        id_usuario (UUID): Identificador do usuário.
+        tipo (str): "pagamento" ou "expurgo".
+        valor (Decimal): Valor em reais; negativo para pagamentos.
+    """
+    cur.execute("INSERT INTO movimentos_saldo (usuario, tipo, valor) VALUES (%s, %s, %s);",
+                (id_usuario, tipo, valor))
+
+
+def registrar_pagamento(cur, id_usuario, valor) -> Decimal:
+    """
+    Abate um pagamento do saldo do usuário e o registra em
+    ``movimentos_saldo``, para que a conferência com o histórico
+    (``reconciliar``) continue fechando. A linha do saldo fica travada até
+    o fim da transação, então dois pagamentos simultâneos não abatem mais
+    do que o devido.
+
+    Args:
+        cur (cursor): Cursor da transação do pagamento.
+        id_usuario (UUID): Identificador do usuário.
+        valor (Decimal): Valor pago, em reais.
+
+    Returns:
+        Decimal: Saldo restante.
+
+    Raises:
+        ValueError: Se o valor não for positivo ou passar do saldo devedor.
+    """
+    valor = Decimal(str(valor)).quantize(Decimal("0.01"))
+    if valor <= 0:
+        raise ValueError("o valor do pagamento deve ser positivo")
+    cur.execute("SELECT saldo FROM saldos_usuarios WHERE usuario = %s FOR UPDATE;", (id_usuario,))
+    linha = cur.fetchone()
+    devido = Decimal(str(linha[0])) if linha else Decimal(0)
+    if valor > devido:
+        raise ValueError(f"o pagamento de R$ {valor:.2f} passa do débito de R$ {devido:.2f}")
+    registrar_movimento(cur, id_usuario, "pagamento", -valor)
+    cur.execute("""
+        UPDATE saldos_usuarios SET saldo = saldo - %s, atualizado_em = now()
+        WHERE usuario = %s;
+    """, (valor, id_usuario))
+    return devido - valor
+
+
+def saldo(cur, id_usuario) -> Decimal:
+    """
+    Retorna o saldo devedor do usuário.
+
+    Args:
+        cur (cursor): Cursor de uma conexão aberta.
+        id_usuario (UUID): Identificador do usuário.
+
+    Returns:
+        Decimal: Saldo em reais (zero se o usuário não tiver débitos).
+    """
+    cur.execute("SELECT saldo FROM saldos_usuarios WHERE usuario = %s;", (id_usuario,))
+    linha = cur.fetchone()
+    return Decimal(str(linha[0])) if linha else Decimal(0)
+
+
+def verificar_debito(cur, id_usuario) -> bool:
+    """
+    Verifica no balcão se o usuário pode pegar obras emprestadas, avisando
+    quando há saldo devedor.
+
+    Args:
+        cur (cursor): Cursor de uma conexão aberta.
+        id_usuario (UUID): Identificador do usuário.
+
+    Returns:
+        bool: False se o saldo ultrapassa ACERVO_LIMITE_DEBITO.
+    """
+    devido = saldo(cur, id_usuario)
+    if devido > LIMITE_DEBITO:
+        print(f"Empréstimo bloqueado: débito de R$ {devido:.2f} "
+              f"(limite R$ {LIMITE_DEBITO:.2f}).")
+        return False
+    if devido > 0:
+        print(f"Atenção: o usuário tem débito de R$ {devido:.2f}.")
+    return True
+
+
+def reconciliar(corrigir: bool = False) -> int:
+    """
+    Confere os saldos com o histórico de empréstimos (ativos e arquivados)
+    em uma única passada. O saldo esperado de cada usuário é calculado só a
+    partir das datas: a multa dos empréstimos devolvidos com atraso, a dos
+    empréstimos em aberto já marcados como atrasados até a data da última
+    execução do job de atrasos, e os movimentos de ``movimentos_saldo``
+    (pagamentos e multas de empréstimos expurgados). O contador ``atrasos.dias_cobrados``, usado para manter
+    o saldo, não entra na conta. As divergências são lidas por um cursor
+    nomeado, sem carregar o histórico na memória.
+
+    A leitura é feita em uma transação REPEATABLE READ. A correção soma a
+    diferença encontrada ao saldo atual, preservando lançamentos feitos
+    durante a conferência, e realinha ``dias_cobrados`` dos empréstimos em
+    aberto desses usuários, para que o job não volte a cobrar errado. Ela
+    trava a linha do job em ``controle_jobs`` e desiste se o job tiver
+    rodado depois da conferência.
+
+    Args:
+        corrigir (bool): Se True, ajusta os saldos divergentes.
+
+    Returns:
+        int: Quantidade de usuários com saldo divergente.
+    """
+    conn = conectar()
+    conn.set_session(isolation_level="REPEATABLE READ")
+    cur = conn.cursor(name="reconciliacao_saldos")
+    cur.itersize = 5000
+    divergencias = []
+    try:
+        cur.execute(f"""
+            WITH {LANCAMENTOS}, esperado AS (
+                SELECT usuario, SUM(valor) AS valor FROM lancamentos GROUP BY usuario
+            )
+            SELECT COALESCE(x.usuario, s.usuario), COALESCE(x.valor, 0), COALESCE(s.saldo, 0),
+                   (SELECT marca_dagua FROM job)
+            FROM esperado x
+            FULL JOIN saldos_usuarios s ON s.usuario = x.usuario
+            WHERE COALESCE(x.valor, 0) <> COALESCE(s.saldo, 0)
+            ORDER BY 1;
+        """, {"job": NOME_JOB_ATRASOS, "multa": MULTA_DIARIA})
+        marca_dagua = None
+        for id_usuario, esperado, atual, marca_dagua in cur:
+            print(f"{id_usuario}: saldo R$ {atual:.2f}, esperado R$ {esperado:.2f}")
+            divergencias.append((id_usuario, esperado - atual))
+        cur.close()
+        conn.commit()
+
+        if corrigir and divergencias:
+            cur = conn.cursor()
+            cur.execute("SELECT marca_dagua FROM controle_jobs WHERE nome = %s FOR UPDATE;",
+                        (NOME_JOB_ATRASOS,))
+            linha = cur.fetchone()
+            if (linha[0] if linha else None) != marca_dagua:
+                print("O job de atrasos rodou durante a conferência; execute-a novamente.")
+                conn.rollback()
+                return len(divergencias)
+            if marca_dagua is not None:
+                cur.execute("""
+                    UPDATE atrasos a
+                       SET dias_cobrados = GREATEST(%s - e.data_prev_devol, 0)
+                      FROM emprestimos e
+                     WHERE e.identificador = a.emprestimo
+                       AND a.usuario = ANY(%s);
+                """, (marca_dagua, [id_usuario for id_usuario, _ in divergencias]))
+            for id_usuario, diferenca in divergencias:
+                cur.execute("""
+                    INSERT INTO saldos_usuarios (usuario, saldo)
+                    VALUES (%s, %s)
+                    ON CONFLICT (usuario) DO UPDATE
+                        SET saldo = saldos_usuarios.saldo + EXCLUDED.saldo,
+                            atualizado_em = now();
+                """, (id_usuario, diferenca))
+            cache_relatorios.invalidar(cur, "saldos")
+            conn.commit()
+        return len(divergencias)
+    except Exception:
+        conn.rollback()
+        raise
+    finally:
+        cur.close()
+        conn.close()
+
+
+if __name__ == "__main__":
+    corrigir = "--corrigir" in sys.argv
+    divergentes = reconciliar(corrigir=corrigir)
+    if not divergentes:
+        print("Todos os saldos conferem com o histórico de empréstimos.")
+    elif corrigir:
+        print(f"{divergentes} saldo(s) corrigido(s).")
+    else:
+        print(f"{divergentes} saldo(s) divergente(s); use --corrigir para ajustá-los.")
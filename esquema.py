@@ -0,0 +1,48 @@
+from connect import conectar
+import cache
+import atrasos
+import debitos
+import analises
+import arquivamento
+import reservas
+import snapshot
+import fila_offline
+import usuarios
+from migrar_uuid import colunas_pendentes
+
+
+def preparar_banco():
+    """
+    Cria, se ainda não existirem, as tabelas e índices auxiliares usados
+    pelos módulos do sistema. Pode ser executado a cada inicialização.
+    """
+    conn = conectar()
+    cur = conn.cursor()
+    try:
+        # Buscas de obras por título sem diferenciar maiúsculas (balcão e carrinho)
+        cur.execute("CREATE INDEX IF NOT EXISTS idx_obras_titulo ON obras (lower(titulo));")
+        cache.criar_estrutura(cur)
+        atrasos.criar_estrutura(cur)
+        analises.criar_estrutura(cur)
+        arquivamento.criar_estrutura(cur)
+        debitos.criar_estrutura(cur)
+        reservas.criar_estrutura(cur)
+        snapshot.criar_estrutura(cur)
+        fila_offline.criar_estrutura(cur)
+        usuarios.criar_estrutura(cur)
+        conn.commit()
+        pendentes = colunas_pendentes(cur)
+        if pendentes:
+            print("Aviso: identificadores ainda em texto nas tabelas "
+                  f"{', '.join(pendentes)}; execute 'python migrar_uuid.py'.")
+    except Exception:
+        conn.rollback()
+        raise
+    finally:
+        cur.close()
+        conn.close()
+
+
+if __name__ == "__main__":
+    preparar_banco()
+    print("Estrutura do banco de dados atualizada.")
@@ -0,0 +1,491 @@
+import contextlib
+import io
+import sys
+import threading
+import time
+from datetime import date, timedelta
+from functools import partial
+from uuid import uuid4
+from armazenamento import backend_padrao
+from cache import cache_relatorios
+import debitos
+import reservas
+
+# Linhas apagadas por transação e espera entre os lotes, em segundos
+TAMANHO_LOTE = 1000
+PAUSA = 0.01
+
+
+class ExpurgoRecusado(Exception):
+    """Remoção recusada por empréstimos em aberto ou débitos pendentes."""
+
+
+class MedicaoTravas:
+    """
+    Tempo em que cada lote de um expurgo manteve suas linhas travadas, do
+    primeiro comando da transação até o commit.
+    """
+
+    def __init__(self):
+        self.duracoes = []
+        self.linhas = 0
+
+    def registrar(self, segundos, linhas):
+        self.duracoes.append(segundos)
+        self.linhas += linhas
+
+    def resumo(self) -> str:
+        """Texto com a quantidade de lotes e os tempos médio, p95 e máximo."""
+        if not self.duracoes:
+            return "Nenhum lote executado."
+        ordenadas = sorted(self.duracoes)
+        p95 = ordenadas[min(len(ordenadas) - 1, int(len(ordenadas) * 0.95))]
+        media = sum(ordenadas) / len(ordenadas)
+        return (f"{len(ordenadas)} lote(s), {self.linhas} linha(s); travas: "
+                f"média {media * 1000:.1f} ms, p95 {p95 * 1000:.1f} ms, "
+                f"máxima {ordenadas[-1] * 1000:.1f} ms")
+
+
+class Expurgo:
+    """
+    Remoção de obras, usuários e empréstimos em lotes curtos.
+
+    As linhas dependentes são apagadas em transações de até
+    ``tamanho_lote`` linhas, para que nenhuma transação trave boa parte de
+    ``emprestimos`` por muito tempo; só a última transação, curta, apaga o
+    registro principal. A cascata é explícita e não depende de chaves
+    estrangeiras:
+
+    - obra: reservas e empréstimos (ativos e arquivados) da obra, com seus
+      atrasos e lembretes
+    - usuário: reservas, lembretes, saldo e empréstimos (ativos e
+      arquivados) do usuário, com seus atrasos
+    - empréstimos de uma obra: os empréstimos, com seus atrasos e lembretes
+
+    Apagar um empréstimo não perdoa a multa que ele gerou: o saldo do
+    usuário fica como está e a multa é registrada em ``movimentos_saldo``,
+    para que a conferência com o histórico continue fechando (ver
+    debitos.reconciliar). Por padrão a remoção é recusada se houver
+    empréstimos em aberto (e, para usuários, saldo devedor); a conferência
+    é feita antes do primeiro lote, de forma que uma remoção recusada não
+    apaga nada. Com ``forcar=True`` os exemplares desses empréstimos voltam
+    ao estoque, ou à fila de reservas, antes de serem apagados.
+    """
+
+    def __init__(self, backend=None, tamanho_lote: int = TAMANHO_LOTE,
+                 pausa: float = PAUSA):
+        """
+        Args:
+            backend: Backend de armazenamento. Padrão: o de ACERVO_BACKEND.
+            tamanho_lote (int): Máximo de linhas apagadas por transação.
+            pausa (float): Segundos de espera entre os lotes.
+        """
+        self.backend = backend or backend_padrao
+        self.tamanho_lote = tamanho_lote
+        self.pausa = pausa
+        self.medicao = MedicaoTravas()
+
+    def _em_lotes(self, conn, descricao, apagar):
+        """
+        Repete ``apagar(cur)`` em transações separadas até que ele não
+        apague mais nada, mostrando o progresso.
+
+        Returns:
+            int: Total de linhas apagadas.
+        """
+        cur = conn.cursor()
+        total = 0
+        try:
+            while True:
+                inicio = time.perf_counter()
+                apagadas = apagar(cur)
+                conn.commit()
+                self.medicao.registrar(time.perf_counter() - inicio, apagadas)
+                if not apagadas:
+                    break
+                total += apagadas
+                print(f"\r{descricao}: {total} linha(s) apagada(s)", end="", flush=True)
+                time.sleep(self.pausa)
+        finally:
+            cur.close()
+        if total:
+            print()
+        return total
+
+    def _apagar_lote(self, cur, tabela, coluna, valor):
+        """Apaga até ``tamanho_lote`` linhas de ``tabela`` com ``coluna = valor``."""
+        cur.execute(f"""
+            DELETE FROM {tabela}
+            WHERE {coluna} = %s
+              AND id IN (SELECT id FROM {tabela} WHERE {coluna} = %s LIMIT %s);
+        """, (valor, valor, self.tamanho_lote))
+        return cur.rowcount
+
+    def _apagar_lote_emprestimos(self, cur, tabela, coluna, valor, devolver):
+        """
+        Apaga um lote de empréstimos, seus atrasos e lembretes, registrando
+        em ``movimentos_saldo`` as multas que eles geraram (o saldo não muda).
+
+        Args:
+            cur (cursor): Cursor da transação do lote.
+            tabela (str): "emprestimos" ou "emprestimos_arquivo".
+            coluna (str): "obra" ou "usuario".
+            valor (UUID): Identificador da obra ou do usuário.
+            devolver (bool): Devolve ao estoque os exemplares dos empréstimos em aberto.
+
+        Returns:
+            int: Quantidade de empréstimos apagados.
+        """
+        cur.execute(f"""
+            SELECT e.id, e.identificador, e.obra, e.usuario, e.data_prev_devol,
+                   e.data_devol, COALESCE(a.dias_cobrados, 0)
+            FROM {tabela} e
+            LEFT JOIN atrasos a ON a.emprestimo = e.identificador
+            WHERE e.{coluna} = %s
+            LIMIT %s
+            FOR UPDATE OF e;
+        """, (valor, self.tamanho_lote))
+        lote = cur.fetchall()
+        if not lote:
+            return 0
+
+        ids = [linha[0] for linha in lote]
+        identificadores = [linha[1] for linha in lote]
+        multas = {}
+        abertos = []
+        for _, _, id_obra, id_usuario, data_prev_devol, data_devol, cobrados in lote:
+            if data_devol is None:
+                dias = cobrados
+                abertos.append(id_obra)
+            else:
+                dias = max(0, (data_devol - data_prev_devol).days)
+            if dias:
+                multas[id_usuario] = multas.get(id_usuario, 0) + dias
+
+        for id_usuario, dias in multas.items():
+            debitos.registrar_movimento(cur, id_usuario, "expurgo", dias * debitos.MULTA_DIARIA)
+        cur.execute("DELETE FROM lembretes_outbox WHERE emprestimo = ANY(%s);", (identificadores,))
+        cur.execute("DELETE FROM atrasos WHERE emprestimo = ANY(%s);", (identificadores,))
+        cur.execute(f"DELETE FROM {tabela} WHERE {coluna} = %s AND id = ANY(%s);", (valor, ids))
+        if devolver:
+            for id_obra in abertos:
+                reservas.liberar_exemplar(cur, id_obra)
+        cache_relatorios.invalidar(cur, "emprestimos", "obras", "saldos")
+        return len(lote)
+
+    def _apagar_emprestimos(self, conn, coluna, valor, devolver):
+        """Apaga em lotes os empréstimos ativos e arquivados da obra ou do usuário."""
+        for tabela in ("emprestimos", "emprestimos_arquivo"):
+            self._em_lotes(conn, tabela, partial(
+                self._apagar_lote_emprestimos, tabela=tabela, coluna=coluna,
+                valor=valor, devolver=devolver,
+            ))
+
+    def _verificar(self, cur, coluna, valor, forcar, verificar_saldo=False):
+        """
+        Recusa a remoção se houver empréstimos em aberto (ou saldo devedor)
+        e ``forcar`` for False.
+
+        Raises:
+            ExpurgoRecusado: Com o motivo da recusa.
+        """
+        if forcar:
+            return
+        cur.execute(f"SELECT COUNT(*) FROM emprestimos WHERE {coluna} = %s AND data_devol IS NULL;",
+                    (valor,))
+        abertos = cur.fetchone()[0]
+        if abertos:
+            raise ExpurgoRecusado(f"há {abertos} empréstimo(s) em aberto")
+        if verificar_saldo:
+            devido = debitos.saldo(cur, valor)
+            if devido > 0:
+                raise ExpurgoRecusado(f"há saldo devedor de R$ {devido:.2f}")
+
+    def _finalizar(self, conn, tabela, coluna, valor, comandos, dominios):
+        """
+        Última transação do expurgo: trava o registro principal, apaga os
+        empréstimos que surgiram durante os lotes e executa os comandos
+        finais. A recusa já foi decidida por ``_verificar`` antes do
+        primeiro lote; recusar aqui deixaria o expurgo pela metade.
+        """
+        cur = conn.cursor()
+        inicio = time.perf_counter()
+        try:
+            cur.execute(f"SELECT 1 FROM {tabela} WHERE identificador = %s FOR UPDATE;", (valor,))
+            while self._apagar_lote_emprestimos(cur, "emprestimos", coluna, valor, coluna == "usuario"):
+                pass
+            for sql in comandos:
+                cur.execute(sql, (valor,))
+            cache_relatorios.invalidar(cur, *dominios)
+            conn.commit()
+            self.medicao.registrar(time.perf_counter() - inicio, 1)
+        finally:
+            cur.close()
+
+    def obra(self, id_obra, forcar: bool = False):
+        """
+        Remove uma obra e tudo o que depende dela.
+
+        Args:
+            id_obra (UUID): Identificador da obra.
+            forcar (bool): Remove mesmo com empréstimos em aberto.
+
+        Raises:
+            ExpurgoRecusado: Se houver empréstimos em aberto e forcar for False.
+        """
+        conn = self.backend.conectar()
+        try:
+            cur = conn.cursor()
+            self._verificar(cur, "obra", id_obra, forcar)
+            cur.close()
+            conn.rollback()
+
+            self._apagar_emprestimos(conn, "obra", id_obra, devolver=False)
+            self._em_lotes(conn, "reservas", partial(
+                self._apagar_lote, tabela="reservas", coluna="obra", valor=id_obra))
+            self._finalizar(conn, "obras", "obra", id_obra, [
+                "DELETE FROM reservas WHERE obra = %s;",
+                "DELETE FROM obras WHERE identificador = %s;",
+            ], ("obras",))
+        except Exception:
+            conn.rollback()
+            raise
+        finally:
+            conn.close()
+
+    def usuario(self, id_usuario, forcar: bool = False):
+        """
+        Remove um usuário e tudo o que depende dele.
+
+        Args:
+            id_usuario (UUID): Identificador do usuário.
+            forcar (bool): Remove mesmo com empréstimos em aberto ou saldo devedor.
+
+        Raises:
+            ExpurgoRecusado: Se houver empréstimos em aberto ou saldo devedor
+                e forcar for False.
+        """
+        conn = self.backend.conectar()
+        try:
+            cur = conn.cursor()
+            self._verificar(cur, "usuario", id_usuario, forcar, verificar_saldo=True)
+            cur.close()
+            conn.rollback()
+
+            self._apagar_emprestimos(conn, "usuario", id_usuario, devolver=True)
+            for tabela in ("reservas", "lembretes_outbox"):
+                self._em_lotes(conn, tabela, partial(
+                    self._apagar_lote, tabela=tabela, coluna="usuario", valor=id_usuario))
+            self._finalizar(conn, "usuarios", "usuario", id_usuario, [
+                "DELETE FROM reservas WHERE usuario = %s;",
+                "DELETE FROM lembretes_outbox WHERE usuario = %s;",
+                "DELETE FROM atrasos WHERE usuario = %s;",
+                "DELETE FROM saldos_usuarios WHERE usuario = %s;",
+                "DELETE FROM movimentos_saldo WHERE usuario = %s;",
+                "DELETE FROM usuarios WHERE identificador = %s;",
+            ], ("usuarios", "saldos"))
+        except Exception:
+            conn.rollback()
+            raise
+        finally:
+            conn.close()
+
+    def emprestimos_obra(self, id_obra, forcar: bool = False):
+        """
+        Remove todos os empréstimos (ativos e arquivados) de uma obra.
+
+        Args:
+            id_obra (UUID): Identificador da obra.
+            forcar (bool): Remove também os empréstimos em aberto, devolvendo
+                os exemplares ao estoque.
+
+        Raises:
+            ExpurgoRecusado: Se houver empréstimos em aberto e forcar for False.
+        """
+        conn = self.backend.conectar()
+        try:
+            cur = conn.cursor()
+            self._verificar(cur, "obra", id_obra, forcar)
+            cur.close()
+            conn.rollback()
+            self._apagar_emprestimos(conn, "obra", id_obra, devolver=forcar)
+        except Exception:
+            conn.rollback()
+            raise
+        finally:
+            conn.close()
+
+    def usuarios_inativos(self, anos: int, forcar: bool = False):
+        """
+        Remove os usuários sem empréstimos em aberto cuja última retirada ou
+        devolução foi há mais de ``anos`` anos. Usuários sem nenhum
+        empréstimo não são considerados, pois não há como saber desde quando
+        estão cadastrados.
+
+        Args:
+            anos (int): Anos sem movimentação.
+            forcar (bool): Remove também os usuários com saldo devedor.
+
+        Returns:
+            tuple[int, int]: Usuários removidos e usuários mantidos por débito.
+        """
+        limite = date.today() - timedelta(days=round(365.25 * anos))
+        conn = self.backend.conectar("leitura")
+        cur = conn.cursor()
+        try:
+            cur.execute("""
+                SELECT usuario
+                FROM emprestimos_todos
+                GROUP BY usuario
+                HAVING MAX(COALESCE(data_devol, data_retirada)) < %s
+                   AND SUM(CASE WHEN data_devol IS NULL THEN 1 ELSE 0 END) = 0;
+            """, (limite,))
+            inativos = [linha[0] for linha in cur.fetchall()]
+        finally:
+            cur.close()
+            conn.close()
+
+        removidos = mantidos = 0
+        for i, id_usuario in enumerate(inativos, 1):
+            try:
+                self.usuario(id_usuario, forcar)
+                removidos += 1
+            except ExpurgoRecusado:
+                mantidos += 1
+            print(f"\rUsuários: {i}/{len(inativos)}", end="", flush=True)
+        if inativos:
+            print()
+        return removidos, mantidos
+
+
+def _resumo_tempos(duracoes) -> str:
+    """Texto com a quantidade de operações e os tempos médio, p95 e máximo."""
+    if not duracoes:
+        return "nenhuma operação"
+    ordenadas = sorted(duracoes)
+    p95 = ordenadas[min(len(ordenadas) - 1, int(len(ordenadas) * 0.95))]
+    media = sum(ordenadas) / len(ordenadas)
+    return (f"{len(ordenadas)} operação(ões): média {media * 1000:.1f} ms, "
+            f"p95 {p95 * 1000:.1f} ms, máxima {ordenadas[-1] * 1000:.1f} ms")
+
+
+def medir(backend=None, emprestimos: int = 20000, balcoes: int = 4,
+          tamanho_lote: int = TAMANHO_LOTE):
+    """
+    Mede o expurgo de um usuário com ``emprestimos`` empréstimos enquanto
+    ``balcoes`` threads fazem empréstimos das mesmas obras, como em um
+    horário de movimento. Mostra o tempo em que cada lote manteve as linhas
+    travadas e o tempo dos empréstimos do balcão antes e durante o expurgo:
+    com lotes curtos, os empréstimos quase não ficam mais lentos.
+
+    Os dados da medição são criados com um prefixo próprio e removidos ao
+    final; ainda assim, aponte DB_DSN_ESCRITA para um banco de testes.
+
+    Args:
+        backend: Backend de armazenamento. Padrão: o de ACERVO_BACKEND.
+        emprestimos (int): Empréstimos do usuário expurgado.
+        balcoes (int): Threads fazendo empréstimos durante o expurgo.
+        tamanho_lote (int): Máximo de linhas apagadas por transação.
+
+    Returns:
+        tuple[MedicaoTravas, list[float], list[float]]: Travas do expurgo e
+        durações, em segundos, dos empréstimos antes e durante o expurgo.
+    """
+    from core import Acervo
+    from models import Obra, Usuario, Emprestimo
+
+    backend = backend or backend_padrao
+    prefixo = f"expurgo-{uuid4().hex[:8]}"
+    lista_obras = [(uuid4(), f"{prefixo} obra {n}") for n in range(20)]
+    alvo = (uuid4(), f"{prefixo} expurgado")
+    lista_balcoes = [(uuid4(), f"{prefixo} balcão {n}") for n in range(balcoes)]
+    ids_usuarios = [alvo[0]] + [ident for ident, _ in lista_balcoes]
+    hoje = date.today()
+
+    conn = backend.conectar()
+    cur = conn.cursor()
+    backend.inserir_lote(cur, "INSERT INTO usuarios (identificador, nome) VALUES %s;",
+                         [alvo] + lista_balcoes)
+    backend.inserir_lote(cur, """
+        INSERT INTO obras (identificador, titulo, quantidade, quantidade_disponivel) VALUES %s;
+    """, [(ident, titulo, 10**6, 10**6) for ident, titulo in lista_obras])
+    # Um em cada cem empréstimos do usuário expurgado fica em aberto, para
+    # que o expurgo devolva exemplares das obras usadas pelos balcões
+    backend.inserir_lote(cur, """
+        INSERT INTO emprestimos (identificador, obra, usuario, data_retirada, data_prev_devol, data_devol)
+        VALUES %s;
+    """, [(uuid4(), lista_obras[n % len(lista_obras)][0], alvo[0],
+           hoje - timedelta(days=30), hoje - timedelta(days=23),
+           None if n % 100 == 0 else hoje - timedelta(days=20))
+          for n in range(emprestimos)])
+    conn.commit()
+
+    acervo = Acervo(backend)
+    parar = threading.Event()
+
+    def balcao(n, duracoes, limite=None):
+        usuario = Usuario(lista_balcoes[n][1], None)
+        i = 0
+        while not parar.is_set() and (limite is None or i < limite):
+            ident, titulo = lista_obras[(n + i) % len(lista_obras)]
+            obra = Obra(titulo, None, None, None, 0, 0)
+            obra.ident = ident
+            inicio = time.perf_counter()
+            acervo.emprestar(Emprestimo(obra, usuario, hoje, hoje + timedelta(days=7)))
+            duracoes.append(time.perf_counter() - inicio)
+            i += 1
+
+    def rodar_balcoes(limite=None):
+        duracoes = []
+        threads = [threading.Thread(target=balcao, args=(n, duracoes, limite))
+                   for n in range(balcoes)]
+        for thread in threads:
+            thread.start()
+        return threads, duracoes
+
+    expurgo = Expurgo(backend, tamanho_lote=tamanho_lote)
+    try:
+        # O balcão imprime uma mensagem a cada empréstimo
+        with contextlib.redirect_stdout(io.StringIO()):
+            threads, antes = rodar_balcoes(limite=50)
+            for thread in threads:
+                thread.join()
+
+            threads, durante = rodar_balcoes()
+            try:
+                expurgo.usuario(alvo[0], forcar=True)
+            finally:
+                parar.set()
+                for thread in threads:
+                    thread.join()
+    finally:
+        conn.rollback()
+        for sql in ("DELETE FROM atrasos WHERE usuario = ANY(%s);",
+                    "DELETE FROM emprestimos WHERE usuario = ANY(%s);",
+                    "DELETE FROM saldos_usuarios WHERE usuario = ANY(%s);",
+                    "DELETE FROM movimentos_saldo WHERE usuario = ANY(%s);",
+                    "DELETE FROM usuarios WHERE identificador = ANY(%s);"):
+            cur.execute(sql, (ids_usuarios,))
+        cur.execute("DELETE FROM obras WHERE identificador = ANY(%s);",
+                    ([ident for ident, _ in lista_obras],))
+        conn.commit()
+        cur.close()
+        conn.close()
+    return expurgo.medicao, antes, durante
+
+
+if __name__ == "__main__":
+    if len(sys.argv) >= 2 and sys.argv[1] == "medir":
+        quantidade = int(sys.argv[2]) if len(sys.argv) > 2 else 20000
+        medicao, antes, durante = medir(emprestimos=quantidade)
+        print(f"Expurgo de {quantidade} empréstimo(s): {medicao.resumo()}")
+        print(f"Empréstimos do balcão antes do expurgo: {_resumo_tempos(antes)}")
+        print(f"Empréstimos do balcão durante o expurgo: {_resumo_tempos(durante)}")
+        sys.exit(0)
+    if len(sys.argv) < 3 or sys.argv[1] != "inativos":
+        print("Uso: python expurgo.py inativos <anos> [--forcar] | medir [EMPRÉSTIMOS]")
+        sys.exit(1)
+    expurgo = Expurgo()
+    removidos, mantidos = expurgo.usuarios_inativos(int(sys.argv[2]), "--forcar" in sys.argv)
+    print(f"{removidos} usuário(s) removido(s), {mantidos} mantido(s) por débito.")
+    print(expurgo.medicao.resumo())
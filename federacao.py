@@ -0,0 +1,248 @@
+import math
+import os
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor, wait
+from psycopg2.pool import ThreadedConnectionPool
+from rich.table import Table
+from core import SQL_INVENTARIO
+
+
+def filiais_configuradas():
+    """
+    Lê as filiais da variável ACERVO_FILIAIS, no formato
+    ``nome=dsn;nome=dsn`` (por exemplo
+    ``centro=postgresql://localhost/acervo_centro;norte=postgresql://localhost/acervo_norte``).
+
+    Returns:
+        dict: {nome_da_filial: dsn}
+    """
+    filiais = {}
+    for item in os.getenv("ACERVO_FILIAIS", "").split(";"):
+        if "=" in item:
+            nome, dsn = item.split("=", 1)
+            filiais[nome.strip()] = dsn.strip()
+    return filiais
+
+
+class Federacao:
+    """
+    Consulta o acervo de várias filiais, cada uma com seu próprio banco
+    MINI_ACERVO, em paralelo.
+
+    Mantém um pool de conexões por filial e distribui as consultas em uma
+    thread por filial. Filiais que não respondem dentro do tempo limite
+    são relatadas como falhas, sem atrasar o resultado das demais. A
+    abertura de conexão também respeita o tempo limite (connect_timeout),
+    para que uma filial inalcançável não prenda a thread indefinidamente.
+
+    Pools e threads duram o processo inteiro: use a instância compartilhada
+    ``federacao_padrao`` em vez de criar uma a cada consulta.
+    """
+
+    def __init__(self, filiais: dict = None, tempo_limite: float = 5.0,
+                 conexoes_por_filial: int = 4):
+        """
+        Args:
+            filiais (dict): {nome: dsn}. Padrão: lido de ACERVO_FILIAIS.
+            tempo_limite (float): Segundos de espera por filial.
+            conexoes_por_filial (int): Tamanho máximo do pool de cada filial.
+        """
+        self.filiais = filiais if filiais is not None else filiais_configuradas()
+        self.tempo_limite = tempo_limite
+        # Pools com mínimo zero: uma filial fora do ar não impede a criação
+        self.pools = {
+            nome: ThreadedConnectionPool(0, conexoes_por_filial, dsn,
+                                         connect_timeout=max(1, math.ceil(tempo_limite)))
+            for nome, dsn in self.filiais.items()
+        }
+        self._executor = ThreadPoolExecutor(
+            max_workers=max(1, len(self.filiais) * conexoes_por_filial)
+        )
+
+    def _consultar(self, filial, sql, parametros):
+        """Executa uma consulta em uma filial usando uma conexão do seu pool."""
+        pool = self.pools[filial]
+        conn = pool.getconn()
+        try:
+            cur = conn.cursor()
+            # Garante que o servidor também desista da consulta após o tempo limite
+            cur.execute("SET statement_timeout = %s;", (int(self.tempo_limite * 1000),))
+            cur.execute(sql, parametros)
+            linhas = cur.fetchall()
+            cur.close()
+            conn.rollback()
+            return linhas
+        except Exception:
+            conn.rollback()
+            raise
+        finally:
+            pool.putconn(conn)
+
+    def _distribuir(self, sql, parametros=()):
+        """
+        Executa a mesma consulta em todas as filiais, em paralelo.
+
+        Returns:
+            tuple[dict, dict]: ({filial: linhas}, {filial: motivo da falha})
+        """
+        futuros = {
+            self._executor.submit(self._consultar, filial, sql, parametros): filial
+            for filial in self.pools
+        }
+        concluidos, pendentes = wait(futuros, timeout=self.tempo_limite)
+
+        resultados, falhas = {}, {}
+        for futuro in concluidos:
+            filial = futuros[futuro]
+            try:
+                resultados[filial] = futuro.result()
+            except Exception as e:
+                falhas[filial] = str(e).strip()
+        for futuro in pendentes:
+            futuro.cancel()
+            falhas[futuros[futuro]] = "tempo esgotado"
+        return resultados, falhas
+
+    def buscar_disponibilidade(self, titulo):
+        """
+        Procura uma obra pelo título em todas as filiais.
+
+        Args:
+            titulo (str): Título a procurar (sem diferenciar maiúsculas/minúsculas).
+
+        Returns:
+            tuple[list, dict]: Linhas (filial, titulo, autor, quantidade_disponivel)
+            ordenadas por filial, e as falhas por filial.
+        """
+        resultados, falhas = self._distribuir("""
+            SELECT titulo, autor, quantidade_disponivel
+            FROM obras
+            WHERE LOWER(titulo) = LOWER(%s);
+        """, (titulo,))
+        linhas = sorted(
+            ((filial, titulo_db, autor, disponivel)
+             for filial, encontrados in resultados.items()
+             for titulo_db, autor, disponivel in encontrados),
+            key=lambda linha: (linha[0], linha[1], linha[2] or ""),
+        )
+        return linhas, falhas
+
+    def inventario(self):
+        """
+        Junta o inventário de todas as filiais. Obras com o mesmo título e
+        autor são agrupadas e têm as quantidades somadas.
+
+        Returns:
+            tuple[list, dict]: Linhas (titulo, autor, ano, categoria, quantidade,
+            quantidade_disponivel, filiais) ordenadas por título, e as falhas por filial.
+        """
+        resultados, falhas = self._distribuir(SQL_INVENTARIO)
+        agrupado = {}
+        for filial, linhas in resultados.items():
+            for titulo, autor, ano, categoria, quantidade, disponivel in linhas:
+                # Obras sem autor cadastrado são agrupadas só pelo título
+                chave = (titulo.lower(), (autor or "").lower())
+                if chave not in agrupado:
+                    agrupado[chave] = [titulo, autor, ano, categoria, 0, 0, []]
+                item = agrupado[chave]
+                item[4] += quantidade
+                item[5] += disponivel
+                item[6].append(filial)
+        linhas = [tuple(agrupado[chave]) for chave in sorted(agrupado)]
+        return linhas, falhas
+
+    def relatorio_inventario(self) -> Table:
+        """
+        Gera a tabela do inventário consolidado da rede de filiais.
+
+        Returns:
+            Table: Tabela formatada com as obras de todas as filiais.
+        """
+        linhas, falhas = self.inventario()
+        tabela = Table(title="Inventário da Rede de Filiais")
+        tabela.add_column("Título", justify="left", style="cyan", no_wrap=True)
+        tabela.add_column("Autor", style="magenta")
+        tabela.add_column("Ano", justify="center", style="green")
+        tabela.add_column("Categoria", justify="left", style="blue")
+        tabela.add_column("Quantidade", justify="right", style="yellow")
+        tabela.add_column("Disponível", justify="right", style="yellow")
+        tabela.add_column("Filiais", style="white")
+        for titulo, autor, ano, categoria, quantidade, disponivel, filiais in linhas:
+            tabela.add_row(titulo, autor, str(ano), categoria, str(quantidade),
+                           str(disponivel), ", ".join(sorted(filiais)))
+        if falhas:
+            tabela.caption = "Sem resposta: " + ", ".join(
+                f"{filial} ({motivo})" for filial, motivo in sorted(falhas.items())
+            )
+        return tabela
+
+    def fechar(self):
+        """Encerra as threads e fecha as conexões de todas as filiais."""
+        self._executor.shutdown(wait=False, cancel_futures=True)
+        for pool in self.pools.values():
+            pool.closeall()
+
+
+def medir(repeticoes: int = 5, titulo: str = ""):
+    """
+    Compara, nas filiais de ACERVO_FILIAIS, o tempo de cada filial
+    consultada sozinha com o tempo da consulta distribuída: em paralelo, o
+    total deve ficar perto da filial mais lenta, e não da soma de todas.
+    Mede o inventário e a busca por título (com conexões já abertas nos
+    pools, como no uso normal do menu).
+
+    Args:
+        repeticoes (int): Execuções de cada medição; é mostrado o melhor tempo.
+        titulo (str): Título usado na busca de disponibilidade.
+    """
+    federacao = Federacao()
+    consultas = {
+        "inventário": (SQL_INVENTARIO, ()),
+        "busca por título": ("""
+            SELECT titulo, autor, quantidade_disponivel
+            FROM obras
+            WHERE LOWER(titulo) = LOWER(%s);
+        """, (titulo,)),
+    }
+
+    def melhor_tempo(funcao):
+        melhor = None
+        for _ in range(repeticoes):
+            inicio = time.perf_counter()
+            funcao()
+            decorrido = time.perf_counter() - inicio
+            melhor = decorrido if melhor is None else min(melhor, decorrido)
+        return melhor * 1000
+
+    try:
+        for nome, (sql, parametros) in consultas.items():
+            # Aquece os pools para não medir a abertura das conexões
+            federacao._distribuir(sql, parametros)
+            soma = 0.0
+            for filial in federacao.pools:
+                try:
+                    tempo = melhor_tempo(lambda: federacao._consultar(filial, sql, parametros))
+                except Exception as e:
+                    print(f"{nome:<18} {filial:<16} falhou: {str(e).strip()}")
+                    continue
+                soma += tempo
+                print(f"{nome:<18} {filial:<16} {tempo:>9.1f} ms")
+            paralelo = melhor_tempo(lambda: federacao._distribuir(sql, parametros))
+            print(f"{nome:<18} {'soma das filiais':<16} {soma:>9.1f} ms")
+            print(f"{nome:<18} {'em paralelo':<16} {paralelo:>9.1f} ms")
+    finally:
+        federacao.fechar()
+
+
+# Instância compartilhada pelo menu: os pools de conexões e as threads são
+# reaproveitados entre as consultas, em vez de recriados a cada uma
+federacao_padrao = Federacao()
+
+
+if __name__ == "__main__":
+    if len(sys.argv) > 1 and sys.argv[1] == "medir":
+        medir(titulo=" ".join(sys.argv[2:]))
+    else:
+        print("Uso: python federacao.py medir [TÍTULO]")
+        sys.exit(1)
@@ -0,0 +1,380 @@
+import json
+import os
+import sqlite3
+import sys
+import tempfile
+import time
+from datetime import date, timedelta
+from uuid import UUID, uuid4
+from armazenamento import backend_padrao, BackendSQLite, ErroBanco, lista_valores
+from cache import cache_relatorios
+from core import Acervo
+import debitos
+import reservas
+from usuarios import resolver_usuarios, UsuarioAmbiguo
+
+# Arquivo local da fila e operações reaplicadas por transação
+ARQUIVO_FILA = os.getenv("ACERVO_FILA_OFFLINE", "fila_offline.db")
+TAMANHO_LOTE = 200
+
+TIPOS = ("emprestimo", "devolucao", "renovacao")
+
+ESQUEMA_FILA = """
+    CREATE TABLE IF NOT EXISTS operacoes (
+        seq INTEGER PRIMARY KEY AUTOINCREMENT,
+        id TEXT NOT NULL UNIQUE,
+        tipo TEXT NOT NULL,
+        dados TEXT NOT NULL,
+        registrada_em TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP,
+        situacao TEXT NOT NULL DEFAULT 'pendente',
+        motivo TEXT
+    );
+    CREATE INDEX IF NOT EXISTS idx_operacoes_pendentes
+        ON operacoes (seq) WHERE situacao = 'pendente';
+"""
+
+
+def criar_estrutura(cur):
+    """
+    Cria no banco central a tabela que registra as operações de balcão já
+    reaplicadas a partir de filas offline. Gravar a operação nessa tabela
+    na mesma transação do seu efeito garante que reenviar a fila (depois de
+    uma queda no meio da sincronização, por exemplo) não aplica nada duas
+    vezes.
+
+    Args:
+        cur (cursor): Cursor de uma conexão aberta.
+    """
+    from connect import tipo_identificador
+    tipo = tipo_identificador(cur)
+    cur.execute(f"""
+        CREATE TABLE IF NOT EXISTS operacoes_aplicadas (
+            id {tipo} PRIMARY KEY,
+            tipo TEXT NOT NULL,
+            aplicada_em TIMESTAMP NOT NULL DEFAULT now()
+        );
+    """)
+
+
+class Conflito(Exception):
+    """Operação da fila que não pode ser aplicada ao estado atual do banco."""
+
+
+def _emprestimo_aberto(cur, id_usuario, id_obra):
+    """
+    Empréstimo em aberto mais antigo do usuário para a obra, travado:
+    (id, identificador).
+    """
+    cur.execute("""
+        SELECT id, identificador FROM emprestimos
+        WHERE usuario = %s AND obra = %s AND data_devol IS NULL
+        ORDER BY data_prev_devol, id
+        LIMIT 1
+        FOR UPDATE;
+    """, (id_usuario, id_obra))
+    linha = cur.fetchone()
+    if linha is None:
+        raise Conflito("nenhum empréstimo em aberto da obra para o usuário")
+    return linha
+
+
+def _aplicar_emprestimo(cur, dados, id_usuario, id_obra):
+    # O exemplar já saiu do balcão: se o usuário está bloqueado por débito
+    # ou não há reserva nem estoque, a operação vai para conferência em vez
+    # de passar por cima do bloqueio ou deixar o estoque negativo
+    devido = debitos.saldo(cur, id_usuario)
+    if devido > debitos.LIMITE_DEBITO:
+        raise Conflito(f"usuário bloqueado por débito de R$ {devido:.2f} "
+                       f"(limite R$ {debitos.LIMITE_DEBITO:.2f})")
+    if not reservas.retirar_exemplar(cur, id_obra, id_usuario):
+        raise Conflito("nenhum exemplar disponível no estoque")
+    cur.execute("""
+        INSERT INTO emprestimos (identificador, obra, usuario, data_retirada, data_prev_devol)
+        VALUES (%s, %s, %s, %s, %s);
+    """, (UUID(dados["emprestimo"]), id_obra, id_usuario,
+          date.fromisoformat(dados["data_retirada"]),
+          date.fromisoformat(dados["data_prev_devol"])))
+
+
+def _aplicar_devolucao(cur, dados, id_usuario, id_obra):
+    _, identificador = _emprestimo_aberto(cur, id_usuario, id_obra)
+    Acervo._registrar_devolucoes(cur, [identificador], date.fromisoformat(dados["data_devol"]))
+
+
+def _aplicar_renovacao(cur, dados, id_usuario, id_obra):
+    id_emprestimo, _ = _emprestimo_aberto(cur, id_usuario, id_obra)
+    Acervo._renovar_emprestimo(cur, id_emprestimo, date.fromisoformat(dados["data_prev_devol"]))
+
+
+_APLICAR = {
+    "emprestimo": _aplicar_emprestimo,
+    "devolucao": _aplicar_devolucao,
+    "renovacao": _aplicar_renovacao,
+}
+
+
+class FilaOffline:
+    """
+    Fila local e durável de operações de balcão (empréstimos, devoluções e
+    renovações) registradas enquanto o banco central está fora do ar.
+
+    A fila é um arquivo SQLite no próprio balcão, gravado com
+    ``synchronous=FULL``: uma operação confirmada ao atendente sobrevive a
+    uma queda de energia. Cada operação recebe um identificador gerado no
+    balcão, e o empréstimo, o seu próprio identificador, de forma que a
+    reaplicação é idempotente (ver ``criar_estrutura``).
+
+    A sincronização reaplica a fila em ordem, em transações de até
+    ``tamanho_lote`` operações. Usuários e obras de cada lote são buscados
+    com uma consulta para cada tabela (ver usuarios.resolver_usuarios), e
+    cada operação roda dentro de um SAVEPOINT: uma operação em conflito
+    (sem exemplar no estoque, sem empréstimo em aberto para devolver,
+    usuário ou obra inexistentes, nome de usuário ambíguo) é desfeita
+    sozinha e fica marcada para conferência, sem impedir as demais.
+    """
+
+    def __init__(self, caminho: str = ARQUIVO_FILA):
+        """
+        Args:
+            caminho (str): Arquivo SQLite da fila. Só é criado no primeiro uso.
+        """
+        self.caminho = caminho
+        self._conn = None
+
+    def _local(self):
+        if self._conn is None:
+            self._conn = sqlite3.connect(self.caminho, timeout=30)
+            self._conn.execute("PRAGMA journal_mode = WAL;")
+            self._conn.execute("PRAGMA synchronous = FULL;")
+            self._conn.executescript(ESQUEMA_FILA)
+        return self._conn
+
+    def registrar(self, tipo: str, dados: dict) -> str:
+        """
+        Grava uma operação na fila.
+
+        Args:
+            tipo (str): "emprestimo", "devolucao" ou "renovacao".
+            dados (dict): Nome ou cartão do usuário, título da obra e datas (ISO).
+                Empréstimos levam também o identificador gerado no balcão.
+
+        Returns:
+            str: Identificador da operação.
+        """
+        if tipo not in TIPOS:
+            raise ValueError(f"Tipo de operação desconhecido: {tipo}")
+        id_operacao = str(uuid4())
+        conn = self._local()
+        with conn:
+            conn.execute("INSERT INTO operacoes (id, tipo, dados) VALUES (?, ?, ?);",
+                         (id_operacao, tipo, json.dumps(dados)))
+        return id_operacao
+
+    def pendentes(self) -> int:
+        """Quantidade de operações ainda não sincronizadas."""
+        if self._conn is None and not os.path.exists(self.caminho):
+            return 0
+        return self._local().execute(
+            "SELECT COUNT(*) FROM operacoes WHERE situacao = 'pendente';").fetchone()[0]
+
+    def conflitos(self):
+        """
+        Operações que não puderam ser aplicadas.
+
+        Returns:
+            list[tuple]: (registrada_em, tipo, dados, motivo) de cada operação.
+        """
+        if self._conn is None and not os.path.exists(self.caminho):
+            return []
+        linhas = self._local().execute("""
+            SELECT registrada_em, tipo, dados, motivo FROM operacoes
+            WHERE situacao = 'conflito' ORDER BY seq;
+        """).fetchall()
+        return [(registrada, tipo, json.loads(dados), motivo)
+                for registrada, tipo, dados, motivo in linhas]
+
+    def _proximo_lote(self, tamanho_lote):
+        linhas = self._local().execute("""
+            SELECT id, tipo, dados FROM operacoes
+            WHERE situacao = 'pendente' ORDER BY seq LIMIT ?;
+        """, (tamanho_lote,)).fetchall()
+        return [(id_operacao, tipo, json.loads(dados)) for id_operacao, tipo, dados in linhas]
+
+    @staticmethod
+    def _resolver(cur, lote):
+        """
+        Usuários do lote, por cartão ou nome, e identificadores das obras,
+        pelo título digitado (sem os espaços das pontas). Os títulos são
+        comparados em minúsculas pelo lower() do banco, como no índice
+        idx_obras_titulo.
+        """
+        usuarios = resolver_usuarios(cur, list({dados["usuario"] for _, _, dados in lote}))
+        titulos = list({dados["titulo"].strip() for _, _, dados in lote})
+        cur.execute(f"""
+            SELECT titulos.column1, o.identificador
+            FROM {lista_valores(len(titulos))} AS titulos
+            JOIN obras o ON LOWER(o.titulo) = LOWER(titulos.column1);
+        """, titulos)
+        return usuarios, dict(cur.fetchall())
+
+    def _aplicar_lote(self, cur, lote):
+        """
+        Aplica um lote na transação do cursor.
+
+        Returns:
+            list[tuple[str, str | None, str]]: (situação, motivo, id) de cada
+            operação, no formato do UPDATE da fila local.
+        """
+        usuarios, obras = self._resolver(cur, lote)
+        situacoes = []
+        for id_operacao, tipo, dados in lote:
+            cur.execute("SAVEPOINT operacao;")
+            try:
+                encontrados = usuarios[dados["usuario"]]
+                id_obra = obras.get(dados["titulo"].strip())
+                if not encontrados:
+                    raise Conflito(f"usuário '{dados['usuario']}' não encontrado")
+                if len(encontrados) > 1:
+                    raise Conflito(str(UsuarioAmbiguo(dados["usuario"],
+                                                      [linha[3] for linha in encontrados])))
+                id_usuario = encontrados[0][0]
+                if id_obra is None:
+                    raise Conflito(f"obra '{dados['titulo']}' não encontrada")
+                cur.execute("""
+                    INSERT INTO operacoes_aplicadas (id, tipo) VALUES (%s, %s)
+                    ON CONFLICT (id) DO NOTHING;
+                """, (UUID(id_operacao), tipo))
+                if cur.rowcount == 0:
+                    # Já aplicada por uma sincronização anterior interrompida
+                    # antes de atualizar a fila local
+                    situacoes.append(("aplicada", "repetida", id_operacao))
+                else:
+                    _APLICAR[tipo](cur, dados, id_usuario, id_obra)
+                    situacoes.append(("aplicada", None, id_operacao))
+                cur.execute("RELEASE SAVEPOINT operacao;")
+            except (Conflito, *ErroBanco) as e:
+                cur.execute("ROLLBACK TO SAVEPOINT operacao;")
+                situacoes.append(("conflito", str(e), id_operacao))
+        return situacoes
+
+    def sincronizar(self, backend=None, tamanho_lote: int = TAMANHO_LOTE) -> dict:
+        """
+        Reaplica no banco central as operações pendentes da fila.
+
+        Cada lote é confirmado no banco antes de ser marcado na fila local;
+        se a conexão cair no meio, o lote volta a ser enviado na próxima
+        sincronização e as operações já gravadas são reconhecidas como
+        repetidas.
+
+        Args:
+            backend: Backend de armazenamento. Padrão: o de ACERVO_BACKEND.
+            tamanho_lote (int): Máximo de operações por transação.
+
+        Returns:
+            dict: Operações aplicadas, repetidas e em conflito, lotes,
+            segundos decorridos e vazão (operações por segundo).
+        """
+        backend = backend or backend_padrao
+        totais = {"aplicadas": 0, "repetidas": 0, "conflitos": 0, "lotes": 0}
+        inicio = time.perf_counter()
+        local = self._local()
+        conn = backend.conectar()
+        cur = conn.cursor()
+        try:
+            while True:
+                lote = self._proximo_lote(tamanho_lote)
+                if not lote:
+                    break
+                situacoes = self._aplicar_lote(cur, lote)
+                cache_relatorios.invalidar(cur, "emprestimos", "obras", "saldos")
+                conn.commit()
+                with local:
+                    local.executemany("UPDATE operacoes SET situacao = ?, motivo = ? WHERE id = ?;",
+                                      situacoes)
+                totais["lotes"] += 1
+                for situacao, motivo, _ in situacoes:
+                    if situacao == "conflito":
+                        totais["conflitos"] += 1
+                    elif motivo == "repetida":
+                        totais["repetidas"] += 1
+                    else:
+                        totais["aplicadas"] += 1
+        except Exception:
+            conn.rollback()
+            raise
+        finally:
+            cur.close()
+            conn.close()
+
+        totais["segundos"] = time.perf_counter() - inicio
+        processadas = totais["aplicadas"] + totais["repetidas"] + totais["conflitos"]
+        totais["por_segundo"] = processadas / totais["segundos"] if totais["segundos"] else 0.0
+        return totais
+
+    def fechar(self):
+        """Fecha o arquivo da fila."""
+        if self._conn is not None:
+            self._conn.close()
+            self._conn = None
+
+
+fila_padrao = FilaOffline()
+
+
+def resumo(totais: dict) -> str:
+    """Texto com o resultado de uma sincronização."""
+    return (f"{totais['aplicadas']} aplicada(s), {totais['repetidas']} repetida(s), "
+            f"{totais['conflitos']} em conflito, em {totais['lotes']} lote(s) e "
+            f"{totais['segundos']:.2f}s ({totais['por_segundo']:.0f} op/s)")
+
+
+def medir(quantidade: int = 5000, tamanho_lote: int = TAMANHO_LOTE) -> dict:
+    """
+    Mede a vazão da sincronização com uma fila de ``quantidade`` operações
+    (metade empréstimos, metade devoluções) aplicada a um banco SQLite
+    temporário, sem tocar no banco configurado.
+
+    Returns:
+        dict: Totais da sincronização (ver FilaOffline.sincronizar).
+    """
+    with tempfile.TemporaryDirectory() as pasta:
+        backend = BackendSQLite(os.path.join(pasta, "acervo.db"))
+        backend.criar_estrutura()
+        conn = backend.conectar()
+        cur = conn.cursor()
+        usuarios = [(uuid4(), f"Usuário {i}") for i in range(500)]
+        obras = [(uuid4(), f"Obra {i}") for i in range(200)]
+        backend.inserir_lote(cur, "INSERT INTO usuarios (identificador, nome) VALUES %s;", usuarios)
+        backend.inserir_lote(cur, """
+            INSERT INTO obras (identificador, titulo, quantidade, quantidade_disponivel)
+            VALUES %s;
+        """, [(ident, titulo, 3, 3) for ident, titulo in obras])
+        conn.commit()
+        cur.close()
+        conn.close()
+
+        fila = FilaOffline(os.path.join(pasta, "fila.db"))
+        hoje = date.today()
+        for n in range(quantidade // 2):
+            dados = {"usuario": usuarios[n % len(usuarios)][1], "titulo": obras[n % len(obras)][1]}
+            fila.registrar("emprestimo", dict(dados, emprestimo=str(uuid4()),
+                                              data_retirada=hoje.isoformat(),
+                                              data_prev_devol=(hoje + timedelta(days=7)).isoformat()))
+            fila.registrar("devolucao", dict(dados, data_devol=hoje.isoformat()))
+        totais = fila.sincronizar(backend, tamanho_lote)
+        fila.fechar()
+        return totais
+
+
+if __name__ == "__main__":
+    acao = sys.argv[1] if len(sys.argv) > 1 else "sincronizar"
+    if acao == "sincronizar":
+        print(resumo(fila_padrao.sincronizar()))
+    elif acao == "conflitos":
+        for registrada, tipo, dados, motivo in fila_padrao.conflitos():
+            print(f"{registrada} {tipo} {dados['usuario']} / {dados['titulo']}: {motivo}")
+    elif acao == "medir":
+        print(resumo(medir(int(sys.argv[2]) if len(sys.argv) > 2 else 5000)))
+    else:
+        print("Uso: python fila_offline.py [sincronizar|conflitos|medir N]")
+        sys.exit(1)
@@ -1,11 +1,19 @@
 from models import Obra, Usuario, Emprestimo
 from core import Acervo
-from datetime import timedelta, date
+from datetime import timedelta, date, datetime
 import re
+from uuid import uuid4
 from rich.console import Console
 from rich.table import Table
-from connect import conectar
-import psycopg2
+from armazenamento import backend_padrao, conectar, ErroBanco, ErroConexao
+from cache import cache_relatorios
+from federacao import federacao_padrao
+from expurgo import ExpurgoRecusado
+from analises import relatorios_circulacao
+from usuarios import resolver_usuario, UsuarioAmbiguo
+from fila_offline import fila_padrao, resumo
+from visualizador import VisualizadorPaginado
+from rastreamento import rastreado, span
 
 console = Console()
 
@@ -42,6 +50,11 @@ def menu_admin():
     5 - Remover todos empréstimos de uma obra
     6 - Ver relatório do inventário
     7 - Ver relatório de débitos
+    8 - Ver empréstimos em atraso
+    9 - Consultar disponibilidade nas filiais
+    10 - Ver inventário da rede de filiais
+    11 - Ver estatísticas de circulação
+    12 - Registrar pagamento de débito
     0 - Voltar ao menu principal
     """
     acervo = Acervo()
@@ -57,6 +70,11 @@ def menu_admin():
         print("[5] Remover empréstimos de uma obra")
         print("[6] Ver relatório do inventário")
         print("[7] Ver relatório de débitos")
+        print("[8] Ver empréstimos em atraso")
+        print("[9] Consultar disponibilidade nas filiais")
+        print("[10] Ver inventário da rede de filiais")
+        print("[11] Ver estatísticas de circulação")
+        print("[12] Registrar pagamento de débito")
         print("[0] Voltar")
         opcao = input("Escolha: ")
 
@@ -72,24 +90,28 @@ def menu_admin():
             categoria = input("Categoria: ")
             qtd_disponivel = quantidade
             obra = Obra(titulo, autor, ano, categoria, quantidade, qtd_disponivel)
-            acervo += obra
-            acervo.adicionar(obra)
+            with span("menu.cadastrar_obra"):
+                acervo += obra
+                acervo.adicionar(obra)
             print(f"Obra '{titulo}' cadastrada com sucesso!")
         elif opcao == '2':
             titulo = input("Título da obra a remover: ").strip()
 
             try:
-                # Buscar obra pelo título (ignorando maiúsculas/minúsculas)
-                cur.execute("""
-                    SELECT identificador FROM obras
-                    WHERE LOWER(titulo) = LOWER(%s);
-                """, (titulo,))
-                resultado = cur.fetchone()
+                with span("menu.remover_obra"):
+                    # Buscar obra pelo título (ignorando maiúsculas/minúsculas)
+                    cur.execute("""
+                        SELECT identificador FROM obras
+                        WHERE LOWER(titulo) = LOWER(%s);
+                    """, (titulo,))
+                    resultado = cur.fetchone()
+                    if resultado:
+                        obra_id = resultado[0]
+                        recusa = tentar_expurgo(acervo.remover, obra_id)  # Remove no banco
 
                 if resultado:
-                    obra_id = resultado[0]
-                    acervo.remover(obra_id)  # Remove no banco
-                    print(f"Obra '{titulo}' removida com sucesso.")
+                    if confirmar_expurgo(recusa, acervo.remover, obra_id, "menu.remover_obra"):
+                        print(f"Obra '{titulo}' removida com sucesso.")
                 else:
                     print("Obra não encontrada.")
 
@@ -102,49 +124,56 @@ def menu_admin():
             nome = input("Nome: ")
             email = input("Email: ")
             usuario = Usuario(nome, email)
-            acervo.salvar_usuario(usuario)
-            print(f"Usuário '{nome}' cadastrado com sucesso!")
+            with span("menu.cadastrar_usuario"):
+                acervo.salvar_usuario(usuario)
+            print(f"Usuário '{nome}' cadastrado com sucesso! Cartão nº {usuario.cartao}.")
         elif opcao == '4':
-            tabela = Table(title=f"Usuários cadastrados")
-            tabela.add_column("Nome", justify="center", style="cyan")
-            tabela.add_column("Email", justify="center", style="magenta")
-
             try:
-                conn = conectar()
-                cur = conn.cursor()
+                conn = conectar("leitura")
+                cur_lista = conn.cursor(name="usuarios_cadastrados")
 
-                cur.execute(""" 
-                    SELECT nome, email FROM usuarios;
+                cur_lista.execute(""" 
+                    SELECT cartao, nome, email FROM usuarios ORDER BY nome;
                 """)
-                resultados = cur.fetchall()
+                usuarios = VisualizadorPaginado(
+                    "Usuários cadastrados",
+                    [("Cartão", {"justify": "right", "style": "yellow"}),
+                     ("Nome", {"justify": "center", "style": "cyan"}),
+                     ("Email", {"justify": "center", "style": "magenta"})],
+                    cur_lista,
+                    console=console,
+                )
 
-                if resultados:
-                    for row in resultados:
-                        nome, email = row
-                        tabela.add_row(nome, email)
-                    console.print(tabela)
+                if not usuarios.vazio():
+                    usuarios.navegar()
                 else:
                     print("Nenhum usuário cadastrado.")
+                cur_lista.close()
+                conn.close()
             except Exception as e:
                 print(f"Erro ao buscar usuários: {e}")
 
-            nome = input("Nome do usuário a remover: ").strip()
+            nome = input("Nome ou cartão do usuário a remover: ").strip()
             try:
-                # Buscar usuário por nome (ignorando letras maiusculas e minusculas)
-                cur.execute("""
-                    SELECT identificador FROM usuarios
-                    WHERE LOWER(nome) = LOWER(%s);
-                """, (nome,))
-                resultado = cur.fetchone()
-
+                # A listagem pode vir da réplica; o usuário a remover é
+                # resolvido no primário, onde o expurgo vai acontecer
+                conn = conectar()
+                cur = conn.cursor()
+                with span("menu.remover_usuario"):
+                    # Buscar usuário pelo cartão ou pelo nome (ignorando letras maiusculas e minusculas)
+                    resultado = resolver_usuario(cur, nome)
+                    if resultado:
+                        usuario_id, nome_db = resultado[0], resultado[1]
+                        recusa = tentar_expurgo(acervo.deletar_user, usuario_id)  # Remove no banco
 
                 if resultado:
-                    usuario_id = resultado[0]
-                    acervo.deletar_user(usuario_id)  # Remove no banco
-                    print(f"Usuário {nome} removido com sucesso!")
+                    if confirmar_expurgo(recusa, acervo.deletar_user, usuario_id, "menu.remover_usuario"):
+                        print(f"Usuário {nome_db} removido com sucesso!")
                 else:
                     print("Usuário não encontrado!")
 
+            except UsuarioAmbiguo as e:
+                print(f"Usuário ambíguo: {e}.")
             except Exception as e:
                 print(f"Erro ao remover usuário: {e}")
             finally:
@@ -153,18 +182,22 @@ def menu_admin():
 
         elif opcao == '5':
             titulo = input("Título da obra para remover empréstimos: ")
-            id_obra = buscar_id_obra_por_titulo(titulo)
             try:
-                cur.execute("""
-                    SELECT obra FROM emprestimos
-                    WHERE LOWER(obra) = LOWER(%s)
-                """, (id_obra,))
-                resultado = cur.fetchone()
+                with span("menu.remover_emprestimos"):
+                    id_obra = buscar_id_obra_por_titulo(titulo)
+                    cur.execute("""
+                        SELECT obra FROM emprestimos
+                        WHERE obra = %s
+                    """, (id_obra,))
+                    resultado = cur.fetchone()
+                    if resultado:
+                        emprestimo_id = resultado[0]
+                        recusa = tentar_expurgo(acervo.deletar_emprestimos, emprestimo_id)  # Remove no banco
 
                 if resultado:
-                    emprestimo_id = resultado[0]
-                    acervo.deletar_emprestimos(emprestimo_id)  # Remove no banco
-                    print(f"Emprestimos da obra {titulo} excluida com sucesso!")
+                    if confirmar_expurgo(recusa, acervo.deletar_emprestimos, emprestimo_id,
+                                         "menu.remover_emprestimos"):
+                        print(f"Emprestimos da obra {titulo} excluida com sucesso!")
                 else:
                     print("Obra não encontrada!")
                 
@@ -175,11 +208,54 @@ def menu_admin():
                 if conn: conn.close()
 
         elif opcao == '6':
-            tabela = acervo.relatorio_inventario()
-            console.print(tabela)
+            acervo.navegar_inventario()
         elif opcao == '7':
-            tabela = acervo.relatorio_debitos()
+            acervo.navegar_debitos()
+        elif opcao == '8':
+            with span("menu.relatorio_atrasos"):
+                tabela = acervo.relatorio_atrasos()
+            console.print(tabela)
+        elif opcao in ('9', '10'):
+            if not federacao_padrao.filiais:
+                print("Nenhuma filial configurada em ACERVO_FILIAIS.")
+                continue
+            federacao = federacao_padrao
+            if opcao == '9':
+                titulo = input("Título da obra: ").strip()
+                with span("menu.disponibilidade_filiais"):
+                    linhas, falhas = federacao.buscar_disponibilidade(titulo)
+                tabela = Table(title=f"Disponibilidade de '{titulo}' nas filiais")
+                tabela.add_column("Filial", style="cyan")
+                tabela.add_column("Título", style="magenta")
+                tabela.add_column("Autor")
+                tabela.add_column("Disponível", justify="right", style="yellow")
+                for filial, titulo_db, autor, disponivel in linhas:
+                    tabela.add_row(filial, titulo_db, autor, str(disponivel))
+                for filial, motivo in sorted(falhas.items()):
+                    tabela.add_row(filial, f"[red]sem resposta: {motivo}[/red]", "", "")
+            else:
+                with span("menu.inventario_filiais"):
+                    tabela = federacao.relatorio_inventario()
             console.print(tabela)
+        elif opcao == '11':
+            fim = date.today() - timedelta(days=1)
+            try:
+                texto = input("Início do período (DD/MM/AAAA, vazio = últimos 12 meses): ").strip()
+                inicio = datetime.strptime(texto, "%d/%m/%Y").date() if texto else fim - timedelta(days=365)
+                texto = input("Fim do período (DD/MM/AAAA, vazio = ontem): ").strip()
+                fim = datetime.strptime(texto, "%d/%m/%Y").date() if texto else fim
+            except ValueError:
+                print("Formato de data inválido.")
+                continue
+            try:
+                with span("menu.circulacao"):
+                    tabelas = relatorios_circulacao(inicio, fim)
+                for tabela in tabelas:
+                    console.print(tabela)
+            except ErroBanco as e:
+                print(f"Erro ao gerar estatísticas: {e}")
+        elif opcao == '12':
+            acervo.registrar_pagamento()
         elif opcao == '0':
             break
         else:
@@ -194,169 +270,287 @@ def menu_usuario():
     2 - Devolver obra
     3 - Renovar empréstimo
     4 - Ver histórico de empréstimos
+    5 - Empréstimo de vários títulos (carrinho)
+    6 - Sincronizar operações registradas sem conexão
+    7 - Devolver de uma vez todas as obras de um usuário
     0 - Voltar ao menu principal
+
+    Se o banco estiver fora do ar, empréstimos, devoluções e renovações são
+    gravados na fila offline do balcão (ver fila_offline.py).
     """
     acervo = Acervo()
+    pendentes = fila_padrao.pendentes()
+    if pendentes:
+        print(f"Há {pendentes} operação(ões) offline aguardando sincronização (opção 6).")
     while True:
         print("\n--- ÁREA DO USUÁRIO ---")
         print("[1] Realizar empréstimo")
         print("[2] Devolver obra")
         print("[3] Renovar empréstimo")
         print("[4] Ver histórico de empréstimos")
+        print("[5] Empréstimo de vários títulos (carrinho)")
+        print("[6] Sincronizar operações offline")
+        print("[7] Devolver todas as obras de um usuário")
         print("[0] Voltar")
         opcao = input("Escolha: ")
 
-        if opcao == '1':
-            nome = input("Nome do usuário: ")
-            usuario = encontrar_usuario_por_nome(nome)
-            if not usuario:
+        if opcao in ('1', '2', '3'):
+            # A conexão da própria operação decide: se ela não abrir, a
+            # operação vai para a fila offline, sem sondar o servidor antes
+            try:
+                operacao_balcao(acervo, opcao)
+            except ErroConexao:
+                registrar_offline(opcao)
+        elif opcao == '4':
+            nome = input("Nome ou cartão do usuário: ")
+            with span("menu.historico"):
+                usuario = encontrar_usuario_por_nome(nome)
+            if usuario:
+                acervo.navegar_historico(usuario)
+            else:
                 print("Usuário não encontrado.")
-                continue
-            titulo_input = input("Título da obra: ").strip()
-            obra = encontrar_obra_por_titulo_iterativo(titulo_input)
-            if not obra:
-                print("Obra não encontrada.")
+        elif opcao == '5':
+            nome = input("Nome ou cartão do usuário: ")
+            titulos = [t for t in input("Títulos das obras (separados por ';'): ").split(';') if t.strip()]
+            if not titulos:
+                print("Nenhum título informado.")
                 continue
             try:
                 dias = int(input("Quantos dias de empréstimo? "))
             except ValueError:
                 print("Digite um número válido para os dias.")
                 continue
+            tudo_ou_nada = input("Cancelar tudo se algum título falhar? (s/n): ").strip().lower() == 's'
+            with span("menu.carrinho", itens=len(titulos)):
+                usuario = encontrar_usuario_por_nome(nome)
+                if not usuario:
+                    print("Usuário não encontrado.")
+                    continue
+                try:
+                    resultados = acervo.emprestar_carrinho(usuario, titulos, dias, tudo_ou_nada)
+                except ErroBanco as e:
+                    print(f"Erro ao registrar empréstimos: {e}")
+                    continue
+                tabela = Table(title="Carrinho de Empréstimos")
+                tabela.add_column("Obra", style="cyan")
+                tabela.add_column("Situação", justify="center", style="magenta")
+                for titulo, situacao in resultados:
+                    tabela.add_row(titulo, situacao)
+                console.print(tabela)
+                emprestados = [titulo for titulo, situacao in resultados if situacao == "Emprestado"]
+                if emprestados:
+                    mostrar_sugestoes(acervo.sugestoes(titulos=emprestados))
+        elif opcao == '6':
+            if not fila_padrao.pendentes():
+                print("Nenhuma operação offline pendente.")
+                continue
+            try:
+                with span("menu.sincronizar"):
+                    totais = fila_padrao.sincronizar()
+                print(f"Sincronização concluída: {resumo(totais)}.")
+            except ErroBanco as e:
+                print(f"Banco ainda indisponível, tente mais tarde: {e}")
+                continue
+            conflitos = fila_padrao.conflitos()
+            if conflitos:
+                tabela = Table(title="Operações offline para conferência")
+                tabela.add_column("Registrada em", style="yellow")
+                tabela.add_column("Operação", style="cyan")
+                tabela.add_column("Usuário")
+                tabela.add_column("Obra", style="magenta")
+                tabela.add_column("Motivo", style="red")
+                for registrada, tipo, dados, motivo in conflitos:
+                    tabela.add_row(registrada, tipo, dados["usuario"], dados["titulo"], motivo)
+                console.print(tabela)
+        elif opcao == '7':
+            acervo.registrar_devolucao_lote()
+        elif opcao == '0':
+            break
+        else:
+            print("Opção inválida! Tente novamente.")
+
+def operacao_balcao(acervo, opcao):
+    """
+    Realiza um empréstimo, uma devolução ou uma renovação no balcão.
+
+    Args:
+        acervo (Acervo): Acervo do balcão.
+        opcao (str): Opção escolhida no menu do usuário ('1', '2' ou '3').
+
+    Raises:
+        ErroConexao: Se a primeira conexão da operação não abrir; nada foi
+            gravado e a operação pode ir para a fila offline.
+    """
+    if opcao == '2':
+        acervo.registrar_devolucao_interativa()
+        return
+    if opcao == '3':
+        acervo.renovar()
+        return
+    nome = input("Nome ou cartão do usuário: ")
+    titulo_input = input("Título da obra: ").strip()
+    try:
+        dias = int(input("Quantos dias de empréstimo? "))
+    except ValueError:
+        print("Digite um número válido para os dias.")
+        return
+    # Busca, conferência de reserva e estoque, empréstimo e sugestões
+    # formam um único span; o teclado só é lido antes e depois dele
+    with span("menu.emprestimo"):
+        usuario = encontrar_usuario_por_nome(nome)
+        if not usuario:
+            print("Usuário não encontrado.")
+            return
+        try:
+            obra = acervo.buscar_obra(titulo_input)
+        except ErroBanco as e:
+            print(f"Erro ao buscar a obra: {e}")
+            return
+        if not obra:
+            print("Obra não encontrada.")
+            return
+        reservada = acervo.reserva_alocada(usuario, obra)
+        indisponivel = not reservada and obra.quantidade_disponivel <= 0
+        if not indisponivel:
             try:
                 hoje = date.today()
                 nova_data = hoje + timedelta(days=dias)
                 emprestimo = Emprestimo(obra, usuario, hoje, nova_data)
-                acervo.emprestar(emprestimo)
-                atualizar_quantidade_obra(obra.titulo)
+                if not acervo.emprestar(emprestimo):
+                    return
                 print("Empréstimo realizado com sucesso!")
+                mostrar_sugestoes(acervo.sugestoes(idents=[obra.ident]))
             except ValueError as e:
                 print(f"Erro: {e}")
-        elif opcao == '2':
-            acervo.registrar_devolucao_interativa()
-        elif opcao == '3':
-            acervo.renovar()
-        elif opcao == '4':
-            nome = input("Nome do usuário: ")
-            usuario = encontrar_usuario_por_nome(nome)
-            if usuario:
-                acervo = Acervo()
-                tabela = acervo.historico_usuario(usuario)
-                console.print(tabela)
-            else:
-                print("Usuário não encontrado.")
-        elif opcao == '0':
-            break
-        else:
-            print("Opção inválida! Tente novamente.")
+    if indisponivel:
+        print("Obra indisponível no momento.")
+        if input("Deseja entrar na fila de reserva? (s/n): ").strip().lower() == 's':
+            try:
+                with span("menu.reserva"):
+                    acervo.reservar(usuario, obra)
+            except ErroConexao:
+                print("Banco de dados indisponível; a reserva não foi registrada.")
 
-def encontrar_usuario_por_nome(nome):
+def registrar_offline(opcao):
     """
-    Busca um usuário pelo nome no banco PostgreSQL, ignorando maiúsculas/minúsculas.
+    Registra na fila offline do balcão um empréstimo, devolução ou renovação
+    feito enquanto o banco está fora do ar. Usuário e obra são identificados
+    pelo nome (ou cartão) e pelo título, conferidos só na sincronização.
 
     Args:
-        nome (str): Nome do usuário a buscar.
+        opcao (str): Opção escolhida no menu do usuário ('1', '2' ou '3').
+    """
+    print("Banco de dados indisponível: a operação será registrada offline.")
+    dados = {
+        "usuario": input("Nome ou cartão do usuário: ").strip(),
+        "titulo": input("Título da obra: ").strip(),
+    }
+    hoje = date.today()
+    try:
+        if opcao == '1':
+            dias = int(input("Quantos dias de empréstimo? "))
+            tipo = "emprestimo"
+            dados.update(emprestimo=str(uuid4()), data_retirada=hoje.isoformat(),
+                         data_prev_devol=(hoje + timedelta(days=dias)).isoformat())
+        elif opcao == '2':
+            tipo = "devolucao"
+            data_devol = datetime.strptime(input("Data da devolução (DD/MM/AAAA): "), "%d/%m/%Y").date()
+            dados["data_devol"] = data_devol.isoformat()
+        else:
+            tipo = "renovacao"
+            nova_data = datetime.strptime(input("Nova data prevista (DD/MM/AAAA): "), "%d/%m/%Y").date()
+            dados["data_prev_devol"] = nova_data.isoformat()
+    except ValueError:
+        print("Valor inválido; operação não registrada.")
+        return
+    fila_padrao.registrar(tipo, dados)
+    print(f"Operação registrada offline ({fila_padrao.pendentes()} pendente(s)).")
+
+def mostrar_sugestoes(titulos):
+    """
+    Mostra no balcão os títulos sugeridos para o usuário.
 
-    Returns:
-        dict | None: Dicionário com os dados do usuário ou None se não existir.
+    Args:
+        titulos (list[str]): Títulos sugeridos.
     """
-    conn = conectar()
-    cur = conn.cursor()
-    cur.execute("SELECT identificador, nome, email FROM usuarios WHERE nome = %s", (nome,))
-    row = cur.fetchone()
-    cur.close()
-    conn.close()
-    if row:
-        ident, nome_db, email_db = row
-        usuario = Usuario(nome=nome_db, email=email_db)
-        usuario.ident = ident
-        return usuario
-    else:
-        return None
+    if titulos:
+        print("Quem pegou esta(s) obra(s) também pegou: " + "; ".join(titulos))
 
-def encontrar_obra_por_titulo_iterativo(titulo_busca: str):
+def tentar_expurgo(remover, ident):
     """
-    Percorre todas as linhas da tabela 'obras', compara o título
-    (ignorando maiúsculas/minúsculas) com o parâmetro 'titulo_busca'
-    e retorna um objeto Obra caso encontre.
+    Executa uma remoção do acervo sem forçá-la.
 
     Args:
-        titulo_busca (str): título a procurar.
+        remover (callable): Método de remoção do Acervo.
+        ident (UUID): Identificador do registro a remover.
 
     Returns:
-        Obra | None: a obra encontrada ou None se não existir.
+        ExpurgoRecusado | None: A recusa, se houver empréstimos em aberto ou
+        débitos; None se a remoção foi feita.
     """
-    titulo_busca = titulo_busca.strip().lower()
-
     try:
-        conn = conectar()
-        cur = conn.cursor()
-        # Busca todas as colunas necessárias de obras
-        cur.execute("""
-            SELECT identificador, titulo, autor, ano, categoria, quantidade, quantidade_disponivel
-              FROM obras;
-        """)
-        linhas = cur.fetchall()
-
-        for row in linhas:
-            id_str, titulo_db, autor, ano, categoria, quantidade, quantidade_disponivel = row
-            if titulo_db.lower() == titulo_busca:
-                return Obra(
-                    titulo=titulo_db,
-                    autor=autor,
-                    ano=ano,
-                    categoria=categoria,
-                    quantidade=quantidade,
-                    quantidade_disponivel=quantidade_disponivel
-                )
-        # não encontrou
-        return None
+        remover(ident)
+    except ExpurgoRecusado as e:
+        return e
+    return None
 
-    except psycopg2.Error as e:
-        print(f"Erro ao ler tabela de obras: {e}")
-        return None
+def confirmar_expurgo(recusa, remover, ident, operacao):
+    """
+    Depois de ``tentar_expurgo``, pergunta se uma remoção recusada deve ser
+    forçada. A pergunta fica fora do span da operação; a remoção forçada
+    abre um novo span com o mesmo nome.
 
-    finally:
-        if conn:
-            conn.close()
+    Args:
+        recusa (ExpurgoRecusado | None): Resultado de ``tentar_expurgo``.
+        remover (callable): Método de remoção do Acervo.
+        ident (UUID): Identificador do registro a remover.
+        operacao (str): Nome do span da operação de menu.
 
-def atualizar_quantidade_obra(titulo: str, quantidade_retirada: int = 1):
+    Returns:
+        bool: True se a remoção foi feita.
+    """
+    if recusa is None:
+        return True
+    print(f"Remoção recusada: {recusa}.")
+    if input("Remover mesmo assim? (s/n): ").strip().lower() != 's':
+        return False
+    with span(operacao, forcar=True):
+        remover(ident, forcar=True)
+    return True
+
+@rastreado("main.encontrar_usuario_por_nome")
+def encontrar_usuario_por_nome(nome):
     """
-    Atualiza a quantidade disponível da obra no banco de dados.
+    Busca um usuário pelo número do cartão ou pelo nome, ignorando
+    maiúsculas/minúsculas (ver usuarios.resolver_usuario).
 
     Args:
-        titulo (str): Título da obra.
-        quantidade_retirada (int): Quantidade a ser subtraída (padrão 1).
+        nome (str): Nome ou número do cartão do usuário a buscar.
+
+    Returns:
+        Usuario | None: O usuário, ou None se não existir ou se o nome
+        pertencer a mais de um usuário.
     """
+    # Vai para o primário: o resultado alimenta empréstimos e devoluções,
+    # que não podem partir de um usuário que a réplica ainda não recebeu
+    conn = conectar()
+    cur = conn.cursor()
     try:
-        conn = conectar()
-        cursor = conn.cursor()
-
-        # Verifica a quantidade atual
-        cursor.execute("""
-            SELECT quantidade_disponivel FROM obras
-            WHERE LOWER(titulo) = LOWER(%s)
-        """, (titulo,))
-        resultado = cursor.fetchone()
-
-        if resultado:
-            quantidade_atual = resultado[0]
-            nova_quantidade = quantidade_atual - quantidade_retirada
-            if nova_quantidade < 0:
-                raise ValueError("Estoque insuficiente.")
-
-            cursor.execute("""
-                UPDATE obras
-                SET quantidade_disponivel = %s
-                WHERE LOWER(titulo) = LOWER(%s)
-            """, (nova_quantidade, titulo))
-            conn.commit()
-        else:
-            print("Obra não encontrada para atualizar quantidade.")
-    except Exception as e:
-        print(f"Erro ao atualizar quantidade da obra: {e}")
+        row = resolver_usuario(cur, nome)
+    except UsuarioAmbiguo as e:
+        print(f"Usuário ambíguo: {e}.")
+        row = None
     finally:
-        if conn:
-            conn.close()
+        cur.close()
+        conn.close()
+    if row:
+        ident, nome_db, email_db, cartao = row
+        usuario = Usuario(nome=nome_db, email=email_db)
+        usuario.ident = ident
+        usuario.cartao = cartao
+        return usuario
+    else:
+        return None
 
 def validar_email(email: str) -> bool:
     """
@@ -371,6 +565,7 @@ def validar_email(email: str) -> bool:
     padrao = r'^[\w\.-]+@[\w\.-]+\.\w{2,}$'
     return bool(re.match(padrao, email))
 
+@rastreado("main.buscar_id_obra_por_titulo")
 def buscar_id_obra_por_titulo(titulo):
     """
     Busca o ID de uma obra pelo seu título.
@@ -397,4 +592,8 @@ if __name__ == "__main__":
     print("=====================================================")
     print("===Bem-vindo ao Sistema de Acervo Bibliográfico 📚===")
     print("=====================================================")
+    try:
+        backend_padrao.criar_estrutura()
+    except ErroBanco:
+        print("Banco de dados indisponível: as operações de balcão serão registradas offline.")
     menu_principal()
\ No newline at end of file
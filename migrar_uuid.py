@@ -0,0 +1,390 @@
+import re
+import sys
+import time
+from connect import conectar, definir_identificadores
+import arquivamento
+
+# Tabelas com identificadores UUID: coluna usada para percorrer a tabela em
+# lotes (precisa de índice) e colunas convertidas
+COLUNAS_UUID = {
+    "obras": ("identificador", ["identificador"]),
+    "usuarios": ("identificador", ["identificador"]),
+    "emprestimos": ("id", ["identificador", "obra", "usuario"]),
+    "emprestimos_arquivo": ("id", ["identificador", "obra", "usuario"]),
+    "atrasos": ("emprestimo", ["emprestimo", "obra", "usuario"]),
+    "lembretes_outbox": ("id", ["usuario", "emprestimo"]),
+    "reservas": ("id", ["obra", "usuario"]),
+    "obras_removidas": ("identificador", ["identificador"]),
+    "saldos_usuarios": ("usuario", ["usuario"]),
+    "movimentos_saldo": ("id", ["usuario"]),
+    # Cada lote cobre os dias inteiros que contém, então "dia" não precisa ser único
+    "circulacao_diaria": ("dia", ["obra"]),
+    "operacoes_aplicadas": ("id", ["id"]),
+}
+
+SQL_INDICES = """
+    SELECT i.indexrelid::regclass::text, i.indrelid::regclass::text,
+           pg_get_indexdef(i.indexrelid), t.relkind, con.conname, con.contype
+    FROM pg_index i
+    JOIN pg_class t ON t.oid = i.indrelid
+    LEFT JOIN pg_constraint con
+           ON con.conindid = i.indexrelid AND con.contype IN ('p', 'u')
+    WHERE i.indrelid::regclass::text = ANY(%s)
+      AND NOT EXISTS (SELECT 1 FROM pg_inherits h WHERE h.inhrelid = i.indexrelid)
+      AND EXISTS (
+          SELECT 1 FROM pg_attribute a
+          WHERE a.attrelid = i.indrelid
+            AND a.attnum = ANY(i.indkey)
+            AND a.attrelid::regclass::text || '.' || a.attname = ANY(%s)
+      );
+"""
+
+SQL_CHAVES_ESTRANGEIRAS = """
+    SELECT c.conrelid::regclass::text, c.conname, pg_get_constraintdef(c.oid)
+    FROM pg_constraint c
+    WHERE c.contype = 'f' AND c.conparentid = 0
+      AND EXISTS (
+          SELECT 1 FROM pg_attribute a
+          WHERE (a.attrelid = c.conrelid AND a.attnum = ANY(c.conkey)
+                 OR a.attrelid = c.confrelid AND a.attnum = ANY(c.confkey))
+            AND a.attrelid::regclass::text || '.' || a.attname = ANY(%s)
+      );
+"""
+
+
+def _sombra(coluna):
+    return f"{coluna}_uuid"
+
+
+def _checagem(tabela, coluna):
+    return f"{tabela}_{coluna}_uuid_nn"
+
+
+def colunas_pendentes(cur):
+    """
+    Lista as colunas de identificadores que ainda estão em texto.
+
+    Args:
+        cur (cursor): Cursor de uma conexão aberta.
+
+    Returns:
+        dict[str, list[tuple[str, bool]]]: Para cada tabela, nome da coluna e
+        se ela é NOT NULL.
+    """
+    cur.execute("""
+        SELECT table_name, column_name, is_nullable = 'NO'
+        FROM information_schema.columns
+        WHERE table_schema = current_schema()
+          AND data_type IN ('text', 'character varying')
+          AND table_name = ANY(%s)
+        ORDER BY table_name, ordinal_position;
+    """, (list(COLUNAS_UUID),))
+    pendentes = {}
+    for tabela, coluna, obrigatoria in cur.fetchall():
+        if coluna in COLUNAS_UUID[tabela][1]:
+            pendentes.setdefault(tabela, []).append((coluna, obrigatoria))
+    return pendentes
+
+
+def _particionada(cur, tabela):
+    cur.execute("SELECT relkind = 'p' FROM pg_class WHERE oid = %s::regclass;", (tabela,))
+    return cur.fetchone()[0]
+
+
+def preparar():
+    """
+    Primeira etapa: acrescenta a cada coluna pendente uma coluna sombra do
+    tipo uuid, mantida em dia por um gatilho a cada INSERT/UPDATE, e uma
+    checagem NOT VALID de não nulo que depois permite o SET NOT NULL sem
+    varrer a tabela. Só faz alterações rápidas de catálogo.
+    """
+    conn = conectar()
+    cur = conn.cursor()
+    try:
+        cur.execute("SET lock_timeout = '5s';")
+        pendentes = colunas_pendentes(cur)
+        for tabela, colunas in pendentes.items():
+            particionada = _particionada(cur, tabela)
+            atribuicoes = []
+            for coluna, obrigatoria in colunas:
+                cur.execute(f"ALTER TABLE {tabela} ADD COLUMN IF NOT EXISTS {_sombra(coluna)} uuid;")
+                atribuicoes.append(f"NEW.{_sombra(coluna)} := NEW.{coluna}::uuid;")
+                cur.execute("SELECT 1 FROM pg_constraint WHERE conname = %s;",
+                            (_checagem(tabela, coluna),))
+                if obrigatoria and not particionada and cur.fetchone() is None:
+                    cur.execute(f"""
+                        ALTER TABLE {tabela} ADD CONSTRAINT {_checagem(tabela, coluna)}
+                            CHECK ({_sombra(coluna)} IS NOT NULL) NOT VALID;
+                    """)
+
+            cur.execute(f"""
+                CREATE OR REPLACE FUNCTION {tabela}_sincronizar_uuid() RETURNS trigger AS $$
+                BEGIN
+                    {' '.join(atribuicoes)}
+                    RETURN NEW;
+                END;
+                $$ LANGUAGE plpgsql;
+            """)
+            cur.execute(f"DROP TRIGGER IF EXISTS trg_{tabela}_uuid ON {tabela};")
+            cur.execute(f"""
+                CREATE TRIGGER trg_{tabela}_uuid
+                    BEFORE INSERT OR UPDATE ON {tabela}
+                    FOR EACH ROW EXECUTE FUNCTION {tabela}_sincronizar_uuid();
+            """)
+
+        if "emprestimos_arquivo" in pendentes:
+            cur.execute("CREATE INDEX IF NOT EXISTS idx_arquivo_id ON emprestimos_arquivo (id);")
+        conn.commit()
+        print(f"Colunas sombra criadas em {len(pendentes)} tabela(s).")
+    except Exception:
+        conn.rollback()
+        raise
+    finally:
+        cur.close()
+        conn.close()
+
+
+def preencher(tamanho_lote: int = 5000, pausa: float = 0.05):
+    """
+    Segunda etapa: copia os identificadores existentes para as colunas
+    sombra em lotes curtos, percorrendo cada tabela pela sua chave, e valida
+    as checagens de não nulo (sem bloquear escritas).
+
+    Args:
+        tamanho_lote (int): Linhas atualizadas por transação.
+        pausa (float): Segundos de espera entre os lotes.
+    """
+    conn = conectar()
+    cur = conn.cursor()
+    try:
+        for tabela, colunas in colunas_pendentes(cur).items():
+            chave = COLUNAS_UUID[tabela][0]
+            atribuicoes = ", ".join(f"{_sombra(c)} = t.{c}::uuid" for c, _ in colunas)
+            ultimo, total, inicio = None, 0, time.perf_counter()
+            while True:
+                filtro = "" if ultimo is None else f"WHERE {chave} > %s"
+                cur.execute(f"""
+                    WITH lote AS (
+                        SELECT {chave} FROM {tabela}
+                        {filtro}
+                        ORDER BY {chave}
+                        LIMIT %s
+                    )
+                    UPDATE {tabela} t SET {atribuicoes}
+                    FROM lote
+                    WHERE t.{chave} = lote.{chave}
+                    RETURNING t.{chave};
+                """, (tamanho_lote,) if ultimo is None else (ultimo, tamanho_lote))
+                chaves = [linha[0] for linha in cur.fetchall()]
+                conn.commit()
+                if not chaves:
+                    break
+                ultimo = max(chaves)
+                total += len(chaves)
+                print(f"\r{tabela}: {total} linha(s) preenchida(s)", end="", flush=True)
+                time.sleep(pausa)
+            print(f"\r{tabela}: {total} linha(s) preenchida(s) em "
+                  f"{time.perf_counter() - inicio:.1f}s")
+
+            for coluna, obrigatoria in colunas:
+                cur.execute("SELECT 1 FROM pg_constraint WHERE conname = %s AND NOT convalidated;",
+                            (_checagem(tabela, coluna),))
+                if cur.fetchone():
+                    cur.execute(f"ALTER TABLE {tabela} VALIDATE CONSTRAINT {_checagem(tabela, coluna)};")
+                    conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+    finally:
+        cur.close()
+        conn.close()
+
+
+def _definicao_sombra(definicao, nome, colunas, particionada, concorrente):
+    """
+    Reescreve a definição de um índice para as colunas sombra.
+
+    Args:
+        definicao (str): Saída de pg_get_indexdef.
+        nome (str): Nome atual do índice.
+        colunas (list[str]): Colunas que serão trocadas pela sombra.
+        particionada (bool): Se o índice é de uma tabela particionada.
+        concorrente (bool): Usar CREATE INDEX CONCURRENTLY.
+
+    Returns:
+        str: Comando CREATE INDEX do índice sombra.
+    """
+    cabecalho, corpo = definicao.split(" USING ", 1)
+    padrao = re.compile(r"\b(" + "|".join(map(re.escape, colunas)) + r")\b")
+    corpo = padrao.sub(lambda m: _sombra(m.group(1)), corpo)
+    modo = "CONCURRENTLY " if concorrente and not particionada else ""
+    cabecalho = cabecalho.replace(" ON ONLY ", " ON ")
+    cabecalho = cabecalho.replace(
+        f"INDEX {nome.split('.')[-1]} ON",
+        f"INDEX {modo}IF NOT EXISTS {_sombra(nome.split('.')[-1])} ON",
+    )
+    return f"{cabecalho} USING {corpo}"
+
+
+def _indices(cur, pendentes):
+    alvos = [f"{t}.{c}" for t, colunas in pendentes.items() for c, _ in colunas]
+    cur.execute(SQL_INDICES, (list(pendentes), alvos))
+    return cur.fetchall()
+
+
+def indexar():
+    """
+    Terceira etapa: cria, com CREATE INDEX CONCURRENTLY, uma cópia de cada
+    índice (inclusive os de chave primária e UNIQUE) sobre as colunas
+    sombra, para que a troca não precise construir índices com a tabela
+    travada. Índices de tabelas particionadas são criados sem CONCURRENTLY.
+    """
+    conn = conectar()
+    conn.autocommit = True
+    cur = conn.cursor()
+    try:
+        pendentes = colunas_pendentes(cur)
+        for nome, tabela, definicao, relkind, _, _ in _indices(cur, pendentes):
+            colunas = [c for c, _ in pendentes[tabela]]
+            inicio = time.perf_counter()
+            cur.execute(_definicao_sombra(definicao, nome, colunas, relkind == "p", True))
+            print(f"Índice {_sombra(nome)} criado em {time.perf_counter() - inicio:.1f}s")
+    finally:
+        cur.close()
+        conn.close()
+
+
+def trocar():
+    """
+    Última etapa, em uma única transação curta: remove as colunas de texto,
+    renomeia as sombras para os nomes originais e recria restrições e
+    índices a partir do que foi lido de pg_constraint e pg_index. Chaves
+    primárias e UNIQUE reaproveitam os índices sombra; chaves estrangeiras
+    são recriadas NOT VALID e validadas depois, sem travar as tabelas.
+    """
+    conn = conectar()
+    cur = conn.cursor()
+    try:
+        cur.execute("SET LOCAL lock_timeout = '5s';")
+        pendentes = colunas_pendentes(cur)
+        if not pendentes:
+            print("Nenhuma coluna de texto a converter.")
+            return
+        alvos = [f"{t}.{c}" for t, colunas in pendentes.items() for c, _ in colunas]
+        cur.execute(SQL_CHAVES_ESTRANGEIRAS, (alvos,))
+        estrangeiras = cur.fetchall()
+        indices = _indices(cur, pendentes)
+
+        for nome, tabela, definicao, relkind, _, _ in indices:
+            colunas = [c for c, _ in pendentes[tabela]]
+            cur.execute(_definicao_sombra(definicao, nome, colunas, relkind == "p", False))
+
+        cur.execute("DROP VIEW IF EXISTS emprestimos_todos;")
+        for tabela, nome, _ in estrangeiras:
+            cur.execute(f"ALTER TABLE {tabela} DROP CONSTRAINT {nome};")
+
+        for tabela, colunas in pendentes.items():
+            cur.execute(f"DROP TRIGGER IF EXISTS trg_{tabela}_uuid ON {tabela};")
+            cur.execute(f"DROP FUNCTION IF EXISTS {tabela}_sincronizar_uuid();")
+            for coluna, obrigatoria in colunas:
+                cur.execute(f"ALTER TABLE {tabela} DROP COLUMN {coluna};")
+                cur.execute(f"ALTER TABLE {tabela} RENAME COLUMN {_sombra(coluna)} TO {coluna};")
+                if obrigatoria:
+                    cur.execute(f"ALTER TABLE {tabela} ALTER COLUMN {coluna} SET NOT NULL;")
+                cur.execute(f"ALTER TABLE {tabela} DROP CONSTRAINT IF EXISTS {_checagem(tabela, coluna)};")
+
+        for nome, tabela, definicao, relkind, restricao, tipo in indices:
+            curto = nome.split(".")[-1]
+            if restricao:
+                palavra = "PRIMARY KEY" if tipo == "p" else "UNIQUE"
+                cur.execute(f"ALTER TABLE {tabela} ADD CONSTRAINT {restricao} "
+                            f"{palavra} USING INDEX {_sombra(curto)};")
+            else:
+                cur.execute(f"ALTER INDEX {_sombra(nome)} RENAME TO {curto};")
+
+        for tabela, nome, definicao in estrangeiras:
+            cur.execute(f"ALTER TABLE {tabela} ADD CONSTRAINT {nome} {definicao} NOT VALID;")
+
+        arquivamento.criar_estrutura(cur)
+        conn.commit()
+        definir_identificadores("uuid")
+        print(f"Colunas convertidas para uuid: {', '.join(alvos)}")
+        print("Reinicie os balcões abertos para que passem a enviar uuid nativo.")
+
+        for tabela, nome, _ in estrangeiras:
+            cur.execute(f"ALTER TABLE {tabela} VALIDATE CONSTRAINT {nome};")
+            conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+    finally:
+        cur.close()
+        conn.close()
+
+
+def medir(repeticoes: int = 5):
+    """
+    Mostra o tamanho de cada tabela e índice de identificadores e o tempo
+    da junção empréstimos x obras x usuários. Rodar antes e depois da
+    migração para comparar.
+
+    Args:
+        repeticoes (int): Execuções da junção; é mostrado o melhor tempo.
+    """
+    conn = conectar("leitura")
+    cur = conn.cursor()
+    try:
+        cur.execute("""
+            SELECT relname, indexrelname,
+                   pg_size_pretty(pg_relation_size(indexrelid))
+            FROM pg_stat_user_indexes
+            WHERE relname = ANY(%s) OR relname LIKE 'emprestimos_arquivo_%%'
+            ORDER BY relname, indexrelname;
+        """, (list(COLUNAS_UUID),))
+        for tabela, indice, tamanho in cur.fetchall():
+            print(f"{tabela:<28} {indice:<40} {tamanho:>10}")
+
+        cur.execute("""
+            SELECT pg_size_pretty(SUM(pg_relation_size(indexrelid)))
+            FROM pg_stat_user_indexes
+            WHERE relname = ANY(%s) OR relname LIKE 'emprestimos_arquivo_%%';
+        """, (list(COLUNAS_UUID),))
+        print(f"Total dos índices: {cur.fetchone()[0]}")
+
+        melhor = None
+        for _ in range(repeticoes):
+            inicio = time.perf_counter()
+            cur.execute("""
+                SELECT COUNT(*)
+                FROM emprestimos e
+                JOIN obras o ON o.identificador = e.obra
+                JOIN usuarios u ON u.identificador = e.usuario;
+            """)
+            cur.fetchone()
+            decorrido = time.perf_counter() - inicio
+            melhor = decorrido if melhor is None else min(melhor, decorrido)
+        print(f"Junção empréstimos x obras x usuários: {melhor * 1000:.1f} ms")
+    finally:
+        cur.close()
+        conn.close()
+
+
+ETAPAS = {
+    "medir": medir,
+    "preparar": preparar,
+    "preencher": preencher,
+    "indexar": indexar,
+    "trocar": trocar,
+}
+
+
+if __name__ == "__main__":
+    etapa = sys.argv[1] if len(sys.argv) > 1 else "tudo"
+    if etapa == "tudo":
+        for nome in ("medir", "preparar", "preencher", "indexar", "trocar", "medir"):
+            ETAPAS[nome]()
+    elif etapa in ETAPAS:
+        ETAPAS[etapa]()
+    else:
+        print("Uso: python migrar_uuid.py [tudo|medir|preparar|preencher|indexar|trocar]")
+        sys.exit(1)
@@ -71,6 +71,7 @@ class Usuario(BaseEntity):
         self.ident = uuid.uuid4()
         self.nome = nome
         self.email = email
+        self.cartao = None  # Número do cartão, atribuído pelo banco ao salvar
 
     def __lt__(self, other):
         """Permite ordenação por nome."""
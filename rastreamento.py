@@ -0,0 +1,203 @@
+import contextvars
+import functools
+import itertools
+import json
+import os
+import sys
+import threading
+import time
+
+# Arquivo JSONL de destino dos spans; sem ele o rastreamento fica desligado
+ARQUIVO_TRACE = os.getenv("ACERVO_TRACE")
+ativo = bool(ARQUIVO_TRACE)
+
+_span_atual = contextvars.ContextVar("span_atual", default=None)
+_ids = itertools.count(1)
+_trava = threading.Lock()
+_saida = None
+
+
+class _SpanNulo:
+    """Span usado quando o rastreamento está desligado: não faz nada."""
+
+    __slots__ = ()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *erro):
+        return False
+
+    def definir(self, **atributos):
+        pass
+
+
+_NULO = _SpanNulo()
+
+
+class Span:
+    """
+    Intervalo de tempo de uma operação. Spans abertos dentro de outro
+    span (na mesma thread ou tarefa) ficam registrados como filhos dele.
+    """
+
+    __slots__ = ("nome", "atributos", "id", "pai", "_inicio", "_inicio_us", "_token")
+
+    def __init__(self, nome, atributos):
+        self.nome = nome
+        self.atributos = atributos
+
+    def __enter__(self):
+        self.id = next(_ids)
+        self.pai = _span_atual.get()
+        self._token = _span_atual.set(self.id)
+        self._inicio_us = time.time_ns() // 1000
+        self._inicio = time.perf_counter_ns()
+        return self
+
+    def __exit__(self, tipo, erro, tb):
+        duracao_us = (time.perf_counter_ns() - self._inicio) // 1000
+        _span_atual.reset(self._token)
+        if erro is not None:
+            self.atributos["erro"] = repr(erro)
+        _exportar({
+            "id": self.id,
+            "pai": self.pai,
+            "nome": self.nome,
+            "inicio_us": self._inicio_us,
+            "duracao_us": duracao_us,
+            "pid": os.getpid(),
+            "thread": threading.get_ident(),
+            "atributos": self.atributos,
+        })
+        return False
+
+    def definir(self, **atributos):
+        """Acrescenta atributos ao span."""
+        self.atributos.update(atributos)
+
+
+def _exportar(registro):
+    global _saida
+    linha = json.dumps(registro, default=str) + "\n"
+    with _trava:
+        if _saida is None:
+            _saida = open(ARQUIVO_TRACE, "a", encoding="utf-8")
+        _saida.write(linha)
+        _saida.flush()
+
+
+def span(nome, **atributos):
+    """
+    Abre um span para ser usado com ``with``.
+
+    Args:
+        nome (str): Nome da operação.
+        **atributos: Dados extras gravados com o span.
+
+    Returns:
+        Span: Span ativo, ou um span nulo se o rastreamento estiver desligado.
+    """
+    if not ativo:
+        return _NULO
+    return Span(nome, atributos)
+
+
+def rastreado(nome=None):
+    """
+    Decorador que envolve cada chamada da função em um span. Com o
+    rastreamento desligado a função é devolvida sem nenhum invólucro.
+
+    Args:
+        nome (str): Nome do span. Padrão: nome qualificado da função.
+    """
+    def decorador(funcao):
+        if not ativo:
+            return funcao
+        nome_span = nome or funcao.__qualname__
+
+        @functools.wraps(funcao)
+        def envolvida(*args, **kwargs):
+            with Span(nome_span, {}):
+                return funcao(*args, **kwargs)
+        return envolvida
+    return decorador
+
+
+def resumir_sql(sql):
+    """Primeira linha não vazia do comando, para identificar o span."""
+    if isinstance(sql, bytes):
+        sql = sql.decode("utf-8", "replace")
+    for linha in str(sql).splitlines():
+        if linha.strip():
+            return linha.strip()[:120]
+    return ""
+
+
+def _ler(caminho):
+    with open(caminho, encoding="utf-8") as f:
+        return [json.loads(linha) for linha in f if linha.strip()]
+
+
+def para_chrome(entrada, saida):
+    """
+    Converte um arquivo de spans para o formato de trace do Chrome
+    (chrome://tracing ou ui.perfetto.dev).
+
+    Args:
+        entrada (str): Arquivo JSONL gerado pelo rastreamento.
+        saida (str): Arquivo JSON de destino.
+    """
+    eventos = [{
+        "name": s["nome"],
+        "ph": "X",
+        "ts": s["inicio_us"],
+        "dur": s["duracao_us"],
+        "pid": s["pid"],
+        "tid": s["thread"],
+        "args": s["atributos"],
+    } for s in _ler(entrada)]
+    with open(saida, "w", encoding="utf-8") as f:
+        json.dump({"traceEvents": eventos}, f)
+
+
+def para_flamegraph(entrada, saida):
+    """
+    Converte um arquivo de spans para o formato de pilhas agregadas
+    ("collapsed stacks") usado pelo flamegraph.pl e pelo speedscope. O peso
+    de cada pilha é o tempo próprio do span, em microssegundos.
+
+    Args:
+        entrada (str): Arquivo JSONL gerado pelo rastreamento.
+        saida (str): Arquivo texto de destino.
+    """
+    spans = {(s["pid"], s["id"]): s for s in _ler(entrada)}
+    tempo_filhos = {}
+    for s in spans.values():
+        if s["pai"] is not None:
+            chave_pai = (s["pid"], s["pai"])
+            tempo_filhos[chave_pai] = tempo_filhos.get(chave_pai, 0) + s["duracao_us"]
+
+    pilhas = {}
+    for chave, s in spans.items():
+        nomes = []
+        atual = s
+        while atual is not None:
+            nomes.append(atual["nome"].replace(";", ","))
+            atual = spans.get((atual["pid"], atual["pai"])) if atual["pai"] is not None else None
+        pilha = ";".join(reversed(nomes))
+        proprio = max(0, s["duracao_us"] - tempo_filhos.get(chave, 0))
+        pilhas[pilha] = pilhas.get(pilha, 0) + proprio
+
+    with open(saida, "w", encoding="utf-8") as f:
+        for pilha, peso in sorted(pilhas.items()):
+            f.write(f"{pilha} {peso}\n")
+
+
+if __name__ == "__main__":
+    if len(sys.argv) != 4 or sys.argv[1] not in ("chrome", "flamegraph"):
+        print("Uso: python rastreamento.py [chrome|flamegraph] <entrada.jsonl> <saida>")
+        sys.exit(1)
+    formato, entrada, saida = sys.argv[1:]
+    (para_chrome if formato == "chrome" else para_flamegraph)(entrada, saida)
+    print(f"Trace convertido para '{saida}'.")
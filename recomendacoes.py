@@ -0,0 +1,341 @@
+import os
+import sys
+import numpy as np
+from scipy import sparse
+from connect import conectar
+
+# Arquivo do índice de recomendações e vizinhos guardados por obra
+ARQUIVO_INDICE = os.getenv("ACERVO_RECOMENDACOES", "recomendacoes.npz")
+VIZINHOS_POR_OBRA = 10
+
+SQL_PARES = """
+    SELECT DISTINCT e.usuario, e.obra, o.titulo
+    FROM {origem} e
+    JOIN obras o ON o.identificador = e.obra
+    {filtro};
+"""
+
+# Linhas de emprestimos gravadas depois do snapshot guardado no índice. O
+# xid de 32 bits de xmin é convertido para xid8 pela distância até o xid
+# desta transação; uma linha muito antiga pode ser tomada por nova, o que
+# só faz o par ser relido.
+FILTRO_NOVOS = """
+    WHERE NOT pg_visible_in_snapshot((%(atual)s - age(e.xmin))::text::xid8,
+                                     %(snapshot)s::pg_snapshot)
+"""
+
+
+class Recomendador:
+    """
+    Sugestões de obras "emprestadas junto" a partir do histórico.
+
+    Guarda a matriz esparsa X (usuários x obras, 1 se o usuário já pegou a
+    obra) e a co-ocorrência C = XᵀX, em que C[i, j] é o número de usuários
+    que pegaram as obras i e j. A similaridade entre duas obras é o cosseno
+    C[i, j] / sqrt(C[i, i] * C[j, j]), e as ``k`` obras mais similares de
+    cada uma ficam em matrizes densas (``vizinhos`` e ``pesos``), de forma
+    que uma sugestão é só a leitura de uma linha.
+
+    Novos empréstimos entram pela atualização incremental
+    C' = C + DᵀX + XᵀD + DᵀD, em que D tem apenas os pares usuário/obra
+    ainda não vistos; só os vizinhos das obras afetadas são recalculados.
+    Os empréstimos novos são as linhas de ``emprestimos`` invisíveis no
+    snapshot da construção ou atualização anterior, o que inclui as de
+    transações que só confirmaram depois dela.
+    Empréstimos apagados não são descontados: reconstrua o índice de tempos
+    em tempos.
+    """
+
+    def __init__(self, k: int = VIZINHOS_POR_OBRA):
+        """
+        Args:
+            k (int): Vizinhos guardados por obra.
+        """
+        self.k = k
+        self.obras = []
+        self.titulos = []
+        self.usuarios = []
+        self._coluna = {}
+        self._linha = {}
+        self._por_titulo = {}
+        self.X = sparse.csr_matrix((0, 0), dtype=np.float32)
+        self.C = sparse.csr_matrix((0, 0), dtype=np.float32)
+        self.vizinhos = np.empty((0, k), dtype=np.int32)
+        self.pesos = np.empty((0, k), dtype=np.float32)
+        self.snapshot = None
+
+    def _indexar(self, pares):
+        """
+        Converte pares (usuário, obra, título) em índices de linha e coluna,
+        acrescentando usuários e obras ainda desconhecidos.
+        """
+        linhas = np.empty(len(pares), dtype=np.int32)
+        colunas = np.empty(len(pares), dtype=np.int32)
+        for n, (usuario, obra, titulo) in enumerate(pares):
+            usuario, obra = str(usuario), str(obra)
+            if usuario not in self._linha:
+                self._linha[usuario] = len(self.usuarios)
+                self.usuarios.append(usuario)
+            if obra not in self._coluna:
+                self._coluna[obra] = len(self.obras)
+                self.obras.append(obra)
+                self.titulos.append(titulo)
+                self._por_titulo.setdefault(titulo.lower(), []).append(self._coluna[obra])
+            linhas[n] = self._linha[usuario]
+            colunas[n] = self._coluna[obra]
+        return linhas, colunas
+
+    def _matriz(self, linhas, colunas):
+        """Matriz binária usuários x obras com os pares informados."""
+        matriz = sparse.csr_matrix(
+            (np.ones(len(linhas), dtype=np.float32), (linhas, colunas)),
+            shape=(len(self.usuarios), len(self.obras)),
+        )
+        matriz.sum_duplicates()
+        matriz.data[:] = 1
+        return matriz
+
+    @staticmethod
+    def _ler_pares(cur, origem, filtro="", parametros=None):
+        cur.execute(SQL_PARES.format(origem=origem, filtro=filtro), parametros)
+        pares = []
+        while True:
+            bloco = cur.fetchmany(50000)
+            if not bloco:
+                return pares
+            pares.extend(bloco)
+
+    def _recalcular(self, linhas):
+        """
+        Recalcula os ``k`` vizinhos das obras informadas, de forma vetorizada:
+        normaliza as linhas de C pelo cosseno, descarta a própria obra e
+        ordena os valores de cada linha de uma só vez.
+
+        Args:
+            linhas (np.ndarray): Índices das obras a recalcular.
+        """
+        n = len(self.obras)
+        if self.vizinhos.shape[0] < n:
+            faltam = n - self.vizinhos.shape[0]
+            self.vizinhos = np.vstack([self.vizinhos, np.full((faltam, self.k), -1, np.int32)])
+            self.pesos = np.vstack([self.pesos, np.zeros((faltam, self.k), np.float32)])
+        if len(linhas) == 0:
+            return
+
+        norma = 1 / np.sqrt(np.maximum(self.C.diagonal(), 1)).astype(np.float32)
+        similaridade = (sparse.diags(norma[linhas]) @ self.C[linhas] @ sparse.diags(norma)).tocoo()
+
+        manter = similaridade.col != linhas[similaridade.row]
+        lin = similaridade.row[manter]
+        col = similaridade.col[manter]
+        val = similaridade.data[manter]
+        ordem = np.lexsort((-val, lin))
+        lin, col, val = lin[ordem], col[ordem], val[ordem]
+        posicao = np.arange(len(lin)) - np.searchsorted(lin, lin)
+        topo = posicao < self.k
+
+        self.vizinhos[linhas] = -1
+        self.pesos[linhas] = 0
+        self.vizinhos[linhas[lin[topo]], posicao[topo]] = col[topo]
+        self.pesos[linhas[lin[topo]], posicao[topo]] = val[topo]
+
+    def construir(self, cur):
+        """
+        Monta o índice a partir de todo o histórico de empréstimos (ativos e
+        arquivados), guardando o snapshot em que ele foi lido.
+
+        Args:
+            cur (cursor): Cursor de uma conexão aberta, sem transação iniciada.
+        """
+        cur.execute("SET TRANSACTION ISOLATION LEVEL REPEATABLE READ;")
+        cur.execute("SELECT pg_current_snapshot()::text;")
+        self.snapshot = cur.fetchone()[0]
+        pares = self._ler_pares(cur, "emprestimos_todos")
+        self.X = self._matriz(*self._indexar(pares))
+        self.C = (self.X.T @ self.X).tocsr()
+        self._recalcular(np.arange(len(self.obras), dtype=np.int32))
+
+    def atualizar(self, cur) -> int:
+        """
+        Acrescenta ao índice os empréstimos gravados desde a última
+        construção ou atualização. Linhas alteradas depois dela (uma
+        devolução, por exemplo) também são relidas, mas um par já visto não
+        muda o índice.
+
+        Args:
+            cur (cursor): Cursor de uma conexão com o primário, sem transação
+                iniciada (a referência de xmin é o xid desta transação).
+
+        Returns:
+            int: Quantidade de pares usuário/obra novos.
+        """
+        cur.execute("SET TRANSACTION ISOLATION LEVEL REPEATABLE READ;")
+        cur.execute("SELECT pg_current_xact_id()::text::bigint, pg_current_snapshot()::text;")
+        atual, snapshot = cur.fetchone()
+        pares = self._ler_pares(cur, "emprestimos", FILTRO_NOVOS,
+                                {"atual": atual, "snapshot": self.snapshot})
+        self.snapshot = snapshot
+        if not pares:
+            return 0
+
+        linhas, colunas = self._indexar(pares)
+        self.X.resize((len(self.usuarios), len(self.obras)))
+        self.C.resize((len(self.obras), len(self.obras)))
+        D = self._matriz(linhas, colunas)
+        D = D - D.multiply(self.X)
+        D.eliminate_zeros()
+        if D.nnz:
+            cruzado = (D.T @ self.X).tocsr()
+            self.C = (self.C + cruzado + cruzado.T + D.T @ D).tocsr()
+            self.X = (self.X + D).tocsr()
+            alteradas = np.unique(D.indices)
+            afetadas = np.union1d(alteradas, self.C[alteradas].indices).astype(np.int32)
+            self._recalcular(afetadas)
+        return D.nnz
+
+    def identificar(self, titulos):
+        """
+        Converte títulos (sem diferenciar maiúsculas/minúsculas) nos
+        identificadores das obras presentes no índice. Um título
+        compartilhado por mais de uma obra traz todas elas.
+
+        Returns:
+            list[str]: Identificadores encontrados.
+        """
+        return [self.obras[i] for titulo in titulos
+                for i in self._por_titulo.get(titulo.strip().lower(), [])]
+
+    def sugerir(self, obras, k: int = 5):
+        """
+        Sugere obras emprestadas junto com as informadas, somando a
+        similaridade de cada vizinho com todas elas.
+
+        Args:
+            obras (list): Identificadores das obras de referência.
+            k (int): Quantidade de sugestões.
+
+        Returns:
+            list[tuple[str, str, float]]: (identificador, título, pontuação),
+            da maior para a menor pontuação.
+        """
+        entrada = set()
+        pontos = {}
+        for ident in obras:
+            i = self._coluna.get(str(ident))
+            if i is None:
+                continue
+            entrada.add(i)
+            for j, peso in zip(self.vizinhos[i].tolist(), self.pesos[i].tolist()):
+                if j < 0:
+                    break
+                pontos[j] = pontos.get(j, 0.0) + peso
+        melhores = sorted((j for j in pontos if j not in entrada), key=pontos.get, reverse=True)
+        return [(self.obras[j], self.titulos[j], pontos[j]) for j in melhores[:k]]
+
+    def salvar(self, caminho: str = ARQUIVO_INDICE):
+        """
+        Grava o índice em um arquivo .npz, substituindo o anterior de forma
+        atômica para não atrapalhar os balcões que o estão lendo.
+        """
+        temporario = caminho + ".tmp"
+        with open(temporario, "wb") as f:
+            np.savez(
+                f,
+                obras=np.array(self.obras, dtype=str),
+                titulos=np.array(self.titulos, dtype=str),
+                usuarios=np.array(self.usuarios, dtype=str),
+                x_dados=self.X.data, x_indices=self.X.indices, x_ponteiros=self.X.indptr,
+                c_dados=self.C.data, c_indices=self.C.indices, c_ponteiros=self.C.indptr,
+                vizinhos=self.vizinhos, pesos=self.pesos,
+                snapshot=np.array(self.snapshot or "", dtype=str), k=np.array(self.k),
+            )
+        os.replace(temporario, caminho)
+
+    @classmethod
+    def carregar(cls, caminho: str = ARQUIVO_INDICE):
+        """
+        Lê um índice gravado por ``salvar``.
+
+        Returns:
+            Recomendador: Índice carregado.
+        """
+        with np.load(caminho) as dados:
+            recomendador = cls(int(dados["k"]))
+            recomendador.usuarios = dados["usuarios"].tolist()
+            recomendador.obras = dados["obras"].tolist()
+            recomendador.titulos = dados["titulos"].tolist()
+            recomendador._linha = {u: i for i, u in enumerate(recomendador.usuarios)}
+            recomendador._coluna = {o: i for i, o in enumerate(recomendador.obras)}
+            for i, titulo in enumerate(recomendador.titulos):
+                recomendador._por_titulo.setdefault(titulo.lower(), []).append(i)
+            forma_x = (len(recomendador.usuarios), len(recomendador.obras))
+            forma_c = (len(recomendador.obras), len(recomendador.obras))
+            recomendador.X = sparse.csr_matrix(
+                (dados["x_dados"], dados["x_indices"], dados["x_ponteiros"]), shape=forma_x)
+            recomendador.C = sparse.csr_matrix(
+                (dados["c_dados"], dados["c_indices"], dados["c_ponteiros"]), shape=forma_c)
+            recomendador.vizinhos = dados["vizinhos"]
+            recomendador.pesos = dados["pesos"]
+            # Índices gravados antes do snapshot precisam ser reconstruídos
+            snapshot = str(dados["snapshot"]) if "snapshot" in dados else ""
+            recomendador.snapshot = snapshot or None
+        return recomendador
+
+
+_indice = None
+_versao_indice = None
+
+
+def indice_atual(caminho: str = ARQUIVO_INDICE):
+    """
+    Retorna o índice gravado em disco, relendo-o quando o arquivo for
+    substituído por uma nova construção ou atualização.
+
+    Returns:
+        Recomendador | None: Índice, ou None se ainda não foi construído.
+    """
+    global _indice, _versao_indice
+    try:
+        estado = os.stat(caminho)
+    except FileNotFoundError:
+        return None
+    versao = (estado.st_ino, estado.st_mtime_ns)
+    if versao != _versao_indice:
+        _indice = Recomendador.carregar(caminho)
+        _versao_indice = versao
+    return _indice
+
+
+def _executar(acao, caminho=ARQUIVO_INDICE):
+    recomendador = None
+    if acao == "atualizar" and os.path.exists(caminho):
+        recomendador = Recomendador.carregar(caminho)
+        if recomendador.snapshot is None:
+            recomendador = None
+
+    # A construção lê todo o histórico da réplica; a atualização usa o
+    # primário, onde o xid da transação serve de referência para o xmin
+    conn = conectar("escrita" if recomendador else "leitura")
+    cur = conn.cursor()
+    try:
+        if recomendador is None:
+            recomendador = Recomendador()
+            recomendador.construir(cur)
+            print(f"Índice construído: {len(recomendador.obras)} obra(s), "
+                  f"{recomendador.X.nnz} par(es) usuário/obra.")
+        else:
+            novos = recomendador.atualizar(cur)
+            print(f"Índice atualizado: {novos} par(es) usuário/obra novo(s).")
+        conn.rollback()
+        recomendador.salvar(caminho)
+    finally:
+        cur.close()
+        conn.close()
+
+
+if __name__ == "__main__":
+    acao = sys.argv[1] if len(sys.argv) > 1 else "atualizar"
+    if acao not in ("construir", "atualizar"):
+        print("Uso: python recomendacoes.py [construir|atualizar]")
+        sys.exit(1)
+    _executar(acao)
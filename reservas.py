@@ -0,0 +1,238 @@
+from datetime import datetime, timedelta
+from connect import conectar, tipo_identificador
+from cache import cache_relatorios
+
+# Dias que o usuário tem para retirar um exemplar separado para a sua reserva
+PRAZO_RETIRADA_DIAS = 3
+
+
+def criar_estrutura(cur):
+    """
+    Cria a tabela de reservas e seus índices.
+
+    A fila de cada obra é servida pelo índice parcial ``idx_reservas_fila``
+    (obra, criada_em, id) das reservas aguardando, de forma que a próxima
+    reserva é encontrada em O(log n) mesmo com milhares de pessoas na fila.
+
+    Args:
+        cur (cursor): Cursor de uma conexão aberta.
+    """
+    tipo = tipo_identificador(cur)
+    cur.execute(f"""
+        CREATE TABLE IF NOT EXISTS reservas (
+            id SERIAL PRIMARY KEY,
+            obra {tipo} NOT NULL,
+            usuario {tipo} NOT NULL,
+            status TEXT NOT NULL DEFAULT 'aguardando',
+            criada_em TIMESTAMP NOT NULL DEFAULT now(),
+            alocada_em TIMESTAMP,
+            expira_em TIMESTAMP
+        );
+        CREATE INDEX IF NOT EXISTS idx_reservas_fila
+            ON reservas (obra, criada_em, id)
+            WHERE status = 'aguardando';
+        CREATE INDEX IF NOT EXISTS idx_reservas_alocadas
+            ON reservas (expira_em)
+            WHERE status = 'alocada';
+        CREATE UNIQUE INDEX IF NOT EXISTS idx_reservas_usuario_obra
+            ON reservas (usuario, obra)
+            WHERE status IN ('aguardando', 'alocada');
+    """)
+
+
+def reservar(cur, id_obra, id_usuario):
+    """
+    Coloca o usuário na fila de reservas da obra.
+
+    Args:
+        cur (cursor): Cursor da transação em andamento.
+        id_obra (str): Identificador da obra.
+        id_usuario (str): Identificador do usuário.
+
+    Returns:
+        int | None: Posição do usuário na fila, ou None se ele já tiver
+        uma reserva ativa para a obra.
+    """
+    cur.execute("""
+        INSERT INTO reservas (obra, usuario)
+        VALUES (%s, %s)
+        ON CONFLICT (usuario, obra) WHERE status IN ('aguardando', 'alocada')
+        DO NOTHING
+        RETURNING criada_em, id;
+    """, (id_obra, id_usuario))
+    linha = cur.fetchone()
+    if not linha:
+        return None
+
+    criada_em, id_reserva = linha
+    cur.execute("""
+        SELECT count(*) FROM reservas
+        WHERE obra = %s AND status = 'aguardando' AND (criada_em, id) <= (%s, %s);
+    """, (id_obra, criada_em, id_reserva))
+    return cur.fetchone()[0]
+
+
+def alocar_proxima(cur, id_obra, prazo_dias: int = PRAZO_RETIRADA_DIAS):
+    """
+    Separa um exemplar para a reserva mais antiga da fila da obra.
+
+    A reserva da frente da fila é travada com FOR UPDATE (sem SKIP LOCKED):
+    se outra transação a estiver alocando, esta espera e, quando aquela
+    terminar, pega a seguinte, sem que uma reserva mais nova passe à
+    frente de uma mais antiga.
+
+    Args:
+        cur (cursor): Cursor da transação em andamento.
+        id_obra (str): Identificador da obra.
+        prazo_dias (int): Dias que o usuário tem para retirar o exemplar.
+
+    Returns:
+        str | None: Identificador do usuário contemplado, ou None se a fila estiver vazia.
+    """
+    agora = datetime.now()
+    cur.execute("""
+        UPDATE reservas
+           SET status = 'alocada', alocada_em = %s, expira_em = %s
+         WHERE id = (
+            SELECT id FROM reservas
+            WHERE obra = %s AND status = 'aguardando'
+            ORDER BY criada_em, id
+            LIMIT 1
+            FOR UPDATE
+         )
+        RETURNING usuario;
+    """, (agora, agora + timedelta(days=prazo_dias), id_obra))
+    linha = cur.fetchone()
+    return linha[0] if linha else None
+
+
+def liberar_exemplar(cur, id_obra):
+    """
+    Dá destino a um exemplar que voltou ao acervo: separa-o para a próxima
+    reserva da fila ou, se não houver reservas, devolve-o ao estoque.
+
+    Deve ser chamada dentro da mesma transação que registrou a devolução.
+
+    Args:
+        cur (cursor): Cursor da transação em andamento.
+        id_obra (str): Identificador da obra devolvida.
+
+    Returns:
+        str | None: Identificador do usuário contemplado pela reserva, se houver.
+    """
+    id_usuario = alocar_proxima(cur, id_obra)
+    if id_usuario is None:
+        cur.execute("""
+            UPDATE obras
+            SET quantidade_disponivel = quantidade_disponivel + 1
+            WHERE identificador = %s;
+        """, (id_obra,))
+    return id_usuario
+
+
+def possui_reserva_alocada(cur, id_obra, id_usuario) -> bool:
+    """
+    Verifica se há um exemplar da obra separado para o usuário.
+
+    Args:
+        cur (cursor): Cursor de uma conexão aberta.
+        id_obra (str): Identificador da obra.
+        id_usuario (str): Identificador do usuário.
+
+    Returns:
+        bool: True se houver uma reserva alocada e ainda não retirada.
+    """
+    cur.execute("""
+        SELECT 1 FROM reservas
+        WHERE obra = %s AND usuario = %s AND status = 'alocada';
+    """, (id_obra, id_usuario))
+    return cur.fetchone() is not None
+
+
+def consumir_reserva(cur, id_obra, id_usuario) -> bool:
+    """
+    Marca como atendida a reserva alocada do usuário para a obra.
+
+    Args:
+        cur (cursor): Cursor da transação em andamento.
+        id_obra (str): Identificador da obra.
+        id_usuario (str): Identificador do usuário.
+
+    Returns:
+        bool: True se havia uma reserva alocada para ser consumida.
+    """
+    cur.execute("""
+        UPDATE reservas SET status = 'atendida'
+        WHERE obra = %s AND usuario = %s AND status = 'alocada'
+        RETURNING id;
+    """, (id_obra, id_usuario))
+    return cur.fetchone() is not None
+
+
+def retirar_exemplar(cur, id_obra, id_usuario) -> bool:
+    """
+    Tira do acervo o exemplar de um empréstimo: consome a reserva alocada
+    do usuário para a obra ou, sem ela, baixa um exemplar do estoque
+    disponível. A baixa só acontece se houver estoque, de forma que dois
+    balcões disputando o último exemplar não deixam a quantidade negativa.
+
+    Deve ser chamada dentro da mesma transação que insere o empréstimo.
+
+    Args:
+        cur (cursor): Cursor da transação em andamento.
+        id_obra (str): Identificador da obra.
+        id_usuario (str): Identificador do usuário.
+
+    Returns:
+        bool: False se não havia reserva alocada nem exemplar disponível.
+    """
+    if consumir_reserva(cur, id_obra, id_usuario):
+        return True
+    cur.execute("""
+        UPDATE obras
+        SET quantidade_disponivel = quantidade_disponivel - 1
+        WHERE identificador = %s AND quantidade_disponivel > 0;
+    """, (id_obra,))
+    return cur.rowcount > 0
+
+
+def expirar_reservas() -> int:
+    """
+    Encerra as reservas alocadas cujo prazo de retirada venceu e repassa
+    cada exemplar liberado para a próxima reserva da fila (ou ao estoque).
+
+    Returns:
+        int: Quantidade de reservas expiradas.
+    """
+    conn = conectar()
+    cur = conn.cursor()
+    try:
+        cur.execute("""
+            WITH vencidas AS (
+                SELECT id FROM reservas
+                WHERE status = 'alocada' AND expira_em < now()
+                FOR UPDATE SKIP LOCKED
+            )
+            UPDATE reservas r SET status = 'expirada'
+              FROM vencidas
+             WHERE r.id = vencidas.id
+            RETURNING r.obra;
+        """)
+        obras_liberadas = [linha[0] for linha in cur.fetchall()]
+        for id_obra in obras_liberadas:
+            liberar_exemplar(cur, id_obra)
+        if obras_liberadas:
+            cache_relatorios.invalidar(cur, "obras")
+        conn.commit()
+        return len(obras_liberadas)
+    except Exception:
+        conn.rollback()
+        raise
+    finally:
+        cur.close()
+        conn.close()
+
+
+if __name__ == "__main__":
+    expiradas = expirar_reservas()
+    print(f"{expiradas} reserva(s) expirada(s).")
@@ -0,0 +1,462 @@
+import glob
+import json
+import mmap
+import os
+import struct
+import sys
+import time
+from collections import namedtuple
+from armazenamento import backend_padrao, conectar
+
+# Cabeçalho: assinatura, versão do formato, reservado, nº de obras, gerado em (epoch)
+CABECALHO = struct.Struct("<4sHHId")
+ASSINATURA = b"ACVS"
+VERSAO_FORMATO = 1
+DESLOCAMENTO = struct.Struct("<I")
+TEXTO = struct.Struct("<H")
+NUMEROS = struct.Struct("<iii")
+
+# Obras cuja versão atual (xmin) não era visível no snapshot de transação
+# guardado pela exportação anterior: alteradas ou removidas depois dela,
+# mesmo por transações que começaram antes e só confirmaram depois
+FILTRO_NOVAS = """
+    NOT pg_visible_in_snapshot((%(atual)s - age({tabela}.xmin))::text::xid8,
+                               %(snapshot)s::pg_snapshot)
+"""
+
+Registro = namedtuple(
+    "Registro",
+    "chave identificador titulo autor ano categoria quantidade quantidade_disponivel",
+)
+
+
+def normalizar(titulo):
+    """Chave de busca de um título: sem espaços nas pontas e em minúsculas."""
+    return titulo.strip().lower()
+
+
+def criar_estrutura(cur):
+    """
+    Prepara o PostgreSQL para a geração de deltas do snapshot: a tabela
+    obras_removidas, que registra as exclusões. As alterações são
+    encontradas pelo xmin das linhas de obras (ver ``gerar_delta``); a
+    coluna atualizado_em de versões anteriores, preenchida com a hora de
+    início da transação, é removida.
+
+    Args:
+        cur (cursor): Cursor de uma conexão aberta.
+    """
+    from connect import tipo_identificador
+    tipo = tipo_identificador(cur)
+    cur.execute(f"""
+        DROP TRIGGER IF EXISTS trg_obras_atualizado_em ON obras;
+        DROP FUNCTION IF EXISTS obras_marcar_atualizacao();
+        ALTER TABLE obras DROP COLUMN IF EXISTS atualizado_em;
+
+        CREATE TABLE IF NOT EXISTS obras_removidas (
+            identificador {tipo} PRIMARY KEY,
+            removida_em TIMESTAMP NOT NULL DEFAULT clock_timestamp()
+        );
+        ALTER TABLE obras_removidas ALTER COLUMN removida_em SET DEFAULT clock_timestamp();
+
+        CREATE OR REPLACE FUNCTION obras_registrar_remocao() RETURNS trigger AS $$
+        BEGIN
+            INSERT INTO obras_removidas (identificador) VALUES (OLD.identificador)
+            ON CONFLICT (identificador) DO UPDATE SET removida_em = clock_timestamp();
+            RETURN OLD;
+        END;
+        $$ LANGUAGE plpgsql;
+
+        DROP TRIGGER IF EXISTS trg_obras_removidas ON obras;
+        CREATE TRIGGER trg_obras_removidas
+            AFTER DELETE ON obras
+            FOR EACH ROW EXECUTE FUNCTION obras_registrar_remocao();
+    """)
+
+
+def _texto(valor):
+    dados = (valor or "").encode("utf-8")
+    return TEXTO.pack(len(dados)) + dados
+
+
+def _ler_marca(caminho):
+    try:
+        with open(f"{caminho}.marca", encoding="utf-8") as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+
+def _gravar_marca(caminho, seq, snapshot):
+    temporario = f"{caminho}.marca.tmp"
+    with open(temporario, "w", encoding="utf-8") as f:
+        json.dump({"seq": seq, "snapshot": snapshot}, f)
+    os.replace(temporario, f"{caminho}.marca")
+
+
+def gerar_snapshot(caminho):
+    """
+    Exporta o catálogo de obras para um arquivo compacto, ordenado pelo
+    título normalizado, que pode ser aberto com mmap pelos quiosques.
+
+    Formato: cabeçalho, tabela de deslocamentos (um uint32 por obra, na
+    ordem dos títulos) e os registros, cada um com a chave de busca
+    primeiro para que a busca binária leia o mínimo possível.
+
+    Deltas anteriores do mesmo arquivo são apagados. No PostgreSQL, o
+    snapshot de transação da leitura fica guardado para ``gerar_delta``:
+    a transação é REPEATABLE READ, então ele é exatamente o usado na
+    exportação.
+
+    Args:
+        caminho (str): Arquivo de destino.
+
+    Returns:
+        int: Quantidade de obras exportadas.
+    """
+    conn = conectar("leitura")
+    cur = conn.cursor()
+    try:
+        snapshot = None
+        if backend_padrao.nome == "postgres":
+            cur.execute("SET TRANSACTION ISOLATION LEVEL REPEATABLE READ;")
+            cur.execute("SELECT pg_current_snapshot()::text;")
+            snapshot = cur.fetchone()[0]
+        cur.execute("""
+            SELECT identificador, titulo, autor, ano, categoria, quantidade, quantidade_disponivel
+            FROM obras;
+        """)
+        linhas = cur.fetchall()
+        conn.rollback()
+    finally:
+        cur.close()
+        conn.close()
+
+    registros = []
+    for ident, titulo, autor, ano, categoria, quantidade, disponivel in linhas:
+        chave = normalizar(titulo).encode("utf-8")
+        corpo = (_texto(str(ident)) + _texto(titulo) + _texto(autor) + _texto(categoria)
+                 + NUMEROS.pack(ano or 0, quantidade, disponivel))
+        registros.append((chave, TEXTO.pack(len(chave)) + chave + corpo))
+    registros.sort(key=lambda r: r[0])
+
+    inicio = CABECALHO.size + DESLOCAMENTO.size * len(registros)
+    temporario = f"{caminho}.tmp"
+    with open(temporario, "wb") as f:
+        f.write(CABECALHO.pack(ASSINATURA, VERSAO_FORMATO, 0, len(registros), time.time()))
+        deslocamento = inicio
+        for _, dados in registros:
+            f.write(DESLOCAMENTO.pack(deslocamento))
+            deslocamento += len(dados)
+        for _, dados in registros:
+            f.write(dados)
+    os.replace(temporario, caminho)
+
+    for delta in glob.glob(f"{caminho}.delta.*"):
+        os.remove(delta)
+    _gravar_marca(caminho, 0, snapshot)
+    return len(registros)
+
+
+def gerar_delta(caminho):
+    """
+    Grava um arquivo de delta (JSON lines) com as obras alteradas ou
+    removidas desde o snapshot ou o delta anterior.
+
+    As alterações são as linhas de ``obras`` e ``obras_removidas`` cujo
+    xmin não era visível no snapshot de transação guardado pela exportação
+    anterior, como em analises.atualizar_circulacao: uma transação que
+    começou antes da exportação e só confirmou depois dela (uma devolução
+    que esperou o operador, por exemplo) entra neste delta, qualquer que
+    seja a hora em que gravou. Uma linha com xmin muito antigo pode ser
+    tomada por nova; no pior caso a obra é enviada sem necessidade.
+
+    A leitura é feita no primário, que atribui o xid usado como referência
+    do age(xmin); a transação é REPEATABLE READ, então o snapshot guardado
+    é exatamente o usado na leitura. Somente PostgreSQL.
+
+    Args:
+        caminho (str): Arquivo do snapshot base.
+
+    Returns:
+        int: Quantidade de alterações gravadas.
+
+    Raises:
+        FileNotFoundError: Se o snapshot não foi gerado ou foi gerado sem
+            snapshot de transação (SQLite ou versão anterior); gere-o de novo.
+    """
+    marca = _ler_marca(caminho)
+    if marca is None or not marca.get("snapshot"):
+        raise FileNotFoundError(f"Snapshot '{caminho}' ainda não foi gerado (ou foi gerado por uma "
+                                "versão anterior); execute 'python snapshot.py gerar'.")
+
+    conn = conectar()
+    cur = conn.cursor()
+    try:
+        cur.execute("SET TRANSACTION ISOLATION LEVEL REPEATABLE READ;")
+        cur.execute("SELECT pg_current_xact_id()::text::bigint, pg_current_snapshot()::text;")
+        atual, snapshot = cur.fetchone()
+        parametros = {"atual": atual, "snapshot": marca["snapshot"]}
+        cur.execute(f"""
+            SELECT identificador, titulo, autor, ano, categoria, quantidade, quantidade_disponivel
+            FROM obras
+            WHERE {FILTRO_NOVAS.format(tabela="obras")};
+        """, parametros)
+        alteradas = cur.fetchall()
+        cur.execute(f"""
+            SELECT identificador FROM obras_removidas
+            WHERE {FILTRO_NOVAS.format(tabela="obras_removidas")};
+        """, parametros)
+        removidas = cur.fetchall()
+        conn.rollback()
+    finally:
+        cur.close()
+        conn.close()
+
+    seq = marca["seq"] + 1
+    temporario = f"{caminho}.delta.tmp"
+    with open(temporario, "w", encoding="utf-8") as f:
+        for ident, titulo, autor, ano, categoria, quantidade, disponivel in alteradas:
+            f.write(json.dumps({
+                "identificador": str(ident), "titulo": titulo, "autor": autor, "ano": ano,
+                "categoria": categoria, "quantidade": quantidade,
+                "quantidade_disponivel": disponivel,
+            }) + "\n")
+        for (ident,) in removidas:
+            f.write(json.dumps({"identificador": str(ident), "removida": True}) + "\n")
+    os.replace(temporario, f"{caminho}.delta.{seq:06d}")
+    _gravar_marca(caminho, seq, snapshot)
+    return len(alteradas) + len(removidas)
+
+
+class SnapshotCatalogo:
+    """
+    Leitor somente leitura de um snapshot do catálogo.
+
+    O arquivo é mapeado em memória (mmap) e consultado por busca binária
+    na tabela de deslocamentos, sem carregar os registros: a abertura leva
+    milissegundos mesmo para catálogos grandes. Os deltas gerados depois
+    do snapshot ficam em um pequeno dicionário sobreposto ao arquivo.
+    """
+
+    def __init__(self, caminho):
+        """
+        Args:
+            caminho (str): Arquivo do snapshot.
+
+        Raises:
+            ValueError: Se o arquivo não for um snapshot válido.
+        """
+        self.caminho = caminho
+        self._abrir()
+        self.atualizar()
+
+    def _abrir(self):
+        """Mapeia o arquivo atual do snapshot e descarta os deltas aplicados."""
+        self._arquivo = open(self.caminho, "rb")
+        self._inode = os.fstat(self._arquivo.fileno()).st_ino
+        self._mapa = mmap.mmap(self._arquivo.fileno(), 0, access=mmap.ACCESS_READ)
+        assinatura, versao, _, self.total, self.gerado_em = CABECALHO.unpack_from(self._mapa, 0)
+        if assinatura != ASSINATURA or versao != VERSAO_FORMATO:
+            self.fechar()
+            raise ValueError(f"'{self.caminho}' não é um snapshot do acervo compatível.")
+
+        self._alterados = {}
+        self._removidos = set()
+        self._alterados_por_chave = {}
+        self._ultimo_delta = ""
+
+    def _deslocamento(self, i):
+        return DESLOCAMENTO.unpack_from(self._mapa, CABECALHO.size + DESLOCAMENTO.size * i)[0]
+
+    def _ler_texto(self, pos):
+        tamanho = TEXTO.unpack_from(self._mapa, pos)[0]
+        inicio = pos + TEXTO.size
+        return self._mapa[inicio:inicio + tamanho].decode("utf-8"), inicio + tamanho
+
+    def _chave(self, i):
+        pos = self._deslocamento(i)
+        tamanho = TEXTO.unpack_from(self._mapa, pos)[0]
+        return self._mapa[pos + TEXTO.size:pos + TEXTO.size + tamanho]
+
+    def _registro(self, i):
+        chave, pos = self._ler_texto(self._deslocamento(i))
+        ident, pos = self._ler_texto(pos)
+        titulo, pos = self._ler_texto(pos)
+        autor, pos = self._ler_texto(pos)
+        categoria, pos = self._ler_texto(pos)
+        ano, quantidade, disponivel = NUMEROS.unpack_from(self._mapa, pos)
+        return Registro(chave, ident, titulo, autor, ano or None, categoria, quantidade, disponivel)
+
+    def _primeiro_maior_ou_igual(self, chave):
+        """Busca binária pela primeira posição com chave >= a informada."""
+        baixo, alto = 0, self.total
+        while baixo < alto:
+            meio = (baixo + alto) // 2
+            if self._chave(meio) < chave:
+                baixo = meio + 1
+            else:
+                alto = meio
+        return baixo
+
+    def _sobrepor(self, registros, aceita):
+        """Aplica os deltas sobre registros do arquivo e acrescenta as obras novas."""
+        resultado = {}
+        for registro in registros:
+            if registro.identificador in self._removidos:
+                continue
+            registro = self._alterados.get(registro.identificador, registro)
+            if aceita(registro.chave):
+                resultado[registro.identificador] = registro
+        for chave, idents in self._alterados_por_chave.items():
+            if aceita(chave):
+                for ident in idents:
+                    resultado.setdefault(ident, self._alterados[ident])
+        return sorted(resultado.values(), key=lambda r: (r.chave, r.identificador))
+
+    def buscar(self, titulo):
+        """
+        Procura as obras com exatamente o título informado (sem diferenciar
+        maiúsculas/minúsculas).
+
+        Args:
+            titulo (str): Título a procurar.
+
+        Returns:
+            list[Registro]: Obras encontradas.
+        """
+        chave = normalizar(titulo)
+        chave_bytes = chave.encode("utf-8")
+        registros = []
+        i = self._primeiro_maior_ou_igual(chave_bytes)
+        while i < self.total and self._chave(i) == chave_bytes:
+            registros.append(self._registro(i))
+            i += 1
+        return self._sobrepor(registros, lambda c: c == chave)
+
+    def buscar_prefixo(self, prefixo, limite=20):
+        """
+        Lista as obras cujo título começa com o prefixo informado.
+
+        Obras removidas ou alteradas pelos deltas são descartadas durante a
+        leitura do arquivo, sem ocupar vagas do limite; as alteradas voltam
+        à lista pelos deltas se ainda começarem com o prefixo.
+
+        Args:
+            prefixo (str): Início do título.
+            limite (int): Máximo de obras retornadas.
+
+        Returns:
+            list[Registro]: Obras encontradas, em ordem de título.
+        """
+        chave = normalizar(prefixo)
+        chave_bytes = chave.encode("utf-8")
+        registros = []
+        i = self._primeiro_maior_ou_igual(chave_bytes)
+        while i < self.total and len(registros) < limite and self._chave(i).startswith(chave_bytes):
+            registro = self._registro(i)
+            i += 1
+            if registro.identificador in self._removidos or registro.identificador in self._alterados:
+                continue
+            registros.append(registro)
+        return self._sobrepor(registros, lambda c: c.startswith(chave))[:limite]
+
+    def atualizar(self):
+        """
+        Aplica os arquivos de delta ainda não lidos. Se um novo snapshot
+        tiver substituído o arquivo, ele é reaberto antes.
+
+        Returns:
+            int: Quantidade de deltas aplicados.
+        """
+        if os.stat(self.caminho).st_ino != self._inode:
+            self.fechar()
+            self._abrir()
+        novos = sorted(d for d in glob.glob(f"{self.caminho}.delta.*")
+                       if d[-6:].isdigit() and d > self._ultimo_delta)
+        for delta in novos:
+            with open(delta, encoding="utf-8") as f:
+                for linha in f:
+                    self._aplicar(json.loads(linha))
+            self._ultimo_delta = delta
+        return len(novos)
+
+    def _aplicar(self, item):
+        ident = item["identificador"]
+        anterior = self._alterados.pop(ident, None)
+        if anterior is not None:
+            self._alterados_por_chave[anterior.chave].discard(ident)
+        if item.get("removida"):
+            self._removidos.add(ident)
+            return
+        self._removidos.discard(ident)
+        registro = Registro(
+            normalizar(item["titulo"]), ident, item["titulo"], item["autor"], item["ano"],
+            item["categoria"], item["quantidade"], item["quantidade_disponivel"],
+        )
+        self._alterados[ident] = registro
+        self._alterados_por_chave.setdefault(registro.chave, set()).add(ident)
+
+    def fechar(self):
+        """Libera o mapeamento e o arquivo."""
+        self._mapa.close()
+        self._arquivo.close()
+
+
+class _SemBanco:
+    """Backend do modo quiosque: qualquer acesso ao banco é recusado."""
+
+    nome = "somente_leitura"
+
+    def conectar(self, modo="escrita"):
+        raise RuntimeError("Acervo em modo somente leitura (quiosque): sem acesso ao banco.")
+
+
+def executar_quiosque(caminho, intervalo_atualizacao=60):
+    """
+    Terminal de consulta do quiosque: busca obras por título (ou início do
+    título) no snapshot, aplicando novos deltas periodicamente.
+
+    Args:
+        caminho (str): Arquivo do snapshot.
+        intervalo_atualizacao (int): Segundos entre verificações de novos deltas.
+    """
+    from core import Acervo
+    from rich.console import Console
+    from rich.table import Table
+
+    console = Console()
+    acervo = Acervo.somente_leitura(caminho)
+    ultima_verificacao = time.monotonic()
+    while True:
+        busca = input("\nBuscar título (Enter para sair): ").strip()
+        if not busca:
+            break
+        if time.monotonic() - ultima_verificacao > intervalo_atualizacao:
+            acervo.catalogo.atualizar()
+            ultima_verificacao = time.monotonic()
+
+        tabela = Table(title=f"Resultados para '{busca}'")
+        tabela.add_column("Título", style="cyan")
+        tabela.add_column("Autor", style="magenta")
+        tabela.add_column("Ano", justify="center", style="green")
+        tabela.add_column("Categoria", style="blue")
+        tabela.add_column("Disponível", justify="right", style="yellow")
+        for r in acervo.catalogo.buscar_prefixo(busca):
+            tabela.add_row(r.titulo, r.autor, str(r.ano or "-"), r.categoria, str(r.quantidade_disponivel))
+        console.print(tabela)
+
+
+if __name__ == "__main__":
+    if len(sys.argv) != 3:
+        print("Uso: python snapshot.py [gerar|delta|quiosque] <arquivo>")
+        sys.exit(1)
+    comando, caminho = sys.argv[1], sys.argv[2]
+    if comando == "gerar":
+        print(f"{gerar_snapshot(caminho)} obra(s) exportada(s) para '{caminho}'.")
+    elif comando == "delta":
+        print(f"{gerar_delta(caminho)} alteração(ões) gravada(s).")
+    elif comando == "quiosque":
+        executar_quiosque(caminho)
+    else:
+        print("Uso: python snapshot.py [gerar|delta|quiosque] <arquivo>")
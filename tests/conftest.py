@@ -0,0 +1,164 @@
+"""
+Fixtures dos testes que rodam no backend SQLite (armazenamento.py), sem
+servidor PostgreSQL:
+
+    python -m pytest tests
+
+Cada teste recebe um banco novo em um diretório temporário e uma
+instância própria do cache de relatórios, para que resultados guardados
+por um teste não sejam vistos por outro.
+
+Os jobs exclusivos do PostgreSQL são testados em um schema próprio,
+criado e removido a cada teste no banco de ACERVO_TESTE_DSN_ESCRITA
+(fixture ``banco_pg``); sem a variável, esses testes são pulados.
+"""
+import os
+from uuid import uuid4
+
+import pytest
+
+from armazenamento import BackendSQLite
+from cache import CacheRelatorios
+
+
+@pytest.fixture
+def backend(tmp_path):
+    """Banco SQLite vazio, com a estrutura do Acervo."""
+    backend = BackendSQLite(str(tmp_path / "acervo.db"))
+    backend.criar_estrutura()
+    return backend
+
+
+@pytest.fixture
+def cache(monkeypatch):
+    """Cache de relatórios vazio no lugar do compartilhado pelo processo."""
+    import core
+    import fila_offline
+    novo = CacheRelatorios()
+    monkeypatch.setattr(core, "cache_relatorios", novo)
+    monkeypatch.setattr(fila_offline, "cache_relatorios", novo)
+    return novo
+
+
+@pytest.fixture
+def cadastrar(backend):
+    """Funções que gravam obras e usuários direto no banco de teste."""
+
+    class Cadastro:
+        @staticmethod
+        def obra(titulo, quantidade=1, categoria="Romance"):
+            ident = uuid4()
+            _executar(backend, """
+                INSERT INTO obras (identificador, titulo, autor, ano, categoria,
+                                   quantidade, quantidade_disponivel)
+                VALUES (%s, %s, %s, %s, %s, %s, %s);
+            """, (ident, titulo, "Autor", 1900, categoria, quantidade, quantidade))
+            return ident
+
+        @staticmethod
+        def usuario(nome, email=None):
+            ident = uuid4()
+            _executar(backend, "INSERT INTO usuarios (identificador, nome, email) VALUES (%s, %s, %s);",
+                      (ident, nome, email))
+            return ident
+
+        @staticmethod
+        def saldo(id_usuario, valor):
+            _executar(backend, "INSERT INTO saldos_usuarios (usuario, saldo) VALUES (%s, %s);",
+                      (id_usuario, valor))
+
+    return Cadastro
+
+
+def consultar(backend, sql, parametros=None):
+    """Linhas de uma consulta no banco de teste."""
+    conn = backend.conectar()
+    try:
+        cur = conn.cursor()
+        cur.execute(sql, parametros)
+        return cur.fetchall()
+    finally:
+        conn.close()
+
+
+def _executar(backend, sql, parametros):
+    conn = backend.conectar()
+    try:
+        cur = conn.cursor()
+        cur.execute(sql, parametros)
+        conn.commit()
+    finally:
+        conn.close()
+
+
+DSN_TESTE_PG = os.getenv("ACERVO_TESTE_DSN_ESCRITA")
+
+
+@pytest.fixture
+def banco_pg(monkeypatch):
+    """Schema PostgreSQL vazio com as tabelas principais e a estrutura dos módulos."""
+    if not DSN_TESTE_PG:
+        pytest.skip("defina ACERVO_TESTE_DSN_ESCRITA")
+    pg = pytest.importorskip("psycopg2")
+    schema = f"teste_{uuid4().hex[:12]}"
+    conn = pg.connect(DSN_TESTE_PG)
+    conn.autocommit = True
+    cur = conn.cursor()
+    cur.execute(f"""
+        CREATE SCHEMA {schema};
+        SET search_path = {schema};
+        CREATE TABLE obras (
+            identificador UUID PRIMARY KEY, titulo TEXT NOT NULL, autor TEXT, ano INT,
+            categoria TEXT, quantidade INT NOT NULL, quantidade_disponivel INT NOT NULL
+        );
+        CREATE TABLE usuarios (identificador UUID PRIMARY KEY, nome TEXT NOT NULL, email TEXT);
+        CREATE TABLE emprestimos (
+            id SERIAL PRIMARY KEY, identificador UUID NOT NULL UNIQUE,
+            obra UUID NOT NULL REFERENCES obras, usuario UUID NOT NULL REFERENCES usuarios,
+            data_retirada DATE NOT NULL, data_prev_devol DATE NOT NULL, data_devol DATE
+        );
+    """)
+    monkeypatch.setenv("ACERVO_BACKEND", "postgres")
+    monkeypatch.setenv("DB_DSN_ESCRITA", f"{DSN_TESTE_PG} options='-c search_path={schema}'")
+    monkeypatch.delenv("DB_DSN_LEITURA", raising=False)
+    import esquema
+    esquema.preparar_banco()
+    banco = BancoPG(pg.connect(DSN_TESTE_PG, options=f"-c search_path={schema}"))
+    try:
+        yield banco
+    finally:
+        banco.conn.close()
+        cur.execute(f"DROP SCHEMA {schema} CASCADE;")
+        conn.close()
+
+
+class BancoPG:
+    """Acesso direto ao schema de teste, fora das funções testadas."""
+
+    def __init__(self, conn):
+        self.conn = conn
+        self.conn.autocommit = True
+        self.obra = uuid4()
+        self.usuario = uuid4()
+        self.executar("""
+            INSERT INTO obras (identificador, titulo, autor, ano, categoria, quantidade, quantidade_disponivel)
+            VALUES (%s, 'Dom Casmurro', 'Machado', 1899, 'Romance', 10, 10);
+        """, (self.obra,))
+        self.executar("INSERT INTO usuarios (identificador, nome) VALUES (%s, 'Ana');", (self.usuario,))
+
+    def executar(self, sql, parametros=None):
+        cur = self.conn.cursor()
+        cur.execute(sql, parametros)
+        return cur.fetchall() if cur.description else None
+
+    def emprestar(self, retirada, prev_devol, devol=None):
+        ident = uuid4()
+        self.executar("""
+            INSERT INTO emprestimos (identificador, obra, usuario, data_retirada, data_prev_devol, data_devol)
+            VALUES (%s, %s, %s, %s, %s, %s);
+        """, (ident, self.obra, self.usuario, retirada, prev_devol, devol))
+        return ident
+
+    def saldo(self):
+        linhas = self.executar("SELECT saldo FROM saldos_usuarios WHERE usuario = %s;", (self.usuario,))
+        return linhas[0][0] if linhas else 0
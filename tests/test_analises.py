@@ -0,0 +1,35 @@
+"""Agregados diários de circulação (analises.py), exclusivos do PostgreSQL."""
+from datetime import date, timedelta
+
+import analises
+
+HOJE = date(2026, 10, 19)
+
+
+def _circulacao(banco_pg):
+    return banco_pg.executar("SELECT * FROM circulacao_diaria ORDER BY dia, obra;")
+
+
+def test_recalcula_dias_antigos_alterados(banco_pg):
+    banco_pg.emprestar(HOJE - timedelta(days=3), HOJE + timedelta(days=4))
+    antigo = banco_pg.emprestar(HOJE - timedelta(days=60), HOJE - timedelta(days=50))
+    analises.atualizar_circulacao(HOJE)
+
+    # Depois da execução: um empréstimo retroativo e uma devolução
+    # retroativa, os dois bem antes da janela de JANELA_DIAS dias
+    banco_pg.emprestar(HOJE - timedelta(days=40), HOJE - timedelta(days=33), HOJE - timedelta(days=35))
+    banco_pg.executar("UPDATE emprestimos SET data_devol = %s WHERE identificador = %s;",
+                      (HOJE - timedelta(days=45), antigo))
+    analises.atualizar_circulacao(HOJE + timedelta(days=1))
+    incremental = _circulacao(banco_pg)
+
+    analises.atualizar_circulacao(HOJE + timedelta(days=1), completo=True)
+    assert incremental == _circulacao(banco_pg)
+    assert (HOJE - timedelta(days=40), 1) in [(dia, emprestimos) for dia, _, _, emprestimos, *_ in incremental]
+
+
+def test_sem_alteracoes_so_recalcula_a_janela(banco_pg):
+    banco_pg.emprestar(HOJE - timedelta(days=60), HOJE - timedelta(days=50), HOJE - timedelta(days=55))
+    analises.atualizar_circulacao(HOJE)
+
+    assert analises.atualizar_circulacao(HOJE) == analises.JANELA_DIAS
@@ -0,0 +1,30 @@
+"""Marca d'água do job de atrasos (atrasos.py), exclusivo do PostgreSQL."""
+from datetime import date, timedelta
+
+import atrasos
+import debitos
+
+HOJE = date(2026, 10, 19)
+
+
+def test_marca_cada_emprestimo_uma_vez(banco_pg):
+    banco_pg.emprestar(HOJE - timedelta(days=20), HOJE - timedelta(days=10))
+
+    assert atrasos.executar_job_atrasos(HOJE) == 1
+    assert atrasos.executar_job_atrasos(HOJE) == 0
+    assert banco_pg.saldo() == 10 * debitos.MULTA_DIARIA
+
+    assert atrasos.executar_job_atrasos(HOJE + timedelta(days=1)) == 0
+    assert banco_pg.saldo() == 11 * debitos.MULTA_DIARIA
+    assert banco_pg.executar("SELECT COUNT(*) FROM lembretes_outbox;") == [(1,)]
+
+
+def test_marca_emprestimo_retroativo(banco_pg):
+    atrasos.executar_job_atrasos(HOJE)
+
+    # Reaplicado da fila offline depois da execução, já vencido há 30 dias
+    banco_pg.emprestar(HOJE - timedelta(days=40), HOJE - timedelta(days=30))
+
+    assert atrasos.executar_job_atrasos(HOJE) == 1
+    assert banco_pg.saldo() == 30 * debitos.MULTA_DIARIA
+    assert debitos.reconciliar() == 0
@@ -0,0 +1,96 @@
+"""Invalidação do cache de relatórios (cache.py) pelas versões dos domínios."""
+import json
+from datetime import date
+
+import pytest
+
+
+def _linhas_inventario(acervo):
+    return acervo.relatorio_inventario().row_count
+
+
+def test_resultado_guardado_enquanto_versoes_nao_mudam(backend, cache):
+    chamadas = []
+
+    def carregar(cur):
+        chamadas.append(1)
+        cur.execute("SELECT COUNT(*) FROM obras;")
+        return cur.fetchall()
+
+    assert cache.obter("contagem", ("obras",), carregar, backend.conectar) == [(0,)]
+    assert cache.obter("contagem", ("obras",), carregar, backend.conectar) == [(0,)]
+    assert len(chamadas) == 1
+
+
+def test_escrita_de_outro_processo_invalida(backend, cache, cadastrar):
+    from core import Acervo
+    acervo = Acervo(backend)
+    cadastrar.obra("Dom Casmurro")
+    assert _linhas_inventario(acervo) == 1
+
+    # Gravada por outra conexão que incrementa a versão na mesma transação
+    conn = backend.conectar()
+    cur = conn.cursor()
+    cur.execute("""
+        INSERT INTO obras (identificador, titulo, autor, ano, categoria, quantidade, quantidade_disponivel)
+        VALUES ('x', 'Iracema', 'Alencar', 1865, 'Romance', 1, 1);
+    """)
+    cache.invalidar(cur, "obras")
+    conn.commit()
+    conn.close()
+
+    assert _linhas_inventario(acervo) == 2
+
+
+def test_escrita_sem_invalidar_mantem_resultado_guardado(backend, cache, cadastrar):
+    from core import Acervo
+    acervo = Acervo(backend)
+    assert _linhas_inventario(acervo) == 0
+    cadastrar.obra("Dom Casmurro")
+    assert _linhas_inventario(acervo) == 0
+
+
+def test_adicionar_obra_invalida_inventario(backend, cache):
+    from core import Acervo
+    from models import Obra
+    acervo = Acervo(backend)
+    assert _linhas_inventario(acervo) == 0
+    acervo.adicionar(Obra("Memórias Póstumas", "Machado", 1881, "Romance", 2, 2))
+    assert _linhas_inventario(acervo) == 1
+
+
+def test_invalidar_so_afeta_dominios_informados(backend, cache):
+    conn = backend.conectar()
+    cur = conn.cursor()
+    obras, saldos = cache.versoes(cur, ("obras", "saldos"))
+    for _ in range(3):
+        cache.invalidar(cur, "saldos")
+    conn.commit()
+    assert cache.versoes(cur, ("obras", "saldos")) == (obras, saldos + 3)
+    conn.close()
+
+
+def test_resultado_gravado_em_disco_como_json(backend, tmp_path):
+    from decimal import Decimal
+    from cache import CacheRelatorios
+    linhas = [("Ana", Decimal("12.50"), date(2026, 10, 1)), ("Bruno", 3, None)]
+    CacheRelatorios(str(tmp_path)).obter("debitos", ("saldos",), lambda cur: linhas, backend.conectar)
+
+    outro_processo = CacheRelatorios(str(tmp_path))
+    assert outro_processo.obter("debitos", ("saldos",), lambda cur: [], backend.conectar) == linhas
+    assert json.loads((tmp_path / "debitos.json").read_text())["linhas"][0][1] == {"decimal": "12.50"}
+
+
+def test_arquivo_adulterado_e_ignorado(backend, tmp_path):
+    from cache import CacheRelatorios
+    (tmp_path / "debitos.json").write_text("cos\nsystem\n(S'echo x'\ntR.")
+    assert CacheRelatorios(str(tmp_path)).obter("debitos", ("saldos",), lambda cur: [], backend.conectar) == []
+
+
+def test_dominio_desconhecido(backend, cache):
+    conn = backend.conectar()
+    try:
+        with pytest.raises(ValueError):
+            cache.invalidar(conn.cursor(), "livros")
+    finally:
+        conn.close()
@@ -0,0 +1,69 @@
+"""Empréstimo em carrinho (Acervo.emprestar_carrinho) no backend SQLite."""
+import pytest
+
+from conftest import consultar
+
+
+@pytest.fixture
+def acervo(backend, cache):
+    from core import Acervo
+    return Acervo(backend)
+
+
+@pytest.fixture
+def ana(cadastrar):
+    from models import Usuario
+    usuario = Usuario("Ana", None)
+    usuario.ident = cadastrar.usuario("Ana")
+    return usuario
+
+
+def test_estoque_insuficiente_cancela_tudo(backend, acervo, ana, cadastrar):
+    cadastrar.obra("Dom Casmurro", quantidade=2)
+    cadastrar.obra("Iracema", quantidade=1)
+
+    resultados = acervo.emprestar_carrinho(ana, ["Dom Casmurro", "dom casmurro", "DOM CASMURRO", "Iracema"], 7)
+
+    assert [situacao for _, situacao in resultados] == ["Cancelado", "Cancelado", "Indisponível", "Cancelado"]
+    assert consultar(backend, "SELECT COUNT(*) FROM emprestimos;") == [(0,)]
+    assert sorted(consultar(backend, "SELECT titulo, quantidade_disponivel FROM obras;")) == [
+        ("Dom Casmurro", 2), ("Iracema", 1)]
+
+
+def test_empresta_o_que_houver_em_estoque(backend, acervo, ana, cadastrar):
+    cadastrar.obra("Dom Casmurro", quantidade=2)
+
+    resultados = acervo.emprestar_carrinho(ana, ["Dom Casmurro"] * 3 + ["Iracema"], 7, tudo_ou_nada=False)
+
+    assert [situacao for _, situacao in resultados] == [
+        "Emprestado", "Emprestado", "Indisponível", "Obra não encontrada"]
+    assert consultar(backend, "SELECT COUNT(*) FROM emprestimos;") == [(2,)]
+    assert consultar(backend, "SELECT quantidade_disponivel FROM obras;") == [(0,)]
+
+
+def test_titulos_com_acentos_e_espacos(backend, acervo, ana, cadastrar):
+    cadastrar.obra("ÉTICA", quantidade=1)
+
+    assert acervo.emprestar_carrinho(ana, ["  ética "], 7) == [("ÉTICA", "Emprestado")]
+
+
+def test_usuario_com_debito_e_bloqueado(backend, acervo, ana, cadastrar):
+    import debitos
+    cadastrar.obra("Dom Casmurro")
+    cadastrar.saldo(ana.ident, debitos.LIMITE_DEBITO + 1)
+
+    assert acervo.emprestar_carrinho(ana, ["Dom Casmurro"], 7) == [("Dom Casmurro", "Bloqueado por débito")]
+    assert consultar(backend, "SELECT quantidade_disponivel FROM obras;") == [(1,)]
+
+
+def test_emprestimo_invalida_inventario(backend, acervo, ana, cadastrar, cache):
+    def disponiveis():
+        linhas = cache.obter("inventario", ("obras",), acervo._consultar_inventario, acervo._conectar_leitura)
+        return [linha[-1] for linha in linhas]
+
+    cadastrar.obra("Dom Casmurro")
+    assert disponiveis() == [1]
+
+    acervo.emprestar_carrinho(ana, ["Dom Casmurro"], 7)
+
+    assert disponiveis() == [0]
@@ -0,0 +1,25 @@
+"""Saldos devedores (debitos.py), exclusivos do PostgreSQL."""
+from datetime import date, timedelta
+
+import atrasos
+import debitos
+import esquema
+
+HOJE = date(2026, 10, 19)
+
+
+def test_saldos_semeados_do_historico_existente(banco_pg):
+    banco_pg.emprestar(HOJE - timedelta(days=30), HOJE - timedelta(days=20), HOJE - timedelta(days=17))
+    banco_pg.emprestar(HOJE - timedelta(days=20), HOJE - timedelta(days=10))
+    atrasos.executar_job_atrasos(HOJE)
+
+    # Banco anterior aos saldos: o histórico existe, a tabela ainda não
+    banco_pg.executar("DROP TABLE saldos_usuarios; UPDATE atrasos SET dias_cobrados = 0;")
+    esquema.preparar_banco()
+
+    assert banco_pg.saldo() == (3 + 10) * debitos.MULTA_DIARIA
+    assert debitos.reconciliar() == 0
+
+    esquema.preparar_banco()
+    atrasos.executar_job_atrasos(HOJE + timedelta(days=1))
+    assert banco_pg.saldo() == (3 + 11) * debitos.MULTA_DIARIA
@@ -0,0 +1,98 @@
+"""Reaplicação da fila offline (fila_offline.py) no backend SQLite."""
+from uuid import uuid4
+
+import pytest
+
+from conftest import consultar
+from fila_offline import FilaOffline
+
+
+@pytest.fixture
+def fila(tmp_path):
+    fila = FilaOffline(str(tmp_path / "fila.db"))
+    yield fila
+    fila.fechar()
+
+
+def _emprestimo(usuario, titulo, **extras):
+    dados = {"usuario": usuario, "titulo": titulo, "emprestimo": str(uuid4()),
+             "data_retirada": "2026-10-01", "data_prev_devol": "2026-10-08"}
+    dados.update(extras)
+    return dados
+
+
+def _reabrir(fila):
+    """Simula uma sincronização interrompida antes de atualizar a fila local."""
+    with fila._local() as local:
+        local.execute("UPDATE operacoes SET situacao = 'pendente', motivo = NULL;")
+
+
+def test_reaplicacao_e_idempotente(backend, cache, cadastrar, fila):
+    cadastrar.usuario("Ana")
+    cadastrar.obra("Dom Casmurro", quantidade=2)
+    fila.registrar("emprestimo", _emprestimo("Ana", "Dom Casmurro"))
+    fila.registrar("devolucao", {"usuario": "Ana", "titulo": "Dom Casmurro", "data_devol": "2026-10-05"})
+
+    totais = fila.sincronizar(backend)
+    assert (totais["aplicadas"], totais["repetidas"], totais["conflitos"]) == (2, 0, 0)
+
+    _reabrir(fila)
+    totais = fila.sincronizar(backend)
+    assert (totais["aplicadas"], totais["repetidas"], totais["conflitos"]) == (0, 2, 0)
+
+    assert consultar(backend, "SELECT COUNT(*) FROM emprestimos;") == [(1,)]
+    assert consultar(backend, "SELECT quantidade_disponivel FROM obras;") == [(2,)]
+    assert fila.pendentes() == 0
+
+
+def test_mesmo_emprestimo_registrado_duas_vezes(backend, cache, cadastrar, fila):
+    cadastrar.usuario("Ana")
+    cadastrar.obra("Dom Casmurro", quantidade=2)
+    dados = _emprestimo("Ana", "Dom Casmurro")
+    fila.registrar("emprestimo", dados)
+    fila.registrar("emprestimo", dados)
+
+    totais = fila.sincronizar(backend)
+
+    assert (totais["aplicadas"], totais["conflitos"]) == (1, 1)
+    assert consultar(backend, "SELECT quantidade_disponivel FROM obras;") == [(1,)]
+
+
+def test_conflitos_nao_impedem_o_restante_do_lote(backend, cache, cadastrar, fila):
+    cadastrar.usuario("Ana")
+    cadastrar.obra("Dom Casmurro", quantidade=1)
+    fila.registrar("emprestimo", _emprestimo("Ana", "Dom Casmurro"))
+    fila.registrar("emprestimo", _emprestimo("Ana", "Dom Casmurro"))
+    fila.registrar("emprestimo", _emprestimo("Zé", "Dom Casmurro"))
+    fila.registrar("emprestimo", _emprestimo("Ana", "Iracema"))
+
+    totais = fila.sincronizar(backend, tamanho_lote=10)
+
+    assert (totais["aplicadas"], totais["conflitos"]) == (1, 3)
+    motivos = [motivo for _, _, _, motivo in fila.conflitos()]
+    assert motivos == ["nenhum exemplar disponível no estoque",
+                       "usuário 'Zé' não encontrado",
+                       "obra 'Iracema' não encontrada"]
+    assert consultar(backend, "SELECT quantidade_disponivel FROM obras;") == [(0,)]
+
+
+def test_emprestimo_de_usuario_com_debito_vai_para_conferencia(backend, cache, cadastrar, fila):
+    import debitos
+    id_usuario = cadastrar.usuario("Ana")
+    cadastrar.saldo(id_usuario, debitos.LIMITE_DEBITO + 1)
+    cadastrar.obra("Dom Casmurro")
+    fila.registrar("emprestimo", _emprestimo("Ana", "Dom Casmurro"))
+
+    totais = fila.sincronizar(backend)
+
+    assert totais["conflitos"] == 1
+    assert "débito" in fila.conflitos()[0][3]
+    assert consultar(backend, "SELECT COUNT(*) FROM emprestimos;") == [(0,)]
+
+
+def test_titulo_e_usuario_com_acentos(backend, cache, cadastrar, fila):
+    cadastrar.usuario("José")
+    cadastrar.obra("ÉTICA")
+    fila.registrar("emprestimo", _emprestimo("JOSÉ", "  ética "))
+
+    assert fila.sincronizar(backend)["aplicadas"] == 1
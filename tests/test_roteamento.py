@@ -0,0 +1,144 @@
+"""
+Roteamento de leituras e escritas (connect.py) com dois bancos PostgreSQL
+locais fazendo o papel de primário e de réplica:
+
+    createdb acervo_primario
+    createdb acervo_replica
+    export ACERVO_TESTE_DSN_ESCRITA="dbname=acervo_primario"
+    export ACERVO_TESTE_DSN_LEITURA="dbname=acervo_replica"
+    python -m pytest tests/test_roteamento.py
+
+Os dois bancos não replicam entre si: um usuário gravado só no primário
+mostra de que lado cada consulta foi feita. Sem as variáveis, os testes
+são pulados.
+"""
+import os
+from uuid import uuid4
+
+import pytest
+
+DSN_ESCRITA = os.getenv("ACERVO_TESTE_DSN_ESCRITA")
+DSN_LEITURA = os.getenv("ACERVO_TESTE_DSN_LEITURA")
+
+pytestmark = pytest.mark.skipif(
+    not (DSN_ESCRITA and DSN_LEITURA),
+    reason="defina ACERVO_TESTE_DSN_ESCRITA e ACERVO_TESTE_DSN_LEITURA",
+)
+
+pg = pytest.importorskip("psycopg2")
+
+
+def _nome_banco(dsn):
+    conn = pg.connect(dsn)
+    try:
+        cur = conn.cursor()
+        cur.execute("SELECT current_database();")
+        return cur.fetchone()[0]
+    finally:
+        conn.close()
+
+
+def _banco_da_conexao(conn):
+    cur = conn.cursor()
+    try:
+        cur.execute("SELECT current_database();")
+        return cur.fetchone()[0]
+    finally:
+        cur.close()
+        conn.close()
+
+
+@pytest.fixture
+def connect(monkeypatch):
+    """Módulo connect apontado para os dois bancos, sem escrita recente."""
+    monkeypatch.setenv("ACERVO_BACKEND", "postgres")
+    monkeypatch.setenv("DB_DSN_ESCRITA", DSN_ESCRITA)
+    monkeypatch.setenv("DB_DSN_LEITURA", DSN_LEITURA)
+    import connect as modulo
+    monkeypatch.setattr(modulo, "_ultima_escrita", float("-inf"))
+    return modulo
+
+
+@pytest.fixture
+def nomes():
+    return {"escrita": _nome_banco(DSN_ESCRITA), "leitura": _nome_banco(DSN_LEITURA)}
+
+
+def test_leitura_vai_para_a_replica(connect, nomes):
+    assert _banco_da_conexao(connect.conectar("leitura")) == nomes["leitura"]
+
+
+def test_escrita_vai_para_o_primario(connect, nomes):
+    assert _banco_da_conexao(connect.conectar()) == nomes["escrita"]
+
+
+def test_leitura_logo_apos_escrita_vai_para_o_primario(connect, nomes):
+    conn = connect.conectar()
+    cur = conn.cursor()
+    cur.execute("CREATE TEMPORARY TABLE escrita (x INT); INSERT INTO escrita VALUES (1);")
+    conn.commit()
+    conn.close()
+    assert _banco_da_conexao(connect.conectar("leitura")) == nomes["escrita"]
+
+
+def test_conexao_de_escrita_sem_commit_nao_desvia_leituras(connect, nomes):
+    conn = connect.conectar()
+    conn.rollback()
+    conn.close()
+    assert _banco_da_conexao(connect.conectar("leitura")) == nomes["leitura"]
+
+
+def test_replica_atrasada_usa_o_primario(connect, nomes, monkeypatch):
+    monkeypatch.setattr(connect, "_atraso_replica", lambda conn: connect.ATRASO_MAXIMO_LEITURA + 1)
+    assert _banco_da_conexao(connect.conectar("leitura")) == nomes["escrita"]
+
+
+def test_falha_ao_medir_o_atraso_usa_o_primario(connect, nomes, monkeypatch):
+    def falhar(conn):
+        raise pg.OperationalError("recovery conflict")
+    monkeypatch.setattr(connect, "_atraso_replica", falhar)
+    assert _banco_da_conexao(connect.conectar("leitura")) == nomes["escrita"]
+
+
+def test_replica_fora_do_ar_usa_o_primario(connect, nomes, monkeypatch, tmp_path):
+    monkeypatch.setenv("DB_DSN_LEITURA", f"host={tmp_path} dbname=inexistente connect_timeout=1")
+    assert _banco_da_conexao(connect.conectar("leitura")) == nomes["escrita"]
+
+
+def test_busca_de_usuario_do_balcao_le_do_primario(connect, monkeypatch):
+    """Um usuário recém-cadastrado (ainda fora da réplica) é encontrado."""
+    import usuarios
+    for dsn in (DSN_ESCRITA, DSN_LEITURA):
+        conn = pg.connect(dsn)
+        cur = conn.cursor()
+        cur.execute("""
+            CREATE TABLE IF NOT EXISTS usuarios (
+                identificador UUID PRIMARY KEY,
+                nome TEXT NOT NULL,
+                email TEXT
+            );
+        """)
+        usuarios.criar_estrutura(cur)
+        conn.commit()
+        conn.close()
+
+    nome = f"Usuário {uuid4()}"
+    conn = connect.conectar()
+    cur = conn.cursor()
+    cur.execute("INSERT INTO usuarios (identificador, nome) VALUES (%s, %s);", (uuid4(), nome))
+    conn.commit()
+    conn.close()
+    monkeypatch.setattr(connect, "_ultima_escrita", float("-inf"))
+
+    import main
+    if main.backend_padrao.nome != "postgres":
+        pytest.skip("main.py já foi importado com outro backend")
+    try:
+        usuario = main.encontrar_usuario_por_nome(nome)
+        assert usuario is not None and usuario.nome == nome
+    finally:
+        conn = connect.conectar()
+        cur = conn.cursor()
+        cur.execute("DELETE FROM usuarios WHERE nome = %s;", (nome,))
+        conn.commit()
+        conn.close()
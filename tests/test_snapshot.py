@@ -0,0 +1,38 @@
+"""Deltas do snapshot do catálogo (snapshot.py), exclusivos do PostgreSQL."""
+import json
+import os
+
+import snapshot
+
+
+def _delta(caminho, seq=1):
+    with open(f"{caminho}.delta.{seq:06d}", encoding="utf-8") as f:
+        return [json.loads(linha) for linha in f]
+
+
+def test_transacao_confirmada_depois_do_snapshot_entra_no_delta(banco_pg, tmp_path):
+    import psycopg2
+    caminho = str(tmp_path / "catalogo.snap")
+
+    # Devolução que começou antes da exportação e esperou o operador
+    demorada = psycopg2.connect(os.environ["DB_DSN_ESCRITA"])
+    cur = demorada.cursor()
+    cur.execute("UPDATE obras SET quantidade_disponivel = 9 WHERE identificador = %s;", (banco_pg.obra,))
+    snapshot.gerar_snapshot(caminho)
+    demorada.commit()
+    demorada.close()
+
+    assert snapshot.gerar_delta(caminho) == 1
+    assert [alteracao["quantidade_disponivel"] for alteracao in _delta(caminho)] == [9]
+
+
+def test_delta_seguinte_so_traz_novas_alteracoes(banco_pg, tmp_path):
+    caminho = str(tmp_path / "catalogo.snap")
+    snapshot.gerar_snapshot(caminho)
+    banco_pg.executar("UPDATE obras SET quantidade_disponivel = 8 WHERE identificador = %s;", (banco_pg.obra,))
+    assert snapshot.gerar_delta(caminho) == 1
+
+    assert snapshot.gerar_delta(caminho) == 0
+    banco_pg.executar("DELETE FROM obras WHERE identificador = %s;", (banco_pg.obra,))
+    assert snapshot.gerar_delta(caminho) == 1
+    assert _delta(caminho, 3) == [{"identificador": str(banco_pg.obra), "removida": True}]
@@ -0,0 +1,63 @@
+"""Resolução de usuários por cartão ou nome (usuarios.py) no backend SQLite."""
+import pytest
+
+from usuarios import UsuarioAmbiguo, resolver_usuario, resolver_usuarios
+
+
+@pytest.fixture
+def cur(backend):
+    conn = backend.conectar()
+    yield conn.cursor()
+    conn.close()
+
+
+def _nomes(linhas):
+    return [nome for _, nome, _, _ in linhas]
+
+
+def test_nome_com_acentos_ignora_maiusculas_e_espacos(cur, cadastrar):
+    cadastrar.usuario("José")
+    cadastrar.usuario("Érica Lúcia")
+
+    resolvidos = resolver_usuarios(cur, ["JOSÉ", "  josé ", "érica LÚCIA", "Jose"])
+
+    assert _nomes(resolvidos["JOSÉ"]) == ["José"]
+    assert _nomes(resolvidos["  josé "]) == ["José"]
+    assert _nomes(resolvidos["érica LÚCIA"]) == ["Érica Lúcia"]
+    assert resolvidos["Jose"] == []
+
+
+def test_cartao_como_numero_ou_texto(cur, cadastrar):
+    cadastrar.usuario("Ana")
+    cadastrar.usuario("Bruno")
+
+    assert resolver_usuario(cur, 2)[1] == "Bruno"
+    assert resolver_usuario(cur, " 2 ")[1] == "Bruno"
+    assert resolver_usuario(cur, "3") is None
+
+
+def test_nome_so_com_digitos(cur, cadastrar):
+    cadastrar.usuario("Ana")
+    cadastrar.usuario("1984")
+
+    # Sem cartão 1984, o número é procurado como nome; o cartão 1 é da Ana
+    assert resolver_usuario(cur, "1984")[1] == "1984"
+    assert resolver_usuario(cur, "1")[1] == "Ana"
+
+
+def test_nome_compartilhado_pede_o_cartao(cur, cadastrar):
+    cadastrar.usuario("Ana")
+    cadastrar.usuario(" ANA ")
+
+    with pytest.raises(UsuarioAmbiguo) as erro:
+        resolver_usuario(cur, "ana")
+    assert erro.value.cartoes == [1, 2]
+
+
+def test_chave_que_nao_pode_ser_cartao_e_procurada_como_nome(cur, cadastrar):
+    cadastrar.usuario("Ana")
+    cadastrar.usuario("²")
+
+    assert resolver_usuario(cur, "²")[1] == "²"
+    assert resolver_usuario(cur, "9" * 30) is None
+    assert resolver_usuario(cur, 2 ** 63) is None
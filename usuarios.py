@@ -0,0 +1,180 @@
+import os
+import sys
+import tempfile
+import time
+from uuid import uuid4
+from armazenamento import BackendSQLite, lista_valores
+
+# Colunas devolvidas pela resolução de usuários
+COLUNAS = "identificador, nome, email, cartao"
+
+# Maior número de cartão que cabe na coluna BIGINT
+MAIOR_CARTAO = 2 ** 63 - 1
+
+
+def criar_estrutura(cur):
+    """
+    Cria o número de cartão dos usuários (único, gerado por uma sequência)
+    e o índice do nome normalizado, as duas chaves aceitas por
+    ``resolver_usuarios``. Usuários já cadastrados recebem um cartão na
+    primeira execução.
+
+    Args:
+        cur (cursor): Cursor de uma conexão aberta.
+    """
+    cur.execute("""
+        SELECT 1 FROM information_schema.columns
+        WHERE table_schema = current_schema()
+          AND table_name = 'usuarios' AND column_name = 'cartao';
+    """)
+    if cur.fetchone() is None:
+        cur.execute("""
+            ALTER TABLE usuarios ADD COLUMN cartao BIGINT;
+            CREATE SEQUENCE IF NOT EXISTS usuarios_cartao_seq OWNED BY usuarios.cartao;
+            UPDATE usuarios SET cartao = nextval('usuarios_cartao_seq');
+            ALTER TABLE usuarios
+                ALTER COLUMN cartao SET DEFAULT nextval('usuarios_cartao_seq'),
+                ALTER COLUMN cartao SET NOT NULL;
+        """)
+    cur.execute("""
+        CREATE UNIQUE INDEX IF NOT EXISTS idx_usuarios_cartao ON usuarios (cartao);
+        CREATE INDEX IF NOT EXISTS idx_usuarios_nome_normalizado ON usuarios (lower(trim(nome)));
+    """)
+
+
+class UsuarioAmbiguo(Exception):
+    """Nome compartilhado por mais de um usuário; é preciso usar o cartão."""
+
+    def __init__(self, nome, cartoes):
+        self.nome = nome
+        self.cartoes = cartoes
+        super().__init__(f"há {len(cartoes)} usuários chamados '{nome}' "
+                         f"(cartões {', '.join(map(str, cartoes))}); informe o cartão")
+
+
+def resolver_usuarios(cur, chaves):
+    """
+    Resolve vários usuários, por cartão ou nome, com uma única consulta que
+    usa os índices de ``idx_usuarios_cartao`` e
+    ``idx_usuarios_nome_normalizado``: o custo de cada chave não depende da
+    quantidade de usuários cadastrados.
+
+    Nomes são comparados sem diferenciar maiúsculas/minúsculas e sem os
+    espaços das pontas, com o lower() do banco nos dois lados (ver
+    armazenamento.lista_valores). Uma chave só de dígitos é procurada como
+    cartão e como nome: o cartão tem precedência, e o nome vale quando não
+    há cartão com esse número.
+
+    Args:
+        cur (cursor): Cursor de uma conexão aberta.
+        chaves (list[str | int]): Nomes ou números de cartão.
+
+    Returns:
+        dict: Para cada chave, a lista de linhas (identificador, nome,
+        email, cartao) encontradas: vazia se não existe usuário, com mais
+        de uma linha se o nome é compartilhado.
+    """
+    textos = {chave: str(chave).strip() for chave in chaves}
+    if not textos:
+        return {}
+    distintos = list(set(textos.values()))
+    cartoes = list({_cartao(texto) for texto in distintos} - {None})
+    cur.execute(f"""
+        SELECT NULL, {COLUNAS} FROM usuarios
+        WHERE cartao = ANY(%s)
+        UNION ALL
+        SELECT chaves.column1, u.identificador, u.nome, u.email, u.cartao
+        FROM {lista_valores(len(distintos))} AS chaves
+        JOIN usuarios u ON lower(trim(u.nome)) = lower(chaves.column1)
+        ORDER BY cartao;
+    """, (cartoes, *distintos))
+    por_cartao, por_nome = {}, {}
+    for texto, *linha in cur.fetchall():
+        linha = tuple(linha)
+        if texto is None:
+            por_cartao.setdefault(linha[3], []).append(linha)
+        else:
+            por_nome.setdefault(texto, []).append(linha)
+
+    return {chave: por_cartao.get(_cartao(texto)) or por_nome.get(texto, [])
+            for chave, texto in textos.items()}
+
+
+def _cartao(texto):
+    """Número de cartão digitado, ou None se o texto não pode ser um cartão."""
+    if texto.isdecimal() and int(texto) <= MAIOR_CARTAO:
+        return int(texto)
+    return None
+
+
+def resolver_usuario(cur, chave):
+    """
+    Resolve um usuário por cartão ou nome (ver ``resolver_usuarios``).
+
+    Args:
+        cur (cursor): Cursor de uma conexão aberta.
+        chave (str | int): Nome ou número do cartão.
+
+    Returns:
+        tuple | None: (identificador, nome, email, cartao), ou None se não
+        existir.
+
+    Raises:
+        UsuarioAmbiguo: Se o nome pertence a mais de um usuário.
+    """
+    linhas = resolver_usuarios(cur, [chave])[chave]
+    if len(linhas) > 1:
+        raise UsuarioAmbiguo(linhas[0][1], [linha[3] for linha in linhas])
+    return linhas[0] if linhas else None
+
+
+def medir(tamanhos=(10_000, 100_000, 1_000_000), amostras: int = 2000, lote: int = 100):
+    """
+    Mede o tempo de resolução por cartão, por nome e em lotes de ``lote``
+    chaves em bancos SQLite temporários com cada quantidade de usuários,
+    sem tocar no banco configurado. Com os índices, o tempo por consulta
+    praticamente não muda de uma quantidade para outra.
+
+    Returns:
+        list[tuple[int, float, float, float]]: (usuários, µs por cartão,
+        µs por nome, µs por chave em lote) de cada tamanho.
+    """
+    resultados = []
+    with tempfile.TemporaryDirectory() as pasta:
+        for quantidade in tamanhos:
+            backend = BackendSQLite(os.path.join(pasta, f"usuarios_{quantidade}.db"))
+            backend.criar_estrutura()
+            conn = backend.conectar()
+            cur = conn.cursor()
+            backend.inserir_lote(cur, "INSERT INTO usuarios (identificador, nome, email, cartao) VALUES %s;",
+                                 [(uuid4(), f"Usuário {n}", None, n) for n in range(1, quantidade + 1)])
+            conn.commit()
+
+            passo = max(1, quantidade // amostras)
+            cartoes = list(range(1, quantidade + 1, passo))[:amostras]
+            nomes = [f"usuário {n}" for n in cartoes]
+            tempos = []
+            for chaves in (cartoes, nomes):
+                inicio = time.perf_counter()
+                for chave in chaves:
+                    resolver_usuario(cur, chave)
+                tempos.append((time.perf_counter() - inicio) / len(chaves) * 1e6)
+            inicio = time.perf_counter()
+            for n in range(0, len(nomes), lote):
+                resolver_usuarios(cur, nomes[n:n + lote])
+            tempos.append((time.perf_counter() - inicio) / len(nomes) * 1e6)
+            resultados.append((quantidade, *tempos))
+            cur.close()
+            conn.close()
+    return resultados
+
+
+if __name__ == "__main__":
+    if len(sys.argv) > 1 and sys.argv[1] == "medir":
+        tamanhos = [int(n) for n in sys.argv[2:]] or (10_000, 100_000, 1_000_000)
+        print(f"{'usuários':>10} {'cartão':>10} {'nome':>10} {'lote':>10}  (µs por chave)")
+        for quantidade, cartao, nome, lote in medir(tamanhos):
+            print(f"{quantidade:>10} {cartao:>10.1f} {nome:>10.1f} {lote:>10.1f}")
+    else:
+        print("Uso: python usuarios.py medir [QUANTIDADE ...]")
+        sys.exit(1)
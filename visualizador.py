@@ -0,0 +1,192 @@
+from itertools import islice
+from rich.console import Console
+from rich.table import Table
+
+
+class VisualizadorPaginado:
+    """
+    Exibe um resultado grande página por página no terminal.
+
+    As linhas são buscadas sob demanda (com ``fetchmany`` quando a fonte é
+    um cursor, ou consumindo um iterador) e só a página visível vira uma
+    Table do rich, então o tempo de desenho não depende do tamanho do
+    resultado. As linhas já lidas ficam em memória para permitir voltar
+    páginas e escolher linhas pelo índice.
+
+    Comandos:
+        Enter ou n  próxima página
+        p           página anterior
+        g N         ir para a página N
+        /texto      buscar a próxima linha que contém o texto (a partir da
+                    linha atual, voltando ao início ao chegar no fim)
+        q           sair
+        N           (no modo de escolha) escolher a linha de índice N
+    """
+
+    def __init__(self, titulo, colunas, linhas, formatar=None,
+                 tamanho_pagina: int = 20, console: Console = None):
+        """
+        Args:
+            titulo (str): Título da tabela.
+            colunas (list[tuple[str, dict]]): Nome e opções (justify, style...) de cada coluna.
+            linhas (cursor | iterable): Fonte das linhas.
+            formatar (callable): Converte uma linha na tupla de textos exibida.
+                Padrão: str() de cada campo.
+            tamanho_pagina (int): Linhas por página.
+            console (Console): Console do rich usado para imprimir.
+        """
+        self.titulo = titulo
+        self.colunas = colunas
+        self.formatar = formatar or (lambda linha: tuple(str(campo) for campo in linha))
+        self.tamanho_pagina = tamanho_pagina
+        self.console = console or Console()
+        self._fonte = linhas if hasattr(linhas, "fetchmany") else iter(linhas)
+        self._lidas = []
+        self._esgotado = False
+        self.pagina = 0
+        # Linha encontrada pela última busca, destacada na página
+        self.atual = None
+
+    def _buscar_ate(self, indice):
+        """Lê da fonte até que a linha ``indice`` esteja disponível ou a fonte acabe."""
+        while not self._esgotado and len(self._lidas) <= indice:
+            if hasattr(self._fonte, "fetchmany"):
+                bloco = self._fonte.fetchmany(self.tamanho_pagina)
+            else:
+                bloco = list(islice(self._fonte, self.tamanho_pagina))
+            if not bloco:
+                self._esgotado = True
+            self._lidas.extend(bloco)
+
+    def linha(self, indice):
+        """
+        Retorna a linha na posição informada, buscando-a se necessário.
+
+        Args:
+            indice (int): Posição da linha no resultado (a partir de 0).
+
+        Returns:
+            tuple | None: A linha, ou None se o resultado for menor.
+        """
+        if indice < 0:
+            return None
+        self._buscar_ate(indice)
+        return self._lidas[indice] if indice < len(self._lidas) else None
+
+    def vazio(self) -> bool:
+        """Indica se o resultado não tem nenhuma linha."""
+        return self.linha(0) is None
+
+    def renderizar(self, mostrar_indice: bool = False) -> Table:
+        """
+        Monta a Table apenas com as linhas da página atual.
+
+        Args:
+            mostrar_indice (bool): Acrescenta a coluna com o índice de cada linha.
+
+        Returns:
+            Table: Tabela da página atual.
+        """
+        inicio = self.pagina * self.tamanho_pagina
+        self._buscar_ate(inicio + self.tamanho_pagina)
+        fim = min(inicio + self.tamanho_pagina, len(self._lidas))
+
+        total = f" de {(len(self._lidas) - 1) // self.tamanho_pagina + 1}" if self._esgotado else ""
+        tabela = Table(title=self.titulo, caption=f"Página {self.pagina + 1}{total}")
+        if mostrar_indice:
+            tabela.add_column("Índice", justify="center", style="cyan")
+        for nome, opcoes in self.colunas:
+            tabela.add_column(nome, **opcoes)
+        for i in range(inicio, fim):
+            valores = self.formatar(self._lidas[i])
+            tabela.add_row(*((str(i),) + tuple(valores) if mostrar_indice else valores),
+                           style="reverse" if i == self.atual else None)
+        return tabela
+
+    def ir_para(self, pagina):
+        """
+        Muda para a página informada (a partir de 0), se ela existir.
+
+        Returns:
+            bool: True se a página existe.
+        """
+        if pagina < 0 or self.linha(pagina * self.tamanho_pagina) is None:
+            return False
+        self.pagina = pagina
+        return True
+
+    def buscar(self, texto):
+        """
+        Procura a próxima linha cujo texto exibido (ver ``formatar``) contém
+        o texto, sem diferenciar maiúsculas/minúsculas. A busca começa logo
+        depois da última linha encontrada, se ela estiver na página atual,
+        ou no início da página atual; ao chegar no fim do resultado,
+        continua do começo. A linha encontrada passa a ser a atual e a
+        página muda para a dela.
+
+        Returns:
+            bool: True se encontrou.
+        """
+        texto = texto.lower()
+        inicio = self.pagina * self.tamanho_pagina
+        if self.atual is not None and self.atual // self.tamanho_pagina == self.pagina:
+            inicio = self.atual + 1
+
+        def contem(i):
+            return any(texto in str(campo).lower() for campo in self.formatar(self._lidas[i]))
+
+        i = inicio
+        while self.linha(i) is not None:
+            if contem(i):
+                break
+            i += 1
+        else:
+            # Chegou ao fim (todas as linhas já foram lidas): volta ao começo
+            i = next((j for j in range(min(inicio, len(self._lidas))) if contem(j)), None)
+            if i is None:
+                return False
+        self.atual = i
+        self.pagina = i // self.tamanho_pagina
+        return True
+
+    def navegar(self, escolher: bool = False):
+        """
+        Laço interativo de navegação.
+
+        Args:
+            escolher (bool): Se True, mostra os índices e permite escolher uma linha.
+
+        Returns:
+            int | None: Índice escolhido (no modo de escolha) ou None ao sair.
+        """
+        ajuda = "[Enter/n] próxima  [p] anterior  [g N] ir para página  [/texto] buscar  [q] sair"
+        if escolher:
+            ajuda += "  [N] escolher índice"
+        while True:
+            self.console.print(self.renderizar(mostrar_indice=escolher))
+            comando = input(f"{ajuda}\n> ").strip()
+
+            if comando in ("", "n"):
+                if not self.ir_para(self.pagina + 1):
+                    if not escolher:
+                        return None
+                    print("Não há mais páginas.")
+            elif comando == "p":
+                self.ir_para(self.pagina - 1)
+            elif comando == "q":
+                return None
+            elif comando.startswith("g "):
+                try:
+                    if not self.ir_para(int(comando[2:]) - 1):
+                        print("Página inexistente.")
+                except ValueError:
+                    print("Digite o número da página.")
+            elif comando.startswith("/"):
+                if not self.buscar(comando[1:]):
+                    print("Nada encontrado.")
+            elif escolher and comando.isdigit():
+                if self.linha(int(comando)) is not None:
+                    return int(comando)
+                print("Índice inválido.")
+            else:
+                print("Comando inválido.")